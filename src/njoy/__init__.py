@@ -1 +1,21 @@
-from .core.core import Core
+from __future__ import annotations  # PEP 563: Postponed evaluation of annotations
+
+import os
+import typing
+
+if typing.TYPE_CHECKING:
+    from .core.core import Core
+
+# Set NJOY_PROFILE_STARTUP to get a report of the startup time on exit (see startup_profile)
+if os.environ.get('NJOY_PROFILE_STARTUP'):
+    from . import startup_profile
+    startup_profile.enable()
+
+
+def __getattr__(name: str):
+    # Core is only imported when used (PEP 562) : importing any njoy module (e.g. njoy.hid_devices.state_publication
+    # from another process) would otherwise import Qt, SDL and the game models too
+    if name == 'Core':
+        from .core.core import Core  # pylint: disable=import-outside-toplevel
+        return Core
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,120 @@
+from __future__ import annotations  # PEP 563: Postponed evaluation of annotations
+
+import argparse
+import lxml.etree
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from lxml import objectify
+from njoy.game_models.elite_dangerous.elite_bindings import EliteBindings
+from pathlib import Path
+
+# Cost of the .binds generation on a large synthetic bindings file (many presets merged, most controls bound),
+# with plain lxml.etree (EliteBindings.generate_bindings()) versus the lxml.objectify based implementation it replaced :
+#   python -m njoy.benchmarks.binds_parsing --controls 20000
+# Both have to produce the same bytes. The memory is the peak of the Python heap (tracemalloc) : the libxml2 tree
+# itself is the same for both, the difference is in the Python proxies built around its elements.
+
+__DEVICES__ = ('vJoy', 'Keyboard', '{NoDevice}', '231D0200', '068EC010')
+
+
+def synthetic_bindings(nb_controls: int, seed: int = 0) -> bytes:
+    """A bindings file shaped like Elite's : buttons (Primary, Secondary, ToggleOn) and axes (Binding, Inverted...)"""
+    rng = random.Random(seed)
+
+    def binding(tag: str) -> str:
+        device = rng.choice(__DEVICES__)
+        if device == '{NoDevice}':
+            return f'\t\t<{tag} Device="{{NoDevice}}" Key="" />'
+        if device == 'vJoy':
+            return f'\t\t<{tag} Device="vJoy" DeviceIndex="{rng.randrange(7)}" Key="Joy_{rng.randrange(1, 33)}" />'
+        return f'\t\t<{tag} Device="{device}" Key="Key_{rng.randrange(100)}" />'
+
+    lines = ['<?xml version="1.0" encoding="UTF-8" ?>',
+             '<Root PresetName="njoy" MajorVersion="4" MinorVersion="0">',
+             '\t<KeyboardLayout>en-US</KeyboardLayout>']
+    for control_id in range(nb_controls):
+        if control_id % 4:
+            lines += [f'\t<Button{control_id}>', binding('Primary'), binding('Secondary'),
+                      '\t\t<ToggleOn Value="0" />', f'\t</Button{control_id}>']
+        else:
+            lines += [f'\t<Axis{control_id}Raw>', binding('Binding'),
+                      '\t\t<Inverted Value="0" />', '\t\t<Deadzone Value="0.00000000" />', f'\t</Axis{control_id}Raw>']
+    lines.append('</Root>')
+    return '\n'.join(lines).encode()
+
+
+def generate_with_objectify(bindings_file: Path):
+    """The previous implementation of generate_bindings(), without any control allocated"""
+    existing_content = bindings_file.read_bytes()
+    root = objectify.fromstring(existing_content)
+    for control in root.iterchildren():
+        for param in control.iterchildren():
+            if param.tag in {'Primary', 'Secondary', 'Binding'} and param.get('Device') == 'vJoy':
+                for attribute in ('Device', 'DeviceIndex', 'Key', 'key'):
+                    param.attrib.pop(attribute, None)
+                param.set('Device', '{NoDevice}')
+                param.set('Key', '')
+    controls_by_name: dict[str, list[objectify.ObjectifiedElement]] = dict()
+    for elt in root.iterchildren():
+        controls_by_name.setdefault(elt.tag, list()).append(elt)
+    content = lxml.etree.tostring(root.getroottree(),
+                                  encoding='UTF-8',
+                                  xml_declaration=True,
+                                  pretty_print=True)
+    if content != existing_content:
+        temp_file = bindings_file.with_suffix('.tmp')
+        temp_file.write_bytes(content)
+        temp_file.replace(bindings_file)
+
+
+def _measure(function, bindings_file: Path, content: bytes, repeat: int) -> tuple[float, float, bytes]:
+    """Best time in ms, peak Python memory in MB, and the output of the last run"""
+    durations = list()
+    for _ in range(repeat):
+        bindings_file.write_bytes(content)
+        start = time.perf_counter_ns()
+        function(bindings_file)
+        durations.append(time.perf_counter_ns() - start)
+    bindings_file.write_bytes(content)
+    tracemalloc.start()
+    function(bindings_file)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return min(durations) / 1e6, peak / 1e6, bindings_file.read_bytes()
+
+
+def run(nb_controls: int, repeat: int = 5) -> dict[str, float | int | bool]:
+    content = synthetic_bindings(nb_controls)
+    elite_bindings = EliteBindings(elite_model=None, hid_event_loop=None)
+    with tempfile.TemporaryDirectory() as directory:
+        bindings_file = Path(directory) / 'synthetic.binds'
+        etree_ms, etree_mb, etree_output = _measure(elite_bindings.generate_bindings, bindings_file, content, repeat)
+        objectify_ms, objectify_mb, objectify_output = _measure(generate_with_objectify, bindings_file, content, repeat)
+    return {'controls': nb_controls,
+            'file bytes': len(content),
+            'objectify (ms)': objectify_ms,
+            'etree (ms)': etree_ms,
+            'speedup': objectify_ms / etree_ms,
+            'objectify peak python (MB)': objectify_mb,
+            'etree peak python (MB)': etree_mb,
+            'same output': etree_output == objectify_output}
+
+
+def main(argv: list[str] = None) -> int:
+    parser = argparse.ArgumentParser(description="Time the .binds generation on a large synthetic bindings file")
+    parser.add_argument('--controls', type=int, default=20000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args(argv)
+
+    results = run(args.controls, args.repeat)
+    for key, value in results.items():
+        print(f'{key:>32}: {value:.3f}' if isinstance(value, float) else f'{key:>32}: {value}')
+    return 0 if results['same output'] else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
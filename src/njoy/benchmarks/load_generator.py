@@ -0,0 +1,219 @@
+from __future__ import annotations  # PEP 563: Postponed evaluation of annotations
+
+import argparse
+import array
+import ctypes
+import sdl2
+import sys
+import threading
+import time
+import typing
+
+from njoy.core.latency import LatencyHistogram
+from njoy.hid_devices.hid_event_loop import HIDEventLoop
+from njoy.hid_devices.sdl_interface import SDLError, _SDL
+from PySide6.QtCore import QCoreApplication, QObject, QTimer, Slot
+
+if typing.TYPE_CHECKING:
+    from njoy.hid_devices.hid_controls import InputAxis, InputButton
+
+# End-to-end load generator :
+# N SDL virtual joysticks with M axes and buttons each are driven at a fixed rate from a background thread,
+# through the real HIDEventLoop / HIDDevice / InputAxis / InputButton objects, into an in-memory sink.
+#
+#   python -m njoy.benchmarks.load_generator --devices 8 --axes 8 --buttons 8 --rate 1000 --duration 10
+#
+# Each axis value carries a sequence number, so that the sink can match it with the time it was sent at.
+__SEQUENCE_BITS__ = 12
+__SEQUENCE_MASK__ = (1 << __SEQUENCE_BITS__) - 1
+__SEQUENCE_STEP__ = 0x10000 >> __SEQUENCE_BITS__
+
+
+def sequence_to_raw(sequence: int) -> int:
+    return (sequence & __SEQUENCE_MASK__) * __SEQUENCE_STEP__ - 0x8000
+
+
+def value_to_sequence(value: float) -> int:
+    raw = round((value + 1) * 0xFFFF / 2) - 0x8000
+    return round((raw + 0x8000) / __SEQUENCE_STEP__) & __SEQUENCE_MASK__
+
+
+class VirtualStick:
+    def __init__(self, name: str, *, nb_axes: int, nb_buttons: int):
+        self.name = name
+        self.nb_axes = nb_axes
+        self.nb_buttons = nb_buttons
+        # Send time of each sequence number still in flight, per axis
+        self.sent_ns = [array.array('q', bytes(8 << __SEQUENCE_BITS__)) for _ in range(nb_axes)]
+
+        _SDL.init()
+        desc = sdl2.SDL_VirtualJoystickDesc()
+        desc.version = sdl2.SDL_VIRTUAL_JOYSTICK_DESC_VERSION
+        desc.type = sdl2.SDL_JOYSTICK_TYPE_GAMECONTROLLER
+        desc.naxes = nb_axes
+        desc.nbuttons = nb_buttons
+        desc.name = name.encode()
+        self.device_index = sdl2.SDL_JoystickAttachVirtualEx(ctypes.byref(desc))
+        if self.device_index < 0:
+            raise SDLError(sdl2.SDL_GetError())
+        self._sdl = sdl2.SDL_JoystickOpen(self.device_index)
+        if not self._sdl:
+            raise SDLError(sdl2.SDL_GetError())
+
+    def set_axis(self, axis_id: int, sequence: int):
+        self.sent_ns[axis_id][sequence & __SEQUENCE_MASK__] = time.perf_counter_ns()
+        sdl2.SDL_JoystickSetVirtualAxis(self._sdl, axis_id, sequence_to_raw(sequence))
+
+    def set_button(self, button_id: int, state: bool):
+        sdl2.SDL_JoystickSetVirtualButton(self._sdl, button_id, int(state))
+
+
+class AxisSink(QObject):
+    """Stand-in for an output axis : counts and timestamps what it receives, writes nothing"""
+
+    def __init__(self, *, stick: VirtualStick, axis_id: int, latencies: LatencyHistogram, parent: QObject = None):
+        super().__init__(parent)
+        self._sent_ns = stick.sent_ns[axis_id]
+        self._latencies = latencies
+        self.nb_received = 0
+
+    @Slot(float)
+    def move(self, value: float):
+        self.nb_received += 1
+        # Skip the initial events SDL sends when opening the devices, before we sent anything
+        if sent_ns := self._sent_ns[value_to_sequence(value)]:
+            self._latencies.record(time.perf_counter_ns() - sent_ns)
+
+
+class ButtonSink(QObject):
+    def __init__(self, parent: QObject = None):
+        super().__init__(parent)
+        self.nb_received = 0
+
+    @Slot(bool)
+    def switch(self, _: bool):
+        self.nb_received += 1
+
+
+class LoadGenerator(QObject):
+    def __init__(self,
+                 *,
+                 nb_devices: int,
+                 nb_axes: int,
+                 nb_buttons: int,
+                 rate: float,
+                 batch_size: int = None,
+                 poll_rate: float = None,
+                 parent: QObject = None):
+        super().__init__(parent)
+        self.rate = rate
+        self.latencies = LatencyHistogram()
+        self.nb_axis_writes = 0
+        self.nb_button_writes = 0
+        self.late_ticks = 0
+        self._running = False
+        self._driver_thread: threading.Thread | None = None
+
+        self.sticks = [VirtualStick(f'njoy-load-generator-{i}', nb_axes=nb_axes, nb_buttons=nb_buttons)
+                       for i in range(nb_devices)]
+        self.hid_event_loop = HIDEventLoop(batch_size=batch_size, poll_rate=poll_rate)
+        self.axis_sinks: list[AxisSink] = list()
+        self.button_sinks: list[ButtonSink] = list()
+        for stick in self.sticks:
+            for axis_id in range(nb_axes):
+                axis: InputAxis = self.hid_event_loop.physical_axis(stick.name, axis_id)
+                sink = AxisSink(stick=stick, axis_id=axis_id, latencies=self.latencies, parent=self)
+                axis.moved_signal.connect(sink.move)
+                self.axis_sinks.append(sink)
+            for button_id in range(nb_buttons):
+                button: InputButton = self.hid_event_loop.physical_button(stick.name, button_id)
+                sink = ButtonSink(parent=self)
+                button.switched_signal.connect(sink.switch)
+                self.button_sinks.append(sink)
+
+    def start(self):
+        self._running = True
+        self._driver_thread = threading.Thread(target=self._drive, name='njoy-load-generator', daemon=True)
+        self._driver_thread.start()
+
+    def stop(self):
+        self._running = False
+        if self._driver_thread is not None:
+            self._driver_thread.join()
+
+    def _drive(self):
+        period_ns = round(1e9 / self.rate)
+        next_tick_ns = time.perf_counter_ns()
+        sequence = 0
+        while self._running:
+            sequence += 1
+            for stick in self.sticks:
+                for axis_id in range(stick.nb_axes):
+                    stick.set_axis(axis_id, sequence)
+                # Buttons toggle ten times slower than the axis move
+                if sequence % 10 == 0:
+                    for button_id in range(stick.nb_buttons):
+                        stick.set_button(button_id, sequence % 20 == 0)
+                    self.nb_button_writes += stick.nb_buttons
+                self.nb_axis_writes += stick.nb_axes
+
+            next_tick_ns += period_ns
+            if (remaining_ns := next_tick_ns - time.perf_counter_ns()) > 0:
+                time.sleep(remaining_ns / 1e9)
+            else:
+                self.late_ticks += 1
+
+    def report(self, duration: float) -> dict[str, float]:
+        nb_axis_received = sum(sink.nb_received for sink in self.axis_sinks)
+        nb_button_received = sum(sink.nb_received for sink in self.button_sinks)
+        return {'duration_s': duration,
+                'axis_writes_per_s': self.nb_axis_writes / duration,
+                'button_writes_per_s': self.nb_button_writes / duration,
+                'sdl_events_per_s': self.hid_event_loop.events_received / duration,
+                'dispatched_events_per_s': self.hid_event_loop.events_dispatched / duration,
+                'delivered_events_per_s': (nb_axis_received + nb_button_received) / duration,
+                'writes_coalesced_by_sdl': max(0, self.nb_axis_writes + self.nb_button_writes
+                                               - self.hid_event_loop.events_received),
+                'events_coalesced_by_event_loop': self.hid_event_loop.events_coalesced,
+                'button_edges_lost': self.nb_button_writes - nb_button_received,
+                'late_generator_ticks': self.late_ticks,
+                'poll_ticks_per_s': self.hid_event_loop.poll_ticks / duration,
+                'late_poll_ticks': self.hid_event_loop.poll_ticks_late,
+                **{f'latency_{k}': v for k, v in self.latencies.summary().items()}}
+
+
+def main(argv: list[str] = None) -> int:
+    parser = argparse.ArgumentParser(description="Drive SDL virtual joysticks through the n-joy event loop")
+    parser.add_argument('--devices', type=int, default=8)
+    parser.add_argument('--axes', type=int, default=8)
+    parser.add_argument('--buttons', type=int, default=8)
+    parser.add_argument('--rate', type=float, default=1000, help="updates per second, per axis")
+    parser.add_argument('--duration', type=float, default=10, help="seconds")
+    parser.add_argument('--batch-size', type=int, default=None, help="enables the batched event loop mode")
+    parser.add_argument('--poll-rate', type=float, default=None, help="enables the polling mode, in ticks per second")
+    args = parser.parse_args(argv)
+
+    app = QCoreApplication(sys.argv[:1])
+    generator = LoadGenerator(nb_devices=args.devices,
+                              nb_axes=args.axes,
+                              nb_buttons=args.buttons,
+                              rate=args.rate,
+                              batch_size=args.batch_size,
+                              poll_rate=args.poll_rate)
+    start = time.perf_counter()
+    generator.start()
+    QTimer.singleShot(round(args.duration * 1000), app.quit)
+    app.exec()
+    generator.stop()
+    duration = time.perf_counter() - start
+
+    # Let the pending events be delivered before reporting
+    app.processEvents()
+    generator.hid_event_loop.stop()
+    for key, value in generator.report(duration).items():
+        print(f'{key:>32}: {value:.3f}' if isinstance(value, float) else f'{key:>32}: {value}')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
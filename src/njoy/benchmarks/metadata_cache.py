@@ -0,0 +1,61 @@
+from __future__ import annotations  # PEP 563: Postponed evaluation of annotations
+
+import argparse
+import shutil
+import sys
+import tempfile
+import time
+
+from njoy.game_models.elite_dangerous import elite_bindings
+from njoy.game_models.elite_dangerous.elite_bindings import EliteBindings
+from pathlib import Path
+
+# Startup cost of the Elite Dangerous control metadata, with and without the cache (see EliteBindings.read_metadata()) :
+#   python -m njoy.benchmarks.metadata_cache
+# The metadata file is copied to a temporary directory, so that the cache next to the real one is left untouched.
+
+__DEFAULT_METADATA_FILE__ = Path(elite_bindings.__file__).with_suffix('.json')
+
+
+def _time_ms(function, repeat: int) -> float:
+    """Best of 'repeat' calls, in ms"""
+    durations = list()
+    for _ in range(repeat):
+        start = time.perf_counter_ns()
+        function()
+        durations.append(time.perf_counter_ns() - start)
+    return min(durations) / 1e6
+
+
+def run(metadata_file: Path, repeat: int = 20) -> dict[str, float]:
+    with tempfile.TemporaryDirectory() as directory:
+        metadata_copy = Path(directory) / metadata_file.name
+        shutil.copyfile(metadata_file, metadata_copy)
+        cache_file = metadata_copy.with_suffix('.pickle')
+
+        def cache_miss():
+            cache_file.unlink(missing_ok=True)
+            EliteBindings.read_metadata(metadata_copy, cache_file)
+
+        results = {'metadata bytes': metadata_file.stat().st_size,
+                   'no cache (ms)': _time_ms(lambda: EliteBindings.read_metadata(metadata_copy), repeat),
+                   'cache miss, parse + write (ms)': _time_ms(cache_miss, repeat),
+                   'cache hit (ms)': _time_ms(lambda: EliteBindings.read_metadata(metadata_copy, cache_file), repeat),
+                   'cache bytes': cache_file.stat().st_size}
+    results['speedup'] = results['no cache (ms)'] / results['cache hit (ms)']
+    return results
+
+
+def main(argv: list[str] = None) -> int:
+    parser = argparse.ArgumentParser(description="Time the loading of the control metadata, with and without cache")
+    parser.add_argument('--metadata-file', type=Path, default=__DEFAULT_METADATA_FILE__)
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args(argv)
+
+    for key, value in run(args.metadata_file, args.repeat).items():
+        print(f'{key:>32}: {value:.3f}' if isinstance(value, float) else f'{key:>32}: {value}')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -2,22 +2,77 @@ from __future__ import annotations  # PEP 563: Postponed evaluation of annotatio
 
 import typing
 
+from njoy.core import latency
+from njoy.core.mapping import MappingPlan
 from njoy.hid_devices.hid_event_loop import HIDEventLoop
-from njoy.game_models.elite_dangerous.elite_model import EliteModel
+from njoy.hid_devices.remote_devices import DEFAULT_PORT, RemoteReceiver
+from njoy.startup_profile import profiled
 from PySide6.QtCore import QCoreApplication
 
 if typing.TYPE_CHECKING:
+    from pathlib import Path
+    from PySide6.QtCore import QObject
+    from njoy.game_models.elite_dangerous.elite_model import EliteModel
     from njoy.hid_devices.hid_controls import InputAxis, OutputAxis
     from njoy.hid_devices.hid_controls import InputButton, OutputButton
+    from njoy.hid_devices.output_backends import OutputBackend
     from njoy.hid_devices.vjoy_interface import vJoyId
 
 
 class Core(QCoreApplication):
-    def __init__(self, game_binding_options: dict = None):
+    @profiled
+    def __init__(self,
+                 game_binding_options: dict = None,
+                 *,
+                 event_batch_size: int = None,
+                 poll_rate: float = None,
+                 batched_output: bool = False,
+                 output_flush_interval: float = None,
+                 output_backend: type[OutputBackend] = None,
+                 publish_states: bool = False,
+                 remote_devices: list[str] = None,
+                 remote_port: int = DEFAULT_PORT,
+                 latency_instrumentation: bool = False,
+                 device_cache_file: Path = None):
+        """'latency_instrumentation' records the input-to-output latencies (see njoy.core.latency),
+        and prints a report on exit. When disabled (the default), it costs nothing.
+        'poll_rate' reads the devices at a fixed rate (e.g. 500 ticks per second) instead of reacting to every event,
+        which keeps the load constant with many noisy devices (see HIDEventLoop). Requires numpy.
+        'batched_output' sends all the writes to a vJoy device in a single driver call per flush, at the end of each
+        batch of events, or every 'output_flush_interval' seconds if given (see VirtualDevice.set_batched_output()).
+        'output_backend' replaces vJoy, e.g. with a headless stand-in to run without any driver (see output_backends).
+        'publish_states' publishes the output state of the virtual devices in shared memory, for overlays or other
+        scripts to read without going through SDL (see state_publication.StateReader).
+        'remote_devices' are the names of the devices streamed from other machines to 'remote_port' (UDP), they are
+        then looked up like local devices (see remote_devices).
+        'device_cache_file' persists the list of the joysticks present between runs, to speed up the startup.
+        The game model (journal monitoring, bindings metadata) is only built when first used, see game_model."""
         super().__init__()
-        self.hid_event_loop = HIDEventLoop()
-        self.game_model = EliteModel(core=self,
-                                     game_binding_options=game_binding_options)
+        if latency_instrumentation:
+            latency.enable()
+            self.aboutToQuit.connect(self._dump_latency_report)
+        self.hid_event_loop = HIDEventLoop(batch_size=event_batch_size,
+                                           poll_rate=poll_rate,
+                                           batched_output=batched_output,
+                                           output_flush_interval=output_flush_interval,
+                                           output_backend=output_backend,
+                                           publish_states=publish_states,
+                                           device_cache_file=device_cache_file)
+        self.remote_receiver: RemoteReceiver | None = None
+        if remote_devices:
+            self.remote_receiver = RemoteReceiver(self.hid_event_loop, remote_devices, port=remote_port)
+        self._game_binding_options = game_binding_options
+        self._game_model: EliteModel | None = None
+        self.mappings = MappingPlan(core=self)
+
+    @property
+    def game_model(self) -> EliteModel:
+        """Built on first use : a script without any game binding never pays for it"""
+        if self._game_model is None:
+            # Imported on first use as well : the game models import lxml and their own controls
+            from njoy.game_models.elite_dangerous import elite_model  # pylint: disable=import-outside-toplevel
+            self._game_model = elite_model.EliteModel(core=self, game_binding_options=self._game_binding_options)
+        return self._game_model
 
     def physical_axis(self, ident: str, axis: int) -> InputAxis:
         return self.hid_event_loop.physical_axis(ident, axis)
@@ -27,8 +82,13 @@ class Core(QCoreApplication):
         Physical buttons are read-only, they have no 'set_state' slot, they only emit signals."""
         return self.hid_event_loop.physical_button(ident, button)
 
-    def virtual_axis(self, ident: vJoyId, axis: int, *, enable_output: bool = False) -> InputAxis | OutputAxis:
-        return self.hid_event_loop.virtual_axis(ident, axis, enable_output=enable_output)
+    def virtual_axis(self,
+                     ident: vJoyId,
+                     axis: int,
+                     *,
+                     enable_output: bool = False,
+                     max_rate: float = None) -> InputAxis | OutputAxis:
+        return self.hid_event_loop.virtual_axis(ident, axis, enable_output=enable_output, max_rate=max_rate)
 
     def virtual_button(self, ident: vJoyId, button: int, *, enable_output: bool = False) -> InputButton | OutputButton:
         """Find and return a VirtualButton instance for button 'BUTTON' of virtual device number 'IDENT'.
@@ -38,6 +98,48 @@ class Core(QCoreApplication):
         """
         return self.hid_event_loop.virtual_button(ident, button, enable_output=enable_output)
 
+    def map_axis(self,
+                 device: str | vJoyId,
+                 axis: int,
+                 target: str | OutputAxis,
+                 *,
+                 slot: str = 'move',
+                 inline: bool = False):
+        """Declares a mapping from an axis to a game binding path or an output control, wired at start()
+        (see njoy.core.mapping). 'inline' runs it in the SDL thread, see InputAxis.connect_inline()."""
+        self.mappings.add_axis(device, axis, target, slot=slot, inline=inline)
+
+    def map_button(self,
+                   device: str | vJoyId,
+                   button: int,
+                   target: str | QObject,
+                   *,
+                   on: str = 'switched',
+                   slot: str = None):
+        """Declares a mapping from a button signal ('pressed', 'released' or 'switched') to a game binding path
+        or an output control, wired at start() (see njoy.core.mapping)."""
+        self.mappings.add_button(device, button, target, on=on, slot=slot)
+
+    def load_mappings(self, mappings: dict | Path):
+        """Declares the mappings of a dict or a TOML file, wired at start() (see njoy.core.mapping)."""
+        if isinstance(mappings, dict):
+            self.mappings.load(mappings)
+        else:
+            self.mappings.load_toml(mappings)
+
+    @staticmethod
+    def latency_report() -> dict[str, dict[str, dict[str, float]]]:
+        """p50 / p99 / max latencies of each stage, per control. Empty if the instrumentation is disabled."""
+        return latency.recorder.report() if latency.recorder is not None else dict()
+
+    @staticmethod
+    def _dump_latency_report():
+        if latency.recorder is not None:
+            print(latency.recorder.format_report())
+
     def start(self):
+        # The mappings may create game bindings, compile them before generating the bindings file
+        self.mappings.compile()
         self.game_model.generate_bindings()
+        print(self.game_model.bindings.format_generation_report())
         self.exec()
@@ -0,0 +1,149 @@
+from __future__ import annotations  # PEP 563: Postponed evaluation of annotations
+
+import array
+import collections
+import sdl2
+import threading
+import time
+import typing
+
+if typing.TYPE_CHECKING:
+    from PySide6.QtCore import QObject
+
+# Input-to-output latency instrumentation.
+# Disabled by default : 'recorder' stays None, and the only cost left in the hot paths is checking it.
+# Once enabled, each stage of the path between an SDL event and the matching output write is recorded
+# in a per-control histogram :
+# - sdl_to_dispatch : from the SDL event timestamp to its dispatch by the HIDEventLoop (ms resolution)
+# - dispatch_to_slot : from that dispatch to the output control slot being run
+# - slot_to_output : from the output control slot being run to the output driver call returning
+# - input_to_output : end to end, from the SDL event timestamp to the output driver call returning
+
+SDL_TO_DISPATCH = 'sdl_to_dispatch'
+DISPATCH_TO_SLOT = 'dispatch_to_slot'
+SLOT_TO_OUTPUT = 'slot_to_output'
+INPUT_TO_OUTPUT = 'input_to_output'
+
+# Origin (estimated SDL event time) and dispatch time of an event, both in perf_counter_ns() time
+Marks: typing.TypeAlias = tuple[int, int]
+
+recorder: LatencyRecorder | None = None
+
+
+def enable() -> LatencyRecorder:
+    global recorder  # pylint: disable=global-statement
+    if recorder is None:
+        recorder = LatencyRecorder()
+    return recorder
+
+
+def disable():
+    global recorder  # pylint: disable=global-statement
+    recorder = None
+
+
+class LatencyHistogram:
+    """Log-linear histogram of durations in nanoseconds : each power of two is split in 16 buckets,
+    which bounds the relative error of the percentiles to about 6%, in a fixed amount of memory."""
+    __SUB_BUCKET_BITS__ = 4
+    __NB_BUCKETS__ = 16 * 48
+
+    def __init__(self):
+        self._counts = array.array('Q', bytes(8 * self.__NB_BUCKETS__))
+        self.count = 0
+        self.max_ns = 0
+
+    @classmethod
+    def _bucket(cls, duration_ns: int) -> int:
+        nb_sub_buckets = 1 << cls.__SUB_BUCKET_BITS__
+        if duration_ns < nb_sub_buckets:
+            return max(0, duration_ns)
+        exponent = duration_ns.bit_length() - cls.__SUB_BUCKET_BITS__ - 1
+        bucket = (exponent + 1) * nb_sub_buckets + (duration_ns >> exponent) - nb_sub_buckets
+        return min(bucket, cls.__NB_BUCKETS__ - 1)
+
+    @classmethod
+    def _bucket_upper_bound(cls, bucket: int) -> int:
+        nb_sub_buckets = 1 << cls.__SUB_BUCKET_BITS__
+        if bucket < nb_sub_buckets:
+            return bucket
+        exponent = bucket // nb_sub_buckets - 1
+        return ((bucket % nb_sub_buckets + nb_sub_buckets + 1) << exponent) - 1
+
+    def record(self, duration_ns: int):
+        self._counts[self._bucket(duration_ns)] += 1
+        self.count += 1
+        if duration_ns > self.max_ns:
+            self.max_ns = duration_ns
+
+    def percentile(self, percent: float) -> int:
+        """Upper bound of the given percentile, in nanoseconds"""
+        if not self.count:
+            return 0
+        rank = max(1, round(percent * self.count / 100))
+        cumulated = 0
+        for bucket, count in enumerate(self._counts):
+            cumulated += count
+            if cumulated >= rank:
+                return min(self._bucket_upper_bound(bucket), self.max_ns)
+        return self.max_ns
+
+    def summary(self) -> dict[str, float]:
+        return {'count': self.count,
+                'p50_ms': self.percentile(50) / 1e6,
+                'p99_ms': self.percentile(99) / 1e6,
+                'max_ms': self.max_ns / 1e6}
+
+
+class LatencyRecorder:
+    def __init__(self):
+        self._histograms: dict[str, dict[QObject, LatencyHistogram]] = {
+            stage: collections.defaultdict(LatencyHistogram)
+            for stage in (SDL_TO_DISPATCH, DISPATCH_TO_SLOT, SLOT_TO_OUTPUT, INPUT_TO_OUTPUT)
+        }
+        # Marks of the last event dispatched to each input control, looked up by the output slots through sender()
+        self._last_marks: dict[QObject, Marks] = dict()
+        # Per thread : source control of the mapping relay running, if any (its slot calls have no sender())
+        self._relay = threading.local()
+
+    def on_dispatch(self, control: QObject, sdl_timestamp: int):
+        """Called by the event loop (SDL thread) just before an event is handed over to an input control"""
+        now_ns = time.perf_counter_ns()
+        age_ns = ((sdl2.SDL_GetTicks() - sdl_timestamp) & 0xFFFFFFFF) * 1_000_000
+        self._histograms[SDL_TO_DISPATCH][control].record(age_ns)
+        self._last_marks[control] = (now_ns - age_ns, now_ns)
+
+    def on_relay(self, source: QObject | None):
+        """Called by a mapping relay (see MappingPlan) before calling the slots mapped to 'source',
+        and after them, with None"""
+        self._relay.source = source
+
+    def on_slot(self, control: QObject, sender: QObject | None) -> Marks | None:
+        """Called by an output control when one of its slots is run, with the object which emitted the signal"""
+        if sender is None:
+            sender = getattr(self._relay, 'source', None)
+        if (marks := self._last_marks.get(sender)) is None:
+            return None
+        self._histograms[DISPATCH_TO_SLOT][control].record(time.perf_counter_ns() - marks[1])
+        return marks[0], time.perf_counter_ns()
+
+    def on_output(self, control: QObject, marks: Marks | None):
+        """Called by an output control once the output driver call has returned, with the marks from on_slot()"""
+        if marks is None:
+            return
+        now_ns = time.perf_counter_ns()
+        self._histograms[SLOT_TO_OUTPUT][control].record(now_ns - marks[1])
+        self._histograms[INPUT_TO_OUTPUT][control].record(now_ns - marks[0])
+
+    def report(self) -> dict[str, dict[str, dict[str, float]]]:
+        return {stage: {repr(control): histogram.summary() for control, histogram in list(histograms.items())}
+                for stage, histograms in self._histograms.items()}
+
+    def format_report(self) -> str:
+        lines = ['Latency report (p50 / p99 / max, in ms) :']
+        for stage, controls in self.report().items():
+            lines.append(f'  {stage}:')
+            for control, summary in sorted(controls.items()):
+                lines.append(f"    {control}: {summary['p50_ms']:.3f} / {summary['p99_ms']:.3f} / "
+                             f"{summary['max_ms']:.3f} ({summary['count']} samples)")
+        return '\n'.join(lines)
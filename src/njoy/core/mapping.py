@@ -0,0 +1,215 @@
+from __future__ import annotations  # PEP 563: Postponed evaluation of annotations
+
+import time
+import tomllib
+import typing
+
+from njoy.core import latency
+from njoy.hid_devices.hid_controls import OutputAxis
+from PySide6.QtCore import QObject, Slot
+
+if typing.TYPE_CHECKING:
+    from pathlib import Path
+    from typing import Callable
+    from njoy.core.core import Core
+    from njoy.hid_devices.hid_controls import InputAxis, InputButton, OutputButton
+    from njoy.hid_devices.vjoy_interface import vJoyId
+
+# Declarative mappings, compiled once (at Core.start()) into a flat plan : source control -> prebound callables.
+#
+# They can be declared with the builder API of Core (map_axis(), map_button()), or loaded from a dict / TOML file :
+#
+#   [devices]                     # optional aliases
+#   left = "LEFT VPC Stick MT-50CM3"
+#
+#   [[mapping]]
+#   device = "left"               # alias, HID name or GUID, or vJoy ID (int) for a virtual device
+#   button = 0
+#   on = "pressed"                # pressed, released or switched (default)
+#   target = "/ship/miscellaneous/landing_gear_toggle"
+#   slot = "switch_off"           # defaults to switch_on, switch_off or switch, depending on 'on'
+#
+#   [[mapping]]
+#   device = "left"
+#   axis = 0
+#   target = "/ship/flight_thrust/lateral_thrust_raw"
+#   inline = true                 # see InputAxis.connect_inline()
+#
+# Targets are game binding paths (see the game model), or control objects when using the builder API.
+
+__BUTTON_SIGNALS__ = {'pressed': 'switch_on', 'released': 'switch_off', 'switched': 'switch'}
+
+
+class MappingError(ValueError):
+    pass
+
+
+class Mapping(typing.NamedTuple):
+    device: str | vJoyId
+    kind: str  # 'axis' or 'button'
+    control_id: int
+    on: str  # signal of the source control, without the '_signal' suffix
+    target: str | QObject
+    slot: str
+    inline: bool = False
+
+
+class _Relay(QObject):
+    """Single receiver of a source signal, which calls all the callables mapped to it in a row.
+    Those are plain calls, without any sender() : the source is handed over to the latency recorder instead."""
+
+    def __init__(self, source: QObject, callables: list[Callable], parent: QObject = None):
+        super().__init__(parent)
+        self._source = source
+        self._callables = tuple(callables)
+
+    @Slot()
+    def call(self):
+        self._call_all()
+
+    @Slot(bool)
+    def call_with_state(self, state: bool):
+        self._call_all(state)
+
+    @Slot(float)
+    def call_with_value(self, value: float):
+        self._call_all(value)
+
+    def _call_all(self, *args):
+        if (recorder := latency.recorder) is None:
+            for callable_ in self._callables:
+                callable_(*args)
+            return
+        recorder.on_relay(self._source)
+        try:
+            for callable_ in self._callables:
+                callable_(*args)
+        finally:
+            recorder.on_relay(None)
+
+
+class MappingPlan(QObject):
+    def __init__(self, *, core: Core):
+        super().__init__(parent=core)
+        self._core = core
+        self._mappings: list[Mapping] = list()
+        self._relays: list[_Relay] = list()
+        self._compiled = False
+        self._nb_compiled = 0
+        self._nb_duplicates = 0
+        self._nb_sources = 0
+        self._nb_inline = 0
+        self._compile_time = 0.0
+
+    def add(self, mapping: Mapping):
+        if self._compiled:
+            raise MappingError(f"Mappings are already compiled, can't add {mapping}")
+        self._mappings.append(mapping)
+
+    def add_axis(self,
+                 device: str | vJoyId,
+                 axis: int,
+                 target: str | OutputAxis,
+                 *,
+                 slot: str = 'move',
+                 inline: bool = False):
+        self.add(Mapping(device, 'axis', axis, 'moved', target, slot, inline))
+
+    def add_button(self,
+                   device: str | vJoyId,
+                   button: int,
+                   target: str | QObject,
+                   *,
+                   on: str = 'switched',
+                   slot: str = None):
+        if on not in __BUTTON_SIGNALS__:
+            raise MappingError(f"Invalid button signal '{on}', expected one of {', '.join(__BUTTON_SIGNALS__)}")
+        self.add(Mapping(device, 'button', button, on, target, slot or __BUTTON_SIGNALS__[on]))
+
+    def load(self, spec: dict):
+        """Adds the mappings declared in a dict, laid out as in the TOML format above"""
+        aliases: dict[str, str | vJoyId] = spec.get('devices', dict())
+        for entry in spec.get('mapping', list()):
+            device = aliases.get(entry.get('device'), entry.get('device'))
+            if device is None or 'target' not in entry or ('axis' in entry) == ('button' in entry):
+                raise MappingError(f"Invalid mapping: {entry}")
+            if 'axis' in entry:
+                self.add_axis(device, entry['axis'], entry['target'],
+                              slot=entry.get('slot', 'move'),
+                              inline=entry.get('inline', False))
+            else:
+                self.add_button(device, entry['button'], entry['target'],
+                                on=entry.get('on', 'switched'),
+                                slot=entry.get('slot'))
+
+    def load_toml(self, mapping_file: Path):
+        with mapping_file.open('rb') as f:
+            self.load(tomllib.load(f))
+
+    def compile(self):
+        """Resolves and validates all the mappings, drops the duplicates, and wires each source signal once.
+        Only the first call does anything."""
+        if self._compiled:
+            return
+        start = time.perf_counter()
+        plan: dict[tuple[QObject, str], list[Callable]] = dict()
+        seen: set[tuple[QObject, str, QObject, str]] = set()
+        for mapping in self._mappings:
+            source = self._resolve_source(mapping)
+            target = self._resolve_target(mapping)
+            if (key := (source, mapping.on, target, mapping.slot)) in seen:
+                self._nb_duplicates += 1
+                continue
+            seen.add(key)
+
+            if mapping.inline:
+                if mapping.kind != 'axis' or mapping.slot != 'move' or not isinstance(target, OutputAxis):
+                    raise MappingError(f"Only axis to output axis mappings can be inline: {mapping}")
+                source.connect_inline(target)
+                self._nb_inline += 1
+                continue
+
+            if not callable(slot := getattr(target, mapping.slot, None)):
+                raise MappingError(f"{target} has no '{mapping.slot}' slot: {mapping}")
+            plan.setdefault((source, mapping.on), list()).append(slot)
+
+        for (source, on), callables in plan.items():
+            relay = _Relay(source, callables, parent=self)
+            signal = getattr(source, f'{on}_signal')
+            if on == 'moved':
+                signal.connect(relay.call_with_value)
+            elif on == 'switched':
+                signal.connect(relay.call_with_state)
+            else:
+                signal.connect(relay.call)
+            self._relays.append(relay)
+
+        self._compiled = True
+        self._nb_compiled = len(seen)
+        self._nb_sources = len(plan)
+        self._compile_time = time.perf_counter() - start
+
+    def report(self) -> dict[str, float]:
+        return {'mappings': self._nb_compiled,
+                'duplicates_dropped': self._nb_duplicates,
+                'wired_sources': self._nb_sources,
+                'inline_mappings': self._nb_inline,
+                'compile_ms': self._compile_time * 1000}
+
+    def _resolve_source(self, mapping: Mapping) -> InputAxis | InputButton | OutputAxis | OutputButton:
+        try:
+            if isinstance(mapping.device, int):
+                lookup = self._core.virtual_axis if mapping.kind == 'axis' else self._core.virtual_button
+            else:
+                lookup = self._core.physical_axis if mapping.kind == 'axis' else self._core.physical_button
+            return lookup(mapping.device, mapping.control_id)
+        except LookupError as e:
+            raise MappingError(f"Invalid source for {mapping}: {e}") from e
+
+    def _resolve_target(self, mapping: Mapping) -> QObject:
+        if not isinstance(mapping.target, str):
+            return mapping.target
+        try:
+            return self._core.game_model.bindings[mapping.target]
+        except KeyError as e:
+            raise MappingError(f"Unknown game binding for {mapping}: {e}") from e
@@ -0,0 +1,107 @@
+from __future__ import annotations  # PEP 563: Postponed evaluation of annotations
+
+import fnmatch
+import functools
+import re
+import sys
+import typing
+
+if typing.TYPE_CHECKING:
+    from typing import Callable, Iterable, Iterator
+
+T = typing.TypeVar('T')
+
+# Index of '/' separated paths (e.g. the game binding paths, '/ship/flight_rotation/yaw_axis_raw').
+#
+# Exact lookups go through a flat dict of interned keys, and never build any path object.
+# Glob queries walk a prefix trie, one path segment at a time : a literal segment is a single child lookup,
+# a wildcard segment only matches the children of the nodes reached so far, and '**' matches any number of segments.
+#
+#   trie.glob('/ship/flight_*/*_raw')    every raw axis of the flight sections
+#   trie.glob('/ship/**')                everything under /ship
+#
+# The trie is only built on the first glob query, and dropped whenever a path is added.
+
+__WILDCARD_CHARS__ = frozenset('*?[')
+
+
+@functools.lru_cache(maxsize=256)
+def _segment_matcher(segment: str) -> Callable[[str], re.Match | None]:
+    return re.compile(fnmatch.translate(segment)).match
+
+
+class _Node:
+    __slots__ = ('children', 'path')
+
+    def __init__(self):
+        self.children: dict[str, _Node] = dict()
+        self.path: str | None = None  # set if a path ends here
+
+
+class PathTrie(typing.Generic[T]):
+    """Mapping of paths to values, with glob queries (see above)"""
+
+    def __init__(self, items: Iterable[tuple[str, T]] = ()):
+        self._values: dict[str, T] = {sys.intern(path): value for path, value in items}
+        self._root: _Node | None = None
+
+    def __len__(self) -> int:
+        return len(self._values)
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._values)
+
+    def __contains__(self, path: str) -> bool:
+        return path in self._values
+
+    def __getitem__(self, path: str) -> T:
+        return self._values[path]
+
+    def __setitem__(self, path: str, value: T):
+        self._values[sys.intern(path)] = value
+        self._root = None
+
+    def get(self, path: str, default: T = None) -> T | None:
+        return self._values.get(path, default)
+
+    def items(self) -> Iterable[tuple[str, T]]:
+        return self._values.items()
+
+    def glob(self, pattern: str) -> list[str]:
+        """The paths matching a glob pattern, in one walk of the trie, sorted.
+        '*', '?' and '[...]' match within a segment (see fnmatch), '**' matches any number of segments."""
+        segments = [segment for segment in pattern.split('/') if segment]
+        matches: set[str] = set()
+        self._match(self._trie(), segments, 0, matches)
+        return sorted(matches)
+
+    def _trie(self) -> _Node:
+        if self._root is None:
+            root = _Node()
+            for path in self._values:
+                node = root
+                for segment in path.split('/'):
+                    if segment:
+                        node = node.children.setdefault(segment, _Node())
+                node.path = path
+            self._root = root
+        return self._root
+
+    def _match(self, node: _Node, segments: list[str], index: int, matches: set[str]):
+        if index == len(segments):
+            if node.path is not None:
+                matches.add(node.path)
+            return
+        segment = segments[index]
+        if segment == '**':
+            self._match(node, segments, index + 1, matches)
+            for child in node.children.values():
+                self._match(child, segments, index, matches)
+        elif __WILDCARD_CHARS__.isdisjoint(segment):
+            if (child := node.children.get(segment)) is not None:
+                self._match(child, segments, index + 1, matches)
+        else:
+            match = _segment_matcher(segment)
+            for name, child in node.children.items():
+                if match(name):
+                    self._match(child, segments, index + 1, matches)
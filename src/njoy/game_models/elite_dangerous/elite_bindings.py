@@ -2,15 +2,20 @@ from __future__ import annotations  # PEP 563: Postponed evaluation of annotatio
 
 import datetime
 import enum
+import hashlib
 import json
 import lxml.etree
+import pickle
 import re
+import time
 import typing
 
 from .elite_controls import FeedbackSwitch, FeedbackHoldSwitch
 from .elite_monitor import StatusFlags
-from njoy.hid_devices.hid_event_loop import vJoyId
-from lxml import objectify
+from njoy.core.path_trie import PathTrie
+from njoy.hid_devices.vjoy_interface import vJoyId
+from njoy.startup_profile import profiled
+from njoy.version import VERSION
 from pathlib import Path, PurePosixPath
 from PySide6.QtCore import QObject
 
@@ -65,25 +70,124 @@ class EliteBindings(QObject):
     # so skip the buttons above 32 when looking for the next available one
     __OUTPUT_BUTTON_RANGE__ = range(32)
 
+    # Bumped whenever the result of _parse_controls() changes, to invalidate the existing caches
+    __METADATA_CACHE_FORMAT__ = 1
+
+    # Plain lxml.etree elements (no objectify proxies), parsed like objectify does : the blank text is dropped,
+    # and the output is pretty printed from scratch
+    __XML_PARSER__ = lxml.etree.XMLParser(remove_blank_text=True)
+    __BINDING_TAGS__ = ('Primary', 'Secondary', 'Binding')
+
+    @profiled
     def __init__(self,
                  *,
                  elite_model: EliteModel,
                  hid_event_loop: HIDEventLoop,
                  metadata_file: Path = Path(__file__).with_suffix('.json'),
+                 metadata_cache: bool = True,
                  ignored_output_device_ids: set[vJoyId] = None):
+        """'metadata_cache' keeps the parsed metadata next to the metadata file (same name, .pickle),
+        so that it's only parsed again when either the metadata file or njoy change."""
         super().__init__(elite_model)
         self._elite_model = elite_model
         self._hid_event_loop = hid_event_loop
         self._ignored_output_device_ids = ignored_output_device_ids or set()
 
-        metadata = json.loads(metadata_file.read_text())
-        self.njoy_version_requirement = metadata['njoy_version']
-        self.game_version_requirement = metadata['game_version']
-        self._control_metadata = self._parse_controls(metadata)
-        self._control_instances: dict[str | PurePosixPath, EliteOutputControl] = dict()
+        # The metadata file is only parsed (or loaded from the cache) on first use, see _load_metadata()
+        self._metadata_file = metadata_file
+        self._metadata_cache_file = metadata_file.with_suffix('.pickle') if metadata_cache else None
+        self._versions: dict[str, str] | None = None
+        self._parsed_control_metadata: PathTrie[dict] | None = None
+        self._control_instances: dict[str, EliteOutputControl] = dict()
+
+        # See generation_report()
+        self._generated_file: Path | None = None
+        self._generation_time = 0.0
+        self._nb_generated = 0
+        self._written = False
+
+    @property
+    def njoy_version_requirement(self) -> str:
+        if self._versions is None:
+            self._load_metadata()
+        return self._versions['njoy_version']
+
+    @property
+    def game_version_requirement(self) -> str:
+        if self._versions is None:
+            self._load_metadata()
+        return self._versions['game_version']
+
+    @property
+    def _control_metadata(self) -> PathTrie[dict]:
+        """Metadata of each control, by path (as a normalized string, see __getitem__())"""
+        if self._parsed_control_metadata is None:
+            self._load_metadata()
+        return self._parsed_control_metadata
+
+    @profiled
+    def _load_metadata(self):
+        self._versions, control_metadata = self.read_metadata(self._metadata_file, self._metadata_cache_file)
+        self._parsed_control_metadata = PathTrie(control_metadata.items())
+
+    def _path_key(self, item: str | PurePosixPath) -> str:
+        """The paths are indexed as normalized strings : an exact match (the usual case) needs no conversion"""
+        if isinstance(item, str) and item in self._control_metadata:
+            return item
+        return str(PurePosixPath(item))
+
+    def glob(self, pattern: str) -> list[str]:
+        """Paths of the controls matching a glob pattern (see PathTrie.glob()), one per control even if several of
+        its alternate names match, to bind whole sections at once :
+            raw_axes = {path: bindings[path] for path in bindings.glob('/ship/flight_*/*_raw')}"""
+        paths = dict()
+        for path in self._control_metadata.glob(pattern):
+            paths.setdefault(self._control_metadata[path]['alternates'][0], None)
+        return list(paths)
+
+    @classmethod
+    def read_metadata(cls,
+                      metadata_file: Path,
+                      cache_file: Path = None) -> tuple[dict[str, str], dict[str, dict]]:
+        """Parses a companion metadata file (see _parse_controls()), unless the cache file holds the result
+        of a previous parse of the same content (by hash), by the same version of njoy.
+        Returns the version requirements, and the metadata of each control."""
+        content = metadata_file.read_bytes()
+        cache_key = (cls.__METADATA_CACHE_FORMAT__, VERSION, hashlib.sha256(content).hexdigest())
+        if cache_file is not None and (cached := cls._load_cached_metadata(cache_file, cache_key)) is not None:
+            return cached
+
+        metadata = json.loads(content)
+        parsed = {key: metadata[key] for key in ('njoy_version', 'game_version')}, cls._parse_controls(metadata)
+        if cache_file is not None:
+            cls._save_cached_metadata(cache_file, cache_key, parsed)
+        return parsed
+
+    @staticmethod
+    def _load_cached_metadata(cache_file: Path, cache_key: tuple) -> tuple[dict[str, str], dict[str, dict]] | None:
+        """Returns None if there is no cache, or if it doesn't match the metadata file"""
+        try:
+            with cache_file.open('rb') as file:
+                # The key is pickled on its own, ahead of the metadata : a stale cache is rejected without loading it
+                if pickle.load(file) != cache_key:
+                    return None
+                return pickle.load(file)
+        except (OSError, EOFError, pickle.UnpicklingError, ValueError, TypeError):
+            return None
+
+    @staticmethod
+    def _save_cached_metadata(cache_file: Path, cache_key: tuple, parsed: tuple[dict[str, str], dict[str, dict]]):
+        try:
+            # Written aside then moved in place : another instance never loads a partial cache
+            temp_file = cache_file.with_suffix('.tmp')
+            temp_file.write_bytes(pickle.dumps(cache_key, pickle.HIGHEST_PROTOCOL)
+                                  + pickle.dumps(parsed, pickle.HIGHEST_PROTOCOL))
+            temp_file.replace(cache_file)
+        except OSError:
+            pass  # The cache is only an optimization
 
     def __getitem__(self, item: str | PurePosixPath) -> EliteOutputControl:
-        path = PurePosixPath(item)
+        path = self._path_key(item)
         if path in self._control_instances:
             return self._control_instances[path]
 
@@ -108,7 +212,8 @@ class EliteBindings(QObject):
         self._control_instances[path] = binding
         return binding
 
-    def _parse_controls(self, metadata: dict) -> dict[PurePosixPath, dict]:
+    @classmethod
+    def _parse_controls(cls, metadata: dict) -> dict[str, dict]:
         """Parses a companion metadata file.
         For each available binding in Elite, it provides information about:
         - which kind of control (binding) it is (button or axis)
@@ -116,16 +221,16 @@ class EliteBindings(QObject):
         - (not used yet) if it is a button, is it part of a group of buttons that are an alternative to an axis ?
         - where to read feedback from the game, if it provides any for this binding
         """
-        controls_metadata: dict[PurePosixPath, dict] = dict()
+        controls_metadata: dict[str, dict] = dict()
         for section in [k for k in metadata.keys() if k not in {'njoy_version', 'game_version'}]:
             for sub_section, sub_section_metadata in metadata[section].items():
                 for control_name, control_metadata in sub_section_metadata.items():
-                    name = self.__RE_CAMEL_TO_SNAKE__.sub(r'_\2', control_name).lower()
-                    path = PurePosixPath(f'/{section}/{sub_section}/{name}')
+                    name = cls.__RE_CAMEL_TO_SNAKE__.sub(r'_\2', control_name).lower()
+                    path = str(PurePosixPath(f'/{section}/{sub_section}/{name}'))
 
-                    alt_names = [self.__RE_CAMEL_TO_SNAKE__.sub(r'_\2', alt_name).lower()
+                    alt_names = [cls.__RE_CAMEL_TO_SNAKE__.sub(r'_\2', alt_name).lower()
                                  for alt_name in control_metadata.get('alternate_names', [])]
-                    alt_paths = [PurePosixPath(f'/{section}/{sub_section}/{alt_name}')
+                    alt_paths = [str(PurePosixPath(f'/{section}/{sub_section}/{alt_name}'))
                                  for alt_name in alt_names]
 
                     if 'alternate_names' in control_metadata:
@@ -139,19 +244,30 @@ class EliteBindings(QObject):
                         controls_metadata[alt_path] = control_metadata
         return {k: controls_metadata[k] for k in sorted(controls_metadata.keys())}
 
-    def generate_bindings(self, bindings_file: Path = None):
-        bindings_in_file = bindings_file or __DEFAULT_GENERATED_BINDING_FILE__
-        if bindings_in_file.exists():
-            bindings = self._parse_and_cleanup_bindings(bindings_in_file)
-            # bindings_out_file = bindings_in_file.with_stem(bindings_in_file.stem + '.out')
-            bindings_out_file = bindings_in_file
+    def generate_bindings(self, bindings_file: Path = None) -> bool:
+        """Writes the bindings of all the controls allocated so far, on top of the existing bindings file.
+        The file is only written if its content actually changes : Elite reloads it whenever it's written.
+        Returns True if it was written, see also generation_report()."""
+        start = time.perf_counter()
+        bindings_file = bindings_file or __DEFAULT_GENERATED_BINDING_FILE__
+        try:
+            existing_content = bindings_file.read_bytes()
+        except FileNotFoundError:
+            existing_content = None
+        if existing_content is not None:
+            bindings = self._parse_and_cleanup_bindings(existing_content)
         else:
             bindings = self._generate_empty_bindings()
-            bindings_out_file = bindings_in_file
+
+        # Only the controls allocated are visited, each one once, rather than searching the whole file for each
+        controls_by_name: dict[str, list[lxml.etree._Element]] = dict()
+        if names := {self._control_metadata[path]['elite_name'] for path in self._control_instances}:
+            for elt in bindings.iterchildren(*names):
+                controls_by_name.setdefault(elt.tag, list()).append(elt)
 
         for path, control in self._control_instances.items():
             metadata = self._control_metadata[path]
-            for elt in bindings.iterchildren(metadata['elite_name']):
+            for elt in controls_by_name.get(metadata['elite_name'], ()):
                 if 'game_feedback' in metadata:
                     output = control.output
                 else:
@@ -172,26 +288,52 @@ class EliteBindings(QObject):
                     # FIXME: dirty patch to only invert pitch
                     self._set_inverted_axis(elt, inverted=metadata['elite_name'] == 'PitchAxisRaw')
 
-        bindings_out_file.write_bytes(lxml.etree.tostring(bindings.getroottree(),
-                                                          encoding='UTF-8',
-                                                          xml_declaration=True,
-                                                          pretty_print=True))
-
-    def _parse_and_cleanup_bindings(self, bindings_file: Path) -> objectify.ObjectifiedElement:
-        """Parses an existing binding file, and remove any existing binding to vJoy devices (except ignored ones)"""
-        root = objectify.fromstring(bindings_file.read_bytes())
-        for control in root.iterchildren():
-            for param in control.iterchildren():
-                if self._is_re_assignable_binding(param):
-                    self._clear_binding(param)
+        content = lxml.etree.tostring(bindings.getroottree(),
+                                      encoding='UTF-8',
+                                      xml_declaration=True,
+                                      pretty_print=True)
+        self._written = content != existing_content
+        if self._written:
+            # Written aside then moved in place : Elite never reads a partial file
+            temp_file = bindings_file.with_suffix('.tmp')
+            temp_file.write_bytes(content)
+            temp_file.replace(bindings_file)
+        self._generated_file = bindings_file
+        self._nb_generated = len(self._control_instances)
+        self._generation_time = time.perf_counter() - start
+        return self._written
+
+    def generation_report(self) -> dict[str, float | str | bool]:
+        """Outcome of the last generate_bindings()"""
+        return {'bindings_file': str(self._generated_file),
+                'controls': self._nb_generated,
+                'written': self._written,
+                'status': 'written' if self._written else 'unchanged, skipped',
+                'generate_ms': self._generation_time * 1000}
+
+    def format_generation_report(self) -> str:
+        report = self.generation_report()
+        return (f"Bindings file {report['status']} : {report['bindings_file']} "
+                f"({report['controls']} controls, {report['generate_ms']:.1f} ms)")
+
+    def _parse_and_cleanup_bindings(self, content: bytes) -> lxml.etree._Element:
+        """Parses the content of an existing binding file,
+        and remove any existing binding to vJoy devices (except ignored ones)"""
+        root = lxml.etree.fromstring(content, self.__XML_PARSER__)
+        # The tags are filtered by libxml2 : only the bindings get a Python proxy, not the rest of the controls
+        for param in root.iter(*self.__BINDING_TAGS__):
+            if param.get('Device') == 'vJoy' \
+                    and param.getparent().getparent() is root \
+                    and self._is_re_assignable_binding(param):
+                self._clear_binding(param)
         return root
 
-    @staticmethod
-    def _generate_empty_bindings() -> objectify.ObjectifiedElement:
-        return objectify.fromstring(__ED_EMPTY_BINDINGS_FILE__.read_bytes())
+    @classmethod
+    def _generate_empty_bindings(cls) -> lxml.etree._Element:
+        return lxml.etree.fromstring(__ED_EMPTY_BINDINGS_FILE__.read_bytes(), cls.__XML_PARSER__)
 
-    def _is_re_assignable_binding(self, elt: objectify.ObjectifiedElement):
-        if elt.tag not in {'Primary', 'Secondary', 'Binding'}:
+    def _is_re_assignable_binding(self, elt: lxml.etree._Element):
+        if elt.tag not in self.__BINDING_TAGS__:
             return False
         if elt.get('Device') != 'vJoy':
             return False
@@ -200,41 +342,38 @@ class EliteBindings(QObject):
         return True
 
     @staticmethod
-    def _next_empty_binding(elt: objectify.ObjectifiedElement, is_button: bool) -> objectify.ObjectifiedElement:
+    def _next_empty_binding(elt: lxml.etree._Element, is_button: bool) -> lxml.etree._Element:
         for child in (elt.iterchildren('Primary', 'Secondary') if is_button else elt.iterchildren('Binding')):
             if child.get('Device') == '{NoDevice}':
                 return child
 
     @staticmethod
-    def _set_toggle_on(elt: objectify.ObjectifiedElement, toggle_on: bool):
+    def _set_toggle_on(elt: lxml.etree._Element, toggle_on: bool):
         for child in elt.iterchildren('ToggleOn'):
             child.set('Value', '1' if toggle_on else '0')
 
     @staticmethod
-    def _set_inverted_axis(elt: objectify.ObjectifiedElement, inverted: bool):
+    def _set_inverted_axis(elt: lxml.etree._Element, inverted: bool):
         for child in elt.iterchildren('Inverted'):
             child.set('Value', '1' if inverted else '0')
 
-    def _overwrite_binding(self, elt: objectify.ObjectifiedElement, device_index: str, key: str):
+    def _overwrite_binding(self, elt: lxml.etree._Element, device_index: str, key: str):
         self._clear_binding_attributes(elt)
         elt.set('Device', 'vJoy')
         elt.set('DeviceIndex', device_index)
         elt.set('Key', key)
 
-    def _clear_binding(self, elt: objectify.ObjectifiedElement):
+    def _clear_binding(self, elt: lxml.etree._Element):
         self._clear_binding_attributes(elt)
         elt.set('Device', '{NoDevice}')
         elt.set('Key', '')
 
-    def _clear_binding_attributes(self, elt: objectify):
+    def _clear_binding_attributes(self, elt: lxml.etree._Element):
         self._pop_attribute(elt, 'Device')
         self._pop_attribute(elt, 'DeviceIndex')
         self._pop_attribute(elt, 'Key')
         self._pop_attribute(elt, 'key')
 
     @staticmethod
-    def _pop_attribute(elt: objectify.ObjectifiedElement, attribute: str):
-        try:
-            elt.attrib.pop(attribute)
-        except KeyError:
-            pass
+    def _pop_attribute(elt: lxml.etree._Element, attribute: str):
+        elt.attrib.pop(attribute, None)
@@ -5,6 +5,7 @@ import typing
 from .elite_bindings import EliteBindings
 from PySide6.QtCore import QObject
 from njoy.game_models.elite_dangerous.elite_monitor import EliteMonitor
+from njoy.startup_profile import profiled
 
 if typing.TYPE_CHECKING:
     from pathlib import Path
@@ -12,12 +13,28 @@ if typing.TYPE_CHECKING:
 
 
 class EliteModel(QObject):
+    @profiled
     def __init__(self, *, core: _core.Core = None, game_binding_options: dict = None):
         super().__init__(parent=core)
-        self.elite_monitor = EliteMonitor(self)
-        self.bindings = EliteBindings(elite_model=self,
-                                      hid_event_loop=core.hid_event_loop,
-                                      **(game_binding_options if game_binding_options else {}))
+        self._core = core
+        self._game_binding_options = game_binding_options
+        self._elite_monitor: EliteMonitor | None = None
+        self._bindings: EliteBindings | None = None
 
-    def generate_bindings(self, bindings_file: Path = None):
-        self.bindings.generate_bindings(bindings_file=bindings_file)
+    @property
+    def elite_monitor(self) -> EliteMonitor:
+        """Built on first use : it looks for the journals, and starts watching them"""
+        if self._elite_monitor is None:
+            self._elite_monitor = EliteMonitor(self)
+        return self._elite_monitor
+
+    @property
+    def bindings(self) -> EliteBindings:
+        if self._bindings is None:
+            self._bindings = EliteBindings(elite_model=self,
+                                           hid_event_loop=self._core.hid_event_loop,
+                                           **(self._game_binding_options if self._game_binding_options else {}))
+        return self._bindings
+
+    def generate_bindings(self, bindings_file: Path = None) -> bool:
+        return self.bindings.generate_bindings(bindings_file=bindings_file)
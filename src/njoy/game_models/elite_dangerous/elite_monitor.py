@@ -7,6 +7,7 @@ import time
 from .elite_controls import StatusFlags, LegalStatus, GuiFocus
 from .elite_controls import FlagInput, GuiFocusInput, LegalStatusInput
 from datetime import datetime, timezone
+from njoy.startup_profile import profiled
 from pathlib import Path
 from PySide6.QtCore import QObject, Signal, Slot, QFileSystemWatcher
 
@@ -19,6 +20,7 @@ class EliteMonitor(QObject):
     journal_file_changed = Signal()
     status_file_changed = Signal()
 
+    @profiled
     def __init__(self, parent=None):
         super().__init__(parent)
         self._watcher = QFileSystemWatcher(self)
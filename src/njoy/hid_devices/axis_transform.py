@@ -0,0 +1,110 @@
+from __future__ import annotations  # PEP 563: Postponed evaluation of annotations
+
+import array
+import math
+import typing
+
+if typing.TYPE_CHECKING:
+    from typing import Callable
+
+# Number of possible SDL axis positions (-32768 to 32767), i.e. size of the lookup tables
+__SDL_AXIS_RANGE__ = 0x10000
+
+
+class AxisTransform:
+    """Response curve of an axis, from the raw SDL value straight to the raw vJoy value [0x0000..0x8000].
+
+    Deadzone, saturation, curve and inversion are folded into a lookup table of all the 65536 possible SDL values,
+    so that applying the transform costs a single lookup, whatever its parameters. The table is only rebuilt when
+    a parameter changes.
+    - deadzone : half width of the centered dead zone, as a fraction of the axis half range [0.0..1.0[
+    - saturation : position (fraction of the axis half range) past which the output is at its maximum ]0.0..1.0]
+    - curve : exponent applied to the output (1.0 is linear, > 1.0 is softer around the center),
+              or a function mapping [0.0..1.0] onto [0.0..1.0]
+    - inverted : reverses the output"""
+
+    def __init__(self,
+                 *,
+                 deadzone: float = 0.0,
+                 saturation: float = 1.0,
+                 curve: float | Callable[[float], float] = 1.0,
+                 inverted: bool = False):
+        self._check_range(deadzone, saturation)
+        self._deadzone = deadzone
+        self._saturation = saturation
+        self._curve = curve
+        self._inverted = inverted
+        self.table = array.array('H')
+        self._rebuild()
+
+    def __repr__(self):
+        return (f'<{self.__class__.__name__} deadzone={self._deadzone} saturation={self._saturation} '
+                f'curve={self._curve} inverted={self._inverted}>')
+
+    def __call__(self, value: float) -> float:
+        """Applies the transform to a value in [-1.0..1.0], for the float based paths (e.g. queued connections)"""
+        raw = round((value + 1) * 0xFFFF / 2) - 0x8000
+        return self.table[min(max(raw, -0x8000), 0x7FFF) + 0x8000] * 2 / 0x8000 - 1
+
+    def lookup(self, raw_value: int) -> int:
+        """SDL axis value (-32768 to 32767) to vJoy axis value (0x0000 to 0x8000)"""
+        return self.table[raw_value + 0x8000]
+
+    @property
+    def deadzone(self) -> float:
+        return self._deadzone
+
+    @deadzone.setter
+    def deadzone(self, deadzone: float):
+        self._check_range(deadzone, self._saturation)
+        self._deadzone = deadzone
+        self._rebuild()
+
+    @property
+    def saturation(self) -> float:
+        return self._saturation
+
+    @saturation.setter
+    def saturation(self, saturation: float):
+        self._check_range(self._deadzone, saturation)
+        self._saturation = saturation
+        self._rebuild()
+
+    @property
+    def curve(self) -> float | Callable[[float], float]:
+        return self._curve
+
+    @curve.setter
+    def curve(self, curve: float | Callable[[float], float]):
+        self._curve = curve
+        self._rebuild()
+
+    @property
+    def inverted(self) -> bool:
+        return self._inverted
+
+    @inverted.setter
+    def inverted(self, inverted: bool):
+        self._inverted = inverted
+        self._rebuild()
+
+    @staticmethod
+    def _check_range(deadzone: float, saturation: float):
+        if not 0.0 <= deadzone < saturation <= 1.0:
+            raise ValueError(f"Invalid deadzone ({deadzone}) / saturation ({saturation}): "
+                             f"expected 0 <= deadzone < saturation <= 1")
+
+    def _rebuild(self):
+        curve = self._curve if callable(self._curve) else (lambda x, exponent=self._curve: x ** exponent)
+        active_range = self._saturation - self._deadzone
+        sign = -1 if self._inverted else 1
+
+        table = array.array('H', bytes(2 * __SDL_AXIS_RANGE__))
+        for i in range(__SDL_AXIS_RANGE__):
+            # Same conversions as InputAxis.process_event() and VJoyDevice.set_axis()
+            value = 2 * i / 0xFFFF - 1
+            magnitude = min(1.0, max(0.0, abs(value) - self._deadzone) / active_range)
+            output = sign * math.copysign(min(1.0, max(0.0, curve(magnitude))), value)
+            table[i] = math.floor(0x8000 * (1 + output) / 2)
+        # Swapped in as a whole : the SDL thread may be reading the previous table
+        self.table = table
@@ -0,0 +1,69 @@
+from __future__ import annotations  # PEP 563: Postponed evaluation of annotations
+
+import threading
+import typing
+
+from .sdl_interface import SDLError
+
+if typing.TYPE_CHECKING:
+    from .hid_device import HIDDevice
+    from .sdl_interface import DeviceIndex, InstanceID
+
+
+class DeviceRegistry:
+    """Registered devices, by SDL instance id.
+
+    It is updated incrementally on hot-plug events : when a device is unplugged, it is closed and put aside,
+    and when a device is plugged in, only the devices put aside are checked against it. The device objects,
+    their controls and the connections to them are kept as they are, only their instance id changes.
+
+    Registration happens in the main thread, hot-plug events are handled in the SDL thread : the lock is
+    also meant to be held by whoever compiles something out of the registered devices (see lock())."""
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._attached: dict[InstanceID, HIDDevice] = dict()
+        self._detached: list[HIDDevice] = list()
+
+    def lock(self) -> threading.RLock:
+        return self._lock
+
+    def register(self, device: HIDDevice) -> bool:
+        """Returns False if the device was already registered"""
+        with self._lock:
+            if device in self._detached or self._attached.get(device.instance_id) is device:
+                return False
+            self._attached[device.instance_id] = device
+            return True
+
+    def attached_devices(self) -> list[tuple[InstanceID, HIDDevice]]:
+        with self._lock:
+            return list(self._attached.items())
+
+    def detached_devices(self) -> list[HIDDevice]:
+        with self._lock:
+            return list(self._detached)
+
+    def on_device_added(self, device_index: DeviceIndex) -> HIDDevice | None:
+        """Returns the registered device which has just been plugged back in at this index, if any"""
+        with self._lock:
+            for device in self._detached:
+                try:
+                    if not device.matches(device_index):
+                        continue
+                except SDLError:
+                    return None  # Unplugged again already
+                device.reattach(device_index)
+                self._detached.remove(device)
+                self._attached[device.instance_id] = device
+                return device
+        return None
+
+    def on_device_removed(self, instance_id: InstanceID) -> HIDDevice | None:
+        """Returns the registered device which has just been unplugged, if any"""
+        with self._lock:
+            if (device := self._attached.pop(instance_id, None)) is None:
+                return None
+            device.detach()
+            self._detached.append(device)
+            return device
@@ -0,0 +1,63 @@
+from __future__ import annotations  # PEP 563: Postponed evaluation of annotations
+
+import array
+import sdl2
+import typing
+
+
+def axis_value(raw_value: int) -> float:
+    """SDL axis position (-32768 to 32767) to n-joy axis value (-1.0 to 1.0)"""
+    return 2 * (raw_value + 0x8000) / 0xFFFF - 1
+
+
+class DeviceStateSnapshot(typing.NamedTuple):
+    """Immutable copy of the state of a whole device, taken at once (see DeviceState.snapshot())"""
+    raw_axes: memoryview  # read-only, of SDL axis positions
+    buttons: int  # bitset, bit i set if button i is pressed
+
+    def axis_value(self, axis_id: int) -> float:
+        return axis_value(self.raw_axes[axis_id])
+
+    def button_state(self, button_id: int) -> bool:
+        return bool(self.buttons >> button_id & 1)
+
+
+class DeviceState:
+    """In-process mirror of the state of a device, kept up to date by the HIDEventLoop out of the SDL events,
+    for the controls registered on the device. Reading it doesn't go through SDL."""
+    __slots__ = ('raw_axes', 'buttons')
+
+    def __init__(self, *, nb_axes: int, nb_buttons: int):
+        self.raw_axes = array.array('h', bytes(2 * nb_axes))
+        # Python ints are arbitrary precision : a single int is enough for any number of buttons
+        self.buttons = 0
+
+    @classmethod
+    def read(cls, joystick: sdl2.SDL_Joystick) -> DeviceState:
+        """Initial state, read from SDL once when the device is opened"""
+        nb_buttons = max(0, sdl2.SDL_JoystickNumButtons(joystick))
+        state = cls(nb_axes=max(0, sdl2.SDL_JoystickNumAxes(joystick)), nb_buttons=nb_buttons)
+        for axis_id in range(len(state.raw_axes)):
+            state.raw_axes[axis_id] = sdl2.SDL_JoystickGetAxis(joystick, axis_id)
+        for button_id in range(nb_buttons):
+            if sdl2.SDL_JoystickGetButton(joystick, button_id) == sdl2.SDL_PRESSED:
+                state.buttons |= 1 << button_id
+        return state
+
+    def update(self, event: sdl2.SDL_Event):
+        if event.type == sdl2.SDL_JOYAXISMOTION:
+            self.raw_axes[event.jaxis.axis] = event.jaxis.value
+        elif event.type == sdl2.SDL_JOYBUTTONDOWN:
+            self.buttons |= 1 << event.jbutton.button
+        elif event.type == sdl2.SDL_JOYBUTTONUP:
+            self.buttons &= ~(1 << event.jbutton.button)
+
+    def axis_value(self, axis_id: int) -> float:
+        return axis_value(self.raw_axes[axis_id])
+
+    def button_state(self, button_id: int) -> bool:
+        return bool(self.buttons >> button_id & 1)
+
+    def snapshot(self) -> DeviceStateSnapshot:
+        # A single copy of the axis buffer, the buttons bitset is immutable already
+        return DeviceStateSnapshot(memoryview(self.raw_axes.tobytes()).cast('h'), self.buttons)
@@ -0,0 +1,168 @@
+from __future__ import annotations  # PEP 563: Postponed evaluation of annotations
+
+import ctypes
+import queue
+import sdl2
+import struct
+import threading
+import time
+import typing
+
+from .sdl_interface import SDLError
+
+if typing.TYPE_CHECKING:
+    from pathlib import Path
+    from typing import BinaryIO, Iterator
+
+# Recording file format :
+# - an 8 bytes header : magic + format version
+# - fixed width little-endian records : type (u16), which (i32), control id (u8), value (i16), SDL timestamp (u32)
+#   value is the axis position for axis events, the button state for button events, the hat position for hat events
+__MAGIC__ = b'NJOYREC\x01'
+__RECORD__ = struct.Struct('<HiBhI')
+
+EventRecord: typing.TypeAlias = tuple[int, int, int, int, int]
+
+
+def event_to_record(event: sdl2.SDL_Event) -> EventRecord | None:
+    if event.type == sdl2.SDL_JOYAXISMOTION:
+        return event.type, event.jaxis.which, event.jaxis.axis, event.jaxis.value, event.common.timestamp
+    if event.type == sdl2.SDL_JOYBUTTONDOWN or event.type == sdl2.SDL_JOYBUTTONUP:
+        return event.type, event.jbutton.which, event.jbutton.button, event.jbutton.state, event.common.timestamp
+    if event.type == sdl2.SDL_JOYHATMOTION:
+        return event.type, event.jhat.which, event.jhat.hat, event.jhat.value, event.common.timestamp
+    return None
+
+
+def record_to_event(record: EventRecord, event: sdl2.SDL_Event, *, which: int = None):
+    event_type, recorded_which, control_id, value, timestamp = record
+    event.type = event_type
+    event.common.timestamp = timestamp
+    which = recorded_which if which is None else which
+    if event_type == sdl2.SDL_JOYAXISMOTION:
+        event.jaxis.which, event.jaxis.axis, event.jaxis.value = which, control_id, value
+    elif event_type == sdl2.SDL_JOYBUTTONDOWN or event_type == sdl2.SDL_JOYBUTTONUP:
+        event.jbutton.which, event.jbutton.button, event.jbutton.state = which, control_id, value
+    elif event_type == sdl2.SDL_JOYHATMOTION:
+        event.jhat.which, event.jhat.hat, event.jhat.value = which, control_id, value
+
+
+def read_recording(recording_file: Path) -> Iterator[EventRecord]:
+    with recording_file.open('rb') as f:
+        if f.read(len(__MAGIC__)) != __MAGIC__:
+            raise ValueError(f"{recording_file} is not an n-joy event recording")
+        while chunk := f.read(__RECORD__.size * 4096):
+            yield from __RECORD__.iter_unpack(chunk[:len(chunk) - len(chunk) % __RECORD__.size])
+
+
+class EventRecorder:
+    """Writes every joystick event seen by an HIDEventLoop to a recording file.
+    The event loop only queues a tuple per event, the packing and the file writes happen in a background thread."""
+
+    def __init__(self, recording_file: Path):
+        self.recording_file = recording_file
+        self.nb_recorded = 0
+        self._queue: queue.SimpleQueue[EventRecord | None] = queue.SimpleQueue()
+        self._file: BinaryIO = recording_file.open('wb')
+        self._file.write(__MAGIC__)
+        self._writer_thread = threading.Thread(target=self._write_loop, name='njoy-event-recorder', daemon=True)
+        self._writer_thread.start()
+
+    def __enter__(self) -> EventRecorder:
+        return self
+
+    def __exit__(self, *_):
+        self.close()
+
+    def record(self, event: sdl2.SDL_Event):
+        """Called from the SDL thread for each joystick event : must stay cheap"""
+        if (record := event_to_record(event)) is not None:
+            self._queue.put(record)
+
+    def close(self):
+        if self._writer_thread.is_alive():
+            self._queue.put(None)
+            self._writer_thread.join()
+
+    def _write_loop(self):
+        buffer = bytearray()
+        running = True
+        while running:
+            # Block for the first record, then grab everything else already queued, and write them all at once
+            records = [self._queue.get()]
+            try:
+                while len(records) < 4096:
+                    records.append(self._queue.get_nowait())
+            except queue.Empty:
+                pass
+
+            buffer.clear()
+            for record in records:
+                if record is None:
+                    running = False
+                    break
+                buffer += __RECORD__.pack(*record)
+            self._file.write(buffer)
+            self.nb_recorded += len(buffer) // __RECORD__.size
+        self._file.close()
+
+
+class EventReplayer:
+    """Pushes the events of a recording file back into the SDL event queue, where an HIDEventLoop picks them up.
+
+    'speed' scales the original timing (1.0 = original speed, 2.0 = twice as fast), None replays as fast as possible.
+    'instance_ids' maps the recorded instance ids onto the ones of the devices present now
+    (e.g. SDL virtual joysticks, when replaying on a machine without the original devices)."""
+
+    def __init__(self,
+                 recording_file: Path,
+                 *,
+                 speed: float | None = 1.0,
+                 instance_ids: dict[int, int] = None):
+        if speed is not None and speed <= 0:
+            raise ValueError(f"Invalid replay speed: {speed}")
+        self.recording_file = recording_file
+        self.speed = speed
+        self.instance_ids = instance_ids or dict()
+        self.nb_replayed = 0
+        self.duration = 0.0
+        self._thread: threading.Thread | None = None
+
+    @property
+    def events_per_second(self) -> float:
+        return self.nb_replayed / self.duration if self.duration else 0.0
+
+    def start(self):
+        """Replays the recording in a background thread, see join()"""
+        self._thread = threading.Thread(target=self.replay, name='njoy-event-replayer', daemon=True)
+        self._thread.start()
+
+    def join(self):
+        if self._thread is not None:
+            self._thread.join()
+
+    def replay(self):
+        event = sdl2.SDL_Event()
+        first_timestamp: int | None = None
+        start = time.perf_counter()
+        for record in read_recording(self.recording_file):
+            if self.speed is not None:
+                if first_timestamp is None:
+                    first_timestamp = record[4]
+                delay = ((record[4] - first_timestamp) & 0xFFFFFFFF) / 1000 / self.speed
+                if (remaining := start + delay - time.perf_counter()) > 0:
+                    time.sleep(remaining)
+
+            record_to_event(record, event, which=self.instance_ids.get(record[1]))
+            self._push(event)
+            self.nb_replayed += 1
+        self.duration = time.perf_counter() - start
+
+    @staticmethod
+    def _push(event: sdl2.SDL_Event):
+        # SDL stamps the event again when pushing it, and the queue is bounded : wait for some room if it is full
+        deadline = time.perf_counter() + 1.0
+        while sdl2.SDL_PushEvent(ctypes.byref(event)) < 0:
+            if time.perf_counter() > deadline:
+                raise SDLError(sdl2.SDL_GetError())
+            time.sleep(0.001)
@@ -1,17 +1,92 @@
 from __future__ import annotations  # PEP 563: Postponed evaluation of annotations
 
+import math
 import sdl2
+import time
 import typing
 
+from .axis_transform import AxisTransform
+from njoy.core import latency
 from njoy.core.controls import InputAxisInterface, OutputAxisInterface
 from njoy.core.controls import InputButtonInterface, OutputButtonInterface, OutputSwitchMixin, OutputPulseMixin
-from PySide6.QtCore import Slot
+from PySide6.QtCore import Qt, Slot, QMetaMethod, QTimer
 
 if typing.TYPE_CHECKING:
+    from typing import Callable
+    from PySide6.QtCore import QObject
     from .hid_device import HIDDevice, VirtualDevice
 
 
-class InputAxis(InputAxisInterface):
+class _DispatchedControlMixin:
+    """Lets the device (and through it, the event loop) know when the connections to a control change,
+    so that events are only dispatched to the controls somebody is listening to."""
+    __DISPATCHED_SIGNALS__: tuple[str, ...] = ()
+
+    def connectNotify(self, signal: QMetaMethod):
+        super().connectNotify(signal)
+        self.device.notify_connections_changed()
+
+    def disconnectNotify(self, signal: QMetaMethod):
+        super().disconnectNotify(signal)
+        self.device.notify_connections_changed()
+
+    def has_receivers(self) -> bool:
+        return any(self.isSignalConnected(QMetaMethod.fromSignal(getattr(self, signal)))
+                   for signal in self.__DISPATCHED_SIGNALS__)
+
+
+class _InlineAxisSourceMixin:
+    """Fast path for the simple axis mappings (physical axis -> transform -> virtual axis) :
+    instead of going through moved_signal, which is queued to the main thread, the transform and the output write
+    are run synchronously, in the SDL thread, as part of the dispatch of the event.
+
+    Inline mappings are explicit (connect_inline() vs moved_signal.connect()), and listed by inline_mappings.
+    Transforms must be cheap, and must not touch any Qt object : they hold back the dispatch of every other event.
+    An AxisTransform keeps the whole path in the integer domain : one table lookup, then the raw vJoy write."""
+    _inline_mappings: tuple[tuple[OutputAxis, AxisTransform | Callable[[float], float] | None], ...] = ()
+    _inline_writers: tuple[Callable[[int, float], None], ...] = ()
+
+    @property
+    def inline_mappings(self) -> tuple[tuple[OutputAxis, AxisTransform | Callable[[float], float] | None], ...]:
+        return self._inline_mappings
+
+    def connect_inline(self, target: OutputAxis, transform: AxisTransform | Callable[[float], float] = None):
+        """Writes every new value of this axis (through 'transform' if any) to 'target', inline, in the SDL thread.
+        The rate limit of the target (max_rate) doesn't apply to inline writes."""
+        if not isinstance(target, OutputAxis):
+            raise ValueError(f"Can't map {self} inline onto {target}: output is not enabled on it")
+        # Read by the SDL thread : replaced as a whole, never mutated in place
+        self._inline_mappings = (*self._inline_mappings, (target, transform))
+        self._inline_writers = tuple(self._inline_writer(*mapping) for mapping in self._inline_mappings)
+        self.device.notify_connections_changed()
+
+    def disconnect_inline(self, target: OutputAxis):
+        self._inline_mappings = tuple(mapping for mapping in self._inline_mappings if mapping[0] is not target)
+        self._inline_writers = tuple(self._inline_writer(*mapping) for mapping in self._inline_mappings)
+        self.device.notify_connections_changed()
+
+    def has_receivers(self) -> bool:
+        return bool(self._inline_mappings) or super().has_receivers()
+
+    def _inline_writer(self,
+                       target: OutputAxis,
+                       transform: AxisTransform | Callable[[float], float] | None) -> Callable[[int, float], None]:
+        """Prebinds the write of an inline mapping, taking both the raw SDL value and the float value"""
+        if transform is None:
+            return lambda raw_value, value: target.write_inline(value, source=self)
+        if isinstance(transform, AxisTransform):
+            # Look the table up each time : it is replaced when the transform parameters change
+            return lambda raw_value, value: target.write_raw_inline(transform.table[raw_value + 0x8000], source=self)
+        return lambda raw_value, value: target.write_inline(transform(value), source=self)
+
+    def _run_inline_mappings(self, raw_value: int, value: float):
+        for writer in self._inline_writers:
+            writer(raw_value, value)
+
+
+class InputAxis(_InlineAxisSourceMixin, _DispatchedControlMixin, InputAxisInterface):
+    __DISPATCHED_SIGNALS__ = ('moved_signal',)
+
     def __init__(self, *, device: HIDDevice | VirtualDevice, axis_id: int):
         super().__init__(parent=device)
         self.device: HIDDevice | VirtualDevice = device
@@ -25,30 +100,128 @@ class InputAxis(InputAxisInterface):
 
     def process_event(self, event: sdl2.SDL_Event):
         if event.type == sdl2.SDL_JOYAXISMOTION:
-            self.moved_signal.emit(2 * (event.jaxis.value + 0x8000) / 0xFFFF - 1)
+            value = 2 * (event.jaxis.value + 0x8000) / 0xFFFF - 1
+            if self._inline_writers:
+                self._run_inline_mappings(event.jaxis.value, value)
+            self.moved_signal.emit(value)
+
 
+class OutputAxis(_InlineAxisSourceMixin, _DispatchedControlMixin, OutputAxisInterface):
+    __DISPATCHED_SIGNALS__ = ('moved_signal',)
 
-class OutputAxis(OutputAxisInterface):
-    def __init__(self, *, device: VirtualDevice, axis_id: int):
+    def __init__(self, *, device: VirtualDevice, axis_id: int, max_rate: float = None):
         super().__init__(parent=device)
         self.device: HIDDevice | VirtualDevice = device
         self.axis_id = axis_id
 
+        # Rate limiting : when writes come in faster than max_rate, only the latest value is kept,
+        # and it is flushed as soon as the minimum interval between two writes has elapsed.
+        self._min_interval_ns = 0
+        self._last_write_ns = 0
+        self._pending_value: float | None = None
+        self._pending_marks: latency.Marks | None = None
+        self._flush_timer = QTimer(self)
+        self._flush_timer.setSingleShot(True)
+        self._flush_timer.setTimerType(Qt.PreciseTimer)
+        self._flush_timer.timeout.connect(self._flush_pending_value)
+        self.max_rate = max_rate
+
+        # Measured output rate, over windows of about one second
+        self._rate_window_start_ns = time.perf_counter_ns()
+        self._rate_window_writes = 0
+        self._output_rate = 0.0
+
     def __repr__(self):
         return f'<{self.__class__.__name__} #{self.axis_id} of {self.device.name}>'
 
+    @property
+    def max_rate(self) -> float | None:
+        """Maximum number of writes per second to the output device, or None if unlimited."""
+        return 1e9 / self._min_interval_ns if self._min_interval_ns else None
+
+    @max_rate.setter
+    def max_rate(self, max_rate: float | None):
+        if max_rate is not None and max_rate <= 0:
+            raise ValueError(f"Invalid max rate for {self}: {max_rate}")
+        self._min_interval_ns = math.ceil(1e9 / max_rate) if max_rate else 0
+        if not self._min_interval_ns:
+            self._flush_timer.stop()
+            self._flush_pending_value()
+
+    @property
+    def output_rate(self) -> float:
+        """Number of writes per second actually sent to the output device, measured over the last second."""
+        self._roll_rate_window(time.perf_counter_ns())
+        return self._output_rate
+
+    def _roll_rate_window(self, now_ns: int):
+        elapsed_ns = now_ns - self._rate_window_start_ns
+        if elapsed_ns >= 1_000_000_000:
+            self._output_rate = self._rate_window_writes * 1e9 / elapsed_ns
+            self._rate_window_start_ns = now_ns
+            self._rate_window_writes = 0
+
     def _get_value(self) -> float:
         return self.device.get_axis_value(self.axis_id)
 
     def _set_value(self, value: float):
-        self.device.set_axis(self.axis_id, value)
+        marks = latency.recorder.on_slot(self, self.sender()) if latency.recorder is not None else None
+        if not self._min_interval_ns:
+            self._write_value(value, marks)
+            return
+
+        elapsed_ns = time.perf_counter_ns() - self._last_write_ns
+        if elapsed_ns >= self._min_interval_ns and not self._flush_timer.isActive():
+            self._write_value(value, marks)
+            return
+
+        # Too early : keep the latest value only, and make sure it gets written on the next tick
+        self._pending_value = value
+        self._pending_marks = marks
+        if not self._flush_timer.isActive():
+            self._flush_timer.start(max(0, math.ceil((self._min_interval_ns - elapsed_ns) / 1_000_000)))
+
+    @Slot()
+    def _flush_pending_value(self):
+        if self._pending_value is not None:
+            value, self._pending_value = self._pending_value, None
+            self._write_value(value, self._pending_marks)
+
+    def write_inline(self, value: float, *, source: QObject = None):
+        """Write from an inline mapping (see connect_inline()), in the SDL thread : bypasses the rate limit"""
+        marks = latency.recorder.on_slot(self, source) if latency.recorder is not None else None
+        self._write_value(value, marks)
+
+    def write_raw_inline(self, raw_value: int, *, source: QObject = None):
+        """Same as write_inline(), with a value already in the vJoy int range [0x0000..0x8000]"""
+        marks = latency.recorder.on_slot(self, source) if latency.recorder is not None else None
+        self._on_written(marks, suppressed=self.device.set_axis_raw(self.axis_id, raw_value))
+
+    def _write_value(self, value: float, marks: latency.Marks = None):
+        self._on_written(marks, suppressed=self.device.set_axis(self.axis_id, value))
+
+    def _on_written(self, marks: latency.Marks | None, *, suppressed: bool):
+        if latency.recorder is not None:
+            latency.recorder.on_output(self, marks)
+        # A write suppressed by the output backend (no-op, deadband) never reached the driver : it doesn't count
+        # in the output rate, nor for the rate limit
+        if suppressed:
+            return
+        self._last_write_ns = time.perf_counter_ns()
+        self._rate_window_writes += 1
+        self._roll_rate_window(self._last_write_ns)
 
     def process_event(self, event: sdl2.SDL_Event):
         if event.type == sdl2.SDL_JOYAXISMOTION:
-            self.moved_signal.emit(2 * (event.jaxis.value + 0x8000) / 0xFFFF - 1)
+            value = 2 * (event.jaxis.value + 0x8000) / 0xFFFF - 1
+            if self._inline_writers:
+                self._run_inline_mappings(event.jaxis.value, value)
+            self.moved_signal.emit(value)
 
 
-class InputButton(InputButtonInterface):
+class InputButton(_DispatchedControlMixin, InputButtonInterface):
+    __DISPATCHED_SIGNALS__ = ('pressed_signal', 'released_signal', 'switched_signal')
+
     def __init__(self, *, device: HIDDevice | VirtualDevice, button_id: int):
         super().__init__(parent=device)
         self.device: HIDDevice | VirtualDevice = device
@@ -68,7 +241,9 @@ class InputButton(InputButtonInterface):
         self.switched_signal.emit(event.jbutton.state == 1)
 
 
-class OutputButton(OutputButtonInterface, OutputSwitchMixin, OutputPulseMixin):
+class OutputButton(_DispatchedControlMixin, OutputButtonInterface, OutputSwitchMixin, OutputPulseMixin):
+    __DISPATCHED_SIGNALS__ = ('pressed_signal', 'released_signal', 'switched_signal')
+
     def __init__(self, *, device: VirtualDevice, button_id: int):
         super().__init__(parent=device)
         self.device: HIDDevice | VirtualDevice = device
@@ -87,14 +262,20 @@ class OutputButton(OutputButtonInterface, OutputSwitchMixin, OutputPulseMixin):
     def switch(self, target_state: bool = None):
         if target_state is not None and target_state == self.state:
             return
+        marks = latency.recorder.on_slot(self, self.sender()) if latency.recorder is not None else None
         self.device.set_button(self.button_id, target_state or not self.state)
+        if latency.recorder is not None:
+            latency.recorder.on_output(self, marks)
 
     @Slot(bool)
     def pulse(self, target_state: bool = None):
         if target_state is not None and target_state == self.state:
             return
+        marks = latency.recorder.on_slot(self, self.sender()) if latency.recorder is not None else None
         target = target_state if target_state is not None else not self.state
         self.device.set_button(self.button_id, target)
+        if latency.recorder is not None:
+            latency.recorder.on_output(self, marks)
         (self._pulse_on_timer if target else self._pulse_off_timer).start()
 
     @Slot()
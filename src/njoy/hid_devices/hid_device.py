@@ -1,16 +1,23 @@
 from __future__ import annotations  # PEP 563: Postponed evaluation of annotations
 
+import functools
+import itertools
 import sdl2
-import sdl2.ext
+import time
 import typing
 
+from .device_state import DeviceState
 from .hid_controls import InputAxis, OutputAxis
 from .hid_controls import InputButton, OutputButton
 from .sdl_interface import InstanceID, SDLError, _SDL
 from .vjoy_interface import VJoyDevice, vJoyId, AxisID
-from PySide6.QtCore import QObject
+from PySide6.QtCore import QObject, QMetaObject, Qt, QTimer, Signal, Slot
 
 if typing.TYPE_CHECKING:
+    from typing import Iterable
+    from .device_state import DeviceStateSnapshot
+    from .output_backends import OutputBackend
+    from .state_publication import StatePublisher
     from .sdl_interface import DeviceIndex
 
 
@@ -19,27 +26,76 @@ class _CachedDeviceMeta(type(QObject), type):
 
     def __call__(cls, ident: str | vJoyId, *args, **kwargs):
         if ident not in cls.instances:
-            if cls is VirtualDevice:
-                instance = super().__call__(*args,
-                                            ident=ident,
-                                            device_index=_SDL.find_vjoy_device_index(ident),
-                                            **kwargs)
-            else:
-                instance = super().__call__(*args,
-                                            device_index=_SDL.find_hid_device_index(ident),
-                                            **kwargs)
+            instance = super().__call__(*args,
+                                        ident=ident,
+                                        device_index=cls.find_device_index(ident),
+                                        **kwargs)
             cls.instances[ident] = instance
         return cls.instances.get(ident)
 
+    def forget(cls, ident: str | vJoyId):
+        """The cached device is deleted, the next lookup of 'ident' creates a new one"""
+        if (device := cls.instances.pop(ident, None)) is not None:
+            device.deleteLater()
+
+
+class _SlotBitmap:
+    """The slots (axis or button ids) of a virtual device already taken by a control, as a bitset :
+    finding the first free one, within a range or not, is a couple of int operations, whatever the number of slots."""
+    __slots__ = ('nb_slots', 'used')
+
+    def __init__(self, nb_slots: int):
+        self.nb_slots = nb_slots
+        self.used = 0
+
+    @staticmethod
+    @functools.lru_cache(maxsize=64)
+    def _mask(nb_slots: int, slot_range: range | None) -> int:
+        if slot_range is None:
+            return (1 << nb_slots) - 1
+        return sum(1 << slot for slot in slot_range if 0 <= slot < nb_slots)
+
+    def is_full(self) -> bool:
+        mask = self._mask(self.nb_slots, None)
+        return self.used & mask == mask
+
+    def first_free(self, slot_range: range = None) -> int | None:
+        free = ~self.used & self._mask(self.nb_slots, slot_range)
+        return (free & -free).bit_length() - 1 if free else None
+
+    def reserve(self, slot: int):
+        self.used |= 1 << slot
+
+    def release(self, slot: int):
+        self.used &= ~(1 << slot)
+
 
 class HIDDevice(QObject, metaclass=_CachedDeviceMeta):
+    # Emitted whenever a control is registered or replaced, or when the connections to a control change
+    controls_changed = Signal()
+    # Streamed from another machine (see remote_devices), rather than read through SDL
+    is_remote = False
+
+    @classmethod
+    def find_device_index(cls, ident: str | vJoyId) -> DeviceIndex | None:
+        """SDL device index of the device, None if it isn't seen through SDL"""
+        return _SDL.find_hid_device_index(ident)
+
     def __init__(self,
                  *,
+                 ident: str | vJoyId,
                  parent: QObject = None,
-                 device_index: DeviceIndex):
+                 device_index: DeviceIndex | None):
         super().__init__(parent)
-        self._device_index = device_index
-        self._sdl = _SDL.open(device_index)
+        self.ident = ident
+        self._connections_changed_pending = False
+        self._device_index: DeviceIndex | None = None
+        self._instance_id: InstanceID | None = None
+        self._sdl: sdl2.SDL_Joystick | None = None
+        self._name = ''
+        self.state: DeviceState | None = None
+        if device_index is not None:
+            self._open(device_index)
         self.axis: dict[int, InputAxis] = dict()
         self.buttons: dict[int, InputButton] = dict()
         # self.hats: dict[int, PhysicalHat] = dict()
@@ -48,7 +104,21 @@ class HIDDevice(QObject, metaclass=_CachedDeviceMeta):
         return f'<HIDDevice {self.name}>'
 
     def __del__(self):
-        sdl2.SDL_JoystickClose(self._sdl)
+        if self._sdl is not None:
+            sdl2.SDL_JoystickClose(self._sdl)
+
+    def _open(self, device_index: DeviceIndex):
+        self._sdl = _SDL.open(device_index)
+        instance_id = sdl2.SDL_JoystickInstanceID(self._sdl)
+        if instance_id < 0:
+            raise SDLError(sdl2.SDL_GetError())
+        name = sdl2.SDL_JoystickName(self._sdl)
+        if not name:
+            raise SDLError(sdl2.SDL_GetError())
+        self._device_index = device_index
+        self._instance_id = InstanceID(instance_id)
+        self._name = name.decode()
+        self.state = DeviceState.read(self._sdl)
 
     @property
     def device_index(self) -> DeviceIndex:
@@ -56,17 +126,36 @@ class HIDDevice(QObject, metaclass=_CachedDeviceMeta):
 
     @property
     def instance_id(self) -> InstanceID:
-        instance_id = sdl2.SDL_JoystickInstanceID(self._sdl)
-        if instance_id < 0:
-            raise SDLError(sdl2.SDL_GetError())
-        return InstanceID(instance_id)
+        """SDL instance id of the device. It changes each time the device is unplugged and plugged back in."""
+        return self._instance_id
+
+    @property
+    def sdl_joystick(self) -> sdl2.SDL_Joystick | None:
+        """The SDL handle of the device, None while it is unplugged"""
+        return self._sdl
+
+    @property
+    def is_attached(self) -> bool:
+        return self._sdl is not None
+
+    def matches(self, device_index: DeviceIndex) -> bool:
+        """Checks whether the device at this SDL device index is this device (e.g. after a replug)"""
+        return _SDL.is_hid_device(device_index, self.ident)
+
+    def detach(self):
+        """Closes the device after it has been unplugged. The controls are kept as they are, with their connections."""
+        if self._sdl is not None:
+            sdl2.SDL_JoystickClose(self._sdl)
+            self._sdl = None
+
+    def reattach(self, device_index: DeviceIndex):
+        """Re-opens the device after it has been plugged back in, under its new device index and instance id"""
+        self.detach()
+        self._open(device_index)
 
     @property
     def name(self) -> str:
-        name = sdl2.SDL_JoystickName(self._sdl)
-        if not name:
-            raise SDLError(sdl2.SDL_GetError())
-        return name.decode()
+        return self._name
 
     @property
     def nb_axes(self) -> int:
@@ -96,35 +185,85 @@ class HIDDevice(QObject, metaclass=_CachedDeviceMeta):
             raise SDLError(sdl2.SDL_GetError())
         return nb_hats
 
+    def notify_connections_changed(self):
+        """Called when controls are registered, and by the controls of this device when their connections change,
+        from connectNotify() and disconnectNotify(), which may run with Qt internal mutexes locked.
+        controls_changed is emitted later, once for all the changes made in the meantime."""
+        if self._connections_changed_pending:
+            return
+        self._connections_changed_pending = True
+        try:
+            QMetaObject.invokeMethod(self, '_emit_controls_changed', Qt.QueuedConnection)
+        except RuntimeError:
+            pass  # Already deleted, during shutdown
+
+    @Slot()
+    def _emit_controls_changed(self):
+        self._connections_changed_pending = False
+        self.controls_changed.emit()
+
+    def snapshot(self) -> DeviceStateSnapshot:
+        """Immutable copy of the state of all the controls of this device, taken at once"""
+        return self.state.snapshot()
+
     def get_axis_value(self, i: int) -> float:
-        # (-32768 to 32767), 0 on error
-        value = sdl2.SDL_JoystickGetAxis(self._sdl, i)
-        if value == 0:
-            raise SDLError(sdl2.SDL_GetError())
-        return 2 * (value + 0x8000) / 0xFFFF - 1
+        return self.state.axis_value(i)
 
     def register_axis(self, axis_id: int) -> InputAxis:
         if axis_id not in self.axis:
             self.axis[axis_id] = InputAxis(device=self, axis_id=axis_id)
+            self.notify_connections_changed()
         return self.axis[axis_id]
 
     def get_button_state(self, i: int) -> bool:
-        return sdl2.SDL_JoystickGetButton(self._sdl, i) == sdl2.SDL_PRESSED
+        return self.state.button_state(i)
 
     def register_button(self, button_id: int) -> InputButton:
         if button_id not in self.buttons:
             self.buttons[button_id] = InputButton(device=self, button_id=button_id)
+            self.notify_connections_changed()
         return self.buttons[button_id]
 
 
 class VirtualDevice(HIDDevice):
+    # Where the writes end up, for all the virtual devices (see output_backends).
+    # To be set before the first virtual device is created, e.g. with HIDEventLoop(output_backend=...)
+    output_backend: type[OutputBackend] = VJoyDevice
+    # Publication of the output state of all the virtual devices, if enabled (see state_publication)
+    state_publisher: StatePublisher | None = None
+    # Emitted when a control is released, with its id, before controls_changed (which comes later, see release_axis())
+    axis_released = Signal(int)
+    button_released = Signal(int)
+    # Allocation cursors : the devices before them (in available_vjoy_ids() order) have no free axis / button left
+    _first_free_axis_device = 0
+    _first_free_button_device = 0
+
+    @classmethod
+    def find_device_index(cls, ident: vJoyId) -> DeviceIndex | None:
+        # The devices of a headless output backend aren't seen through SDL
+        return None if cls.output_backend.is_headless() else _SDL.find_vjoy_device_index(ident)
+
+    @classmethod
+    def available_vjoy_ids(cls) -> Iterable[vJoyId]:
+        if cls.output_backend.is_headless():
+            return (vJoyId(vjoy_id) for vjoy_id in range(cls.output_backend.nb_devices))
+        return (vjoy_id for vjoy_id, _ in _SDL.vjoy_device_index_iterator())
+
+    @classmethod
+    def reset_allocation(cls):
+        """The next allocations scan all the devices again, e.g. once devices were forgotten"""
+        VirtualDevice._first_free_axis_device = 0
+        VirtualDevice._first_free_button_device = 0
+
     @classmethod
     def next_available_virtual_axis(cls,
                                     *,
                                     device_parent: QObject,
                                     enable_output: bool = False,
                                     device_ignore_list: set[vJoyId] = None) -> InputAxis | OutputAxis:
-        for vjoy_id, _ in _SDL.vjoy_device_index_iterator():
+        # The devices before the cursor are full : they are skipped without even being looked up
+        first = VirtualDevice._first_free_axis_device
+        for position, vjoy_id in enumerate(itertools.islice(cls.available_vjoy_ids(), first, None), start=first):
             # First check if this device is in the user's ignore list
             if device_ignore_list is not None and vjoy_id in device_ignore_list:
                 continue
@@ -132,13 +271,12 @@ class VirtualDevice(HIDDevice):
             device: VirtualDevice = VirtualDevice(ident=vjoy_id, parent=device_parent)
 
             # If all the axis of this device are already assigned, try the next one
-            if len(device.axis) == device.nb_axes:
+            if (next_axis_id := device._axis_slots.first_free()) is None:
+                if position == VirtualDevice._first_free_axis_device:
+                    VirtualDevice._first_free_axis_device += 1
                 continue
 
-            # Find the next available button id
-            next_axis_id = min(set(range(device.nb_axes)) - set(device.axis.keys()))
-
-            # Find and register the first available button in this device
+            # Register the first available axis of this device
             return device.register_axis(axis_id=next_axis_id,
                                         enable_output=enable_output)
 
@@ -151,7 +289,9 @@ class VirtualDevice(HIDDevice):
                                       enable_output: bool = False,
                                       device_ignore_list: set[vJoyId] = None,
                                       button_range: range = None) -> InputButton | OutputButton:
-        for vjoy_id, _ in _SDL.vjoy_device_index_iterator():
+        # The devices before the cursor are full : they are skipped without even being looked up
+        first = VirtualDevice._first_free_button_device
+        for position, vjoy_id in enumerate(itertools.islice(cls.available_vjoy_ids(), first, None), start=first):
             # First check if this device is in the user's ignore list
             if device_ignore_list is not None and vjoy_id in device_ignore_list:
                 continue
@@ -159,17 +299,16 @@ class VirtualDevice(HIDDevice):
             device: VirtualDevice = VirtualDevice(ident=vjoy_id, parent=device_parent)
 
             # If all the buttons of this device are already assigned, try the next one
-            if len(device.buttons) == device.nb_buttons:
+            if device._button_slots.is_full():
+                if position == VirtualDevice._first_free_button_device:
+                    VirtualDevice._first_free_button_device += 1
                 continue
 
-            # Find the next available button id
-            next_button_id = min(set(range(device.nb_buttons)) - set(device.buttons.keys()))
-
-            # If a button_range was provided, ensure the button is part of it
-            if button_range is not None and next_button_id not in button_range:
+            # If a button_range was provided, the button has to be part of it
+            if (next_button_id := device._button_slots.first_free(button_range)) is None:
                 continue
 
-            # Otherwise find and register the first available button in this device
+            # Register the first available button of this device
             return device.register_button(button_id=next_button_id,
                                           enable_output=enable_output)
 
@@ -179,13 +318,25 @@ class VirtualDevice(HIDDevice):
                  *,
                  ident: vJoyId,
                  parent: QObject = None,
-                 device_index: DeviceIndex):
-        super().__init__(parent=parent, device_index=device_index)
+                 device_index: DeviceIndex | None):
+        super().__init__(ident=ident, parent=parent, device_index=device_index)
         self.vjoy_id: vJoyId = ident
-        self._vjoy: VJoyDevice | None = None
+        self._output: OutputBackend | None = None
+        self._headless = device_index is None
+        if self._headless:
+            self._open_headless()
+        self._max_axis_rate: float | None = None
+        self._output_deadband = 0
+        self._batched_output = False
+        self._output_flush_pending = False
+        self._output_flush_timer: QTimer | None = None
+        self._output_stats_start: tuple[float, int, int] = (time.perf_counter(), 0, 0)
         self.axis: dict[int, InputAxis | OutputAxis] = dict()
         self.buttons: dict[int, InputButton | OutputButton] = dict()
         # self.hats: dict[int, VirtualHat] = dict()
+        # The ids taken by a control, see next_available_virtual_axis() / next_available_virtual_button()
+        self._axis_slots = _SlotBitmap(self.nb_axes)
+        self._button_slots = _SlotBitmap(self.nb_buttons)
 
     def __repr__(self):
         return f'<VirtualDevice {self.name}>'
@@ -194,52 +345,260 @@ class VirtualDevice(HIDDevice):
     def name(self) -> str:
         return f'{super().name} #{self.vjoy_id + 1}'
 
-    def set_axis(self, axis_id: int, value: float):
-        if self._vjoy is None:
-            raise AttributeError(f"Output has not been enabled for {self}")
-        self._vjoy.set_axis(AxisID(axis_id), value)
+    def _open_headless(self):
+        # Not seen through SDL : a negative instance id never matches any SDL event,
+        # and the state mirrors what is written to the device instead (see _mirror_output())
+        self._instance_id = InstanceID(-1 - self.vjoy_id)
+        self._name = self.output_backend.device_name
+        self.state = DeviceState(nb_axes=self.output_backend.nb_axes, nb_buttons=self.output_backend.nb_buttons)
 
-    def register_axis(self, axis_id: int, *, enable_output: bool = False) -> InputAxis | OutputAxis:
+    def matches(self, device_index: DeviceIndex) -> bool:
+        return _SDL.get_vjoy_id(device_index) == self.vjoy_id
+
+    @property
+    def is_headless(self) -> bool:
+        return self._headless
+
+    @property
+    def nb_axes(self) -> int:
+        return self.output_backend.nb_axes if self._headless else super().nb_axes
+
+    @property
+    def nb_balls(self) -> int:
+        return 0 if self._headless else super().nb_balls
+
+    @property
+    def nb_buttons(self) -> int:
+        return self.output_backend.nb_buttons if self._headless else super().nb_buttons
+
+    @property
+    def nb_hats(self) -> int:
+        return 0 if self._headless else super().nb_hats
+
+    @property
+    def max_axis_rate(self) -> float | None:
+        """Default maximum output rate (writes per second) of the axis of this device, None if unlimited."""
+        return self._max_axis_rate
+
+    @max_axis_rate.setter
+    def max_axis_rate(self, max_rate: float | None):
+        self._max_axis_rate = max_rate
+        for axis in self.axis.values():
+            if isinstance(axis, OutputAxis):
+                axis.max_rate = max_rate
+
+    @property
+    def output_deadband(self) -> int:
+        """Axis moves smaller than or equal to this, in vJoy units (1/0x8000 of the axis range), are not written.
+        Writes which wouldn't change the output at all are never written, whatever the deadband."""
+        return self._output_deadband
+
+    @output_deadband.setter
+    def output_deadband(self, deadband: int):
+        if deadband < 0:
+            raise ValueError(f"Invalid output deadband for {self}: {deadband}")
+        self._output_deadband = deadband
+        if self._output is not None:
+            self._output.deadband = deadband
+
+    @property
+    def suppressed_axis_writes(self) -> int:
+        """Number of axis writes dropped because they wouldn't change the output (or were within the deadband)"""
+        return self._output.nb_suppressed_axis_writes if self._output is not None else 0
+
+    @property
+    def suppressed_button_writes(self) -> int:
+        """Number of button writes dropped because the button was already in that state"""
+        return self._output.nb_suppressed_button_writes if self._output is not None else 0
+
+    @property
+    def batched_output(self) -> bool:
+        return self._batched_output
+
+    def set_batched_output(self, batched: bool = True, *, flush_interval: float = None):
+        """In batched mode, the writes to this device only update the vJoy position structure, which is sent to the
+        driver in a single call per flush, instead of one call per write. Flushes happen:
+        - at the end of each batch of events dispatched by the HIDEventLoop, for the inline writes (SDL thread),
+        - as soon as the main thread is done with the events it is processing, for the other writes,
+        - or only every 'flush_interval' seconds, if given."""
+        if self._output_flush_timer is not None:
+            self._output_flush_timer.stop()
+            self._output_flush_timer.deleteLater()
+            self._output_flush_timer = None
+        if batched and flush_interval is not None:
+            self._output_flush_timer = QTimer(self)
+            self._output_flush_timer.setTimerType(Qt.PreciseTimer)
+            self._output_flush_timer.setInterval(max(1, round(flush_interval * 1000)))
+            self._output_flush_timer.timeout.connect(self._on_output_flush_due)
+            self._output_flush_timer.start()
+
+        self._batched_output = batched
+        if self._output is not None:
+            self._output.batched = batched
+        self._reset_output_stats()
+        self.controls_changed.emit()
+
+    def flush_output(self) -> bool:
+        """Sends the pending writes to the driver, in batched mode. Returns False if there was nothing to send."""
+        return self._output.flush() if self._output is not None else False
+
+    @property
+    def output(self) -> OutputBackend | None:
+        """The output backend of this device, None until output is enabled for one of its controls"""
+        return self._output
+
+    def output_write_latency(self) -> dict[str, float]:
+        """Duration of the calls writing to the output backend (see LatencyHistogram.summary())"""
+        return self._output.write_latencies.summary() if self._output is not None else dict()
+
+    @property
+    def driver_calls_saved_per_second(self) -> float:
+        """Driver calls avoided by the batched mode, per second, since it was last enabled or disabled"""
+        if self._output is None:
+            return 0.0
+        start, nb_writes, nb_driver_calls = self._output_stats_start
+        nb_saved = (self._output.nb_writes - nb_writes) - (self._output.nb_driver_calls - nb_driver_calls)
+        return nb_saved / max(1e-9, time.perf_counter() - start)
+
+    def _reset_output_stats(self):
+        self._output_stats_start = (time.perf_counter(),
+                                    self._output.nb_writes if self._output is not None else 0,
+                                    self._output.nb_driver_calls if self._output is not None else 0)
+
+    def _schedule_output_flush(self):
+        if self._output_flush_pending or self._output_flush_timer is not None:
+            return
+        self._output_flush_pending = True
+        QMetaObject.invokeMethod(self, '_on_output_flush_due', Qt.QueuedConnection)
+
+    @Slot()
+    def _on_output_flush_due(self):
+        self._output_flush_pending = False
+        self.flush_output()
+
+    def _enable_output(self):
         # Only open the vjoy device if we need output for at least one control
         # Otherwise, reading it with the SDL is enough, no need to reserve it
-        if enable_output and self._vjoy is None:
-            self._vjoy = VJoyDevice(self.vjoy_id)
+        if self._output is None:
+            self._output = self.output_backend(self.vjoy_id)
+            self._output.batched = self._batched_output
+            self._output.deadband = self._output_deadband
+            self._output.attach_publisher(self.state_publisher)
+            self._reset_output_stats()
+
+    def set_axis(self, axis_id: int, value: float) -> bool:
+        """Returns True if the write was suppressed by the output backend : no-op, or within the deadband"""
+        if self._output is None:
+            raise AttributeError(f"Output has not been enabled for {self}")
+        if self._output.set_axis(AxisID(axis_id), value):
+            return True
+        if self._headless:
+            self._mirror_output(axis_id=axis_id)
+        if self._batched_output:
+            self._schedule_output_flush()
+        return False
+
+    def set_axis_raw(self, axis_id: int, value: int) -> bool:
+        """Same as set_axis(), with a value already in the vJoy int range [0x0000..0x8000] (see AxisTransform)"""
+        if self._output is None:
+            raise AttributeError(f"Output has not been enabled for {self}")
+        if self._output.set_axis_raw(AxisID(axis_id), value):
+            return True
+        if self._headless:
+            self._mirror_output(axis_id=axis_id)
+        if self._batched_output:
+            self._schedule_output_flush()
+        return False
+
+    def _mirror_output(self, *, axis_id: int = None, button_id: int = None):
+        """Headless devices : what is written to the device is what reading it returns"""
+        if axis_id is not None and axis_id < len(self.state.raw_axes):
+            self.state.raw_axes[axis_id] = min(0x7FFF, 2 * self._output.axes[axis_id] - 0x8000)
+        if button_id is not None:
+            if self._output.button_state(button_id):
+                self.state.buttons |= 1 << button_id
+            else:
+                self.state.buttons &= ~(1 << button_id)
 
-        output_now_enabled = self._vjoy is not None
+    def register_axis(self, axis_id: int, *, enable_output: bool = False) -> InputAxis | OutputAxis:
+        # New controls have no receiver yet : the dispatch table is only rebuilt later, once for many registrations
+        changed = self._register_output(enable_output)
 
         if axis_id not in self.axis:
-            cls = OutputAxis if output_now_enabled else InputAxis
-            self.axis[axis_id] = cls(device=self, axis_id=axis_id)
-
-        if output_now_enabled:
-            self._enable_all_control_outputs()
+            if self._output is not None:
+                self.axis[axis_id] = OutputAxis(device=self, axis_id=axis_id, max_rate=self._max_axis_rate)
+            else:
+                self.axis[axis_id] = InputAxis(device=self, axis_id=axis_id)
+            self._axis_slots.reserve(axis_id)
+            changed = True
 
+        if changed:
+            self.notify_connections_changed()
         return self.axis[axis_id]
 
-    def set_button(self, button_id: int, value: bool):
-        if self._vjoy is None:
+    def set_button(self, button_id: int, value: bool) -> bool:
+        """Returns True if the write was suppressed by the output backend : same state"""
+        if self._output is None:
             raise AttributeError(f"Output has not been enabled for {self}")
-        self._vjoy.set_button(button_id, value)
+        if self._output.set_button(button_id, value):
+            return True
+        if self._headless:
+            self._mirror_output(button_id=button_id)
+        if self._batched_output:
+            self._schedule_output_flush()
+        return False
 
     def register_button(self, button_id: int, *, enable_output: bool = False) -> InputButton | OutputButton:
-        # Only open the vjoy device if we need output for at least one control
-        # Otherwise, reading it with the SDL is enough, no need to reserve it
-        if enable_output and self._vjoy is None:
-            self._vjoy = VJoyDevice(self.vjoy_id)
-
-        output_now_enabled = self._vjoy is not None
+        changed = self._register_output(enable_output)
 
         if button_id not in self.buttons:
-            cls = OutputButton if output_now_enabled else InputButton
+            cls = OutputButton if self._output is not None else InputButton
             self.buttons[button_id] = cls(device=self, button_id=button_id)
+            self._button_slots.reserve(button_id)
+            changed = True
 
-        # Ensure the output is enabled for all buttons if requested now, even if it was not requested the first time
-        # If output is not requested now, but it was before, then leave them enabled
-        if output_now_enabled:
-            self._enable_all_control_outputs()
-
+        if changed:
+            self.notify_connections_changed()
         return self.buttons[button_id]
 
+    def _register_output(self, enable_output: bool) -> bool:
+        """Enables the output if requested now, for all the controls, even if it was not requested the first time.
+        If output is not requested now, but it was before, then leave them enabled.
+        Returns True if the output was enabled now : the controls registered so far were all replaced."""
+        if not enable_output or self._output is not None:
+            return False
+        self._enable_output()
+        self._enable_all_control_outputs()
+        return True
+
+    def release_axis(self, axis_id: int):
+        """Unregisters an axis, centered first if it's an output : its id can be allocated again.
+        The control is deleted, it must not be used anymore.
+        axis_released is emitted at once, controls_changed later, once for all the releases made in the meantime."""
+        if (axis := self.axis.pop(axis_id, None)) is None:
+            return
+        if self._output is not None:  # then all the controls of the device are outputs
+            self.set_axis(axis_id, 0.0)
+        axis.deleteLater()
+        self._axis_slots.release(axis_id)
+        VirtualDevice._first_free_axis_device = 0  # rare : the next allocation rescans the devices once
+        self.axis_released.emit(axis_id)
+        self.notify_connections_changed()
+
+    def release_button(self, button_id: int):
+        """Unregisters a button, released first if it's an output : its id can be allocated again.
+        The control is deleted, it must not be used anymore.
+        button_released is emitted at once, controls_changed later, as for release_axis()."""
+        if (button := self.buttons.pop(button_id, None)) is None:
+            return
+        if self._output is not None:  # then all the controls of the device are outputs
+            self.set_button(button_id, False)
+        button.deleteLater()
+        self._button_slots.release(button_id)
+        VirtualDevice._first_free_button_device = 0  # rare : the next allocation rescans the devices once
+        self.button_released.emit(button_id)
+        self.notify_connections_changed()
+
     def _enable_all_control_outputs(self):
         # Ensure the output is enabled for all controls if requested now, even if it was not requested the first time
         # If output is not requested now, but it was before, then leave them enabled
@@ -254,5 +613,5 @@ class VirtualDevice(HIDDevice):
             axis = self.axis[i]
             if isinstance(axis, OutputAxis):
                 continue
-            self.axis[i] = OutputAxis(device=self, axis_id=i)
+            self.axis[i] = OutputAxis(device=self, axis_id=i, max_rate=self._max_axis_rate)
             axis.deleteLater()
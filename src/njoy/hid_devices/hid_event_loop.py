@@ -1,51 +1,226 @@
 from __future__ import annotations  # PEP 563: Postponed evaluation of annotations
 
-import collections
 import ctypes
+import enum
+import functools
 import sdl2
-import sdl2.ext
+import time
 import typing
 
+from .hid_controls import OutputAxis
+from .device_registry import DeviceRegistry
+from .device_state import DeviceState
+from .event_recording import EventRecorder
 from .hid_device import HIDDevice, VirtualDevice
-from .sdl_interface import SDLError
+from .hid_polling import PollPlan, check_polling_available
+from .sdl_interface import DeviceIndex, InstanceID, SDLError, _SDL
+from .state_publication import StatePublisher
 from .vjoy_interface import vJoyId
-from PySide6.QtCore import QObject, Slot, QThread
+from njoy.core import latency
+from njoy.startup_profile import profiled
+from PySide6.QtCore import QObject, Qt, Signal, Slot, QThread
 
 if typing.TYPE_CHECKING:
-    from njoy.hid_devices.hid_controls import InputAxis, OutputAxis
+    from pathlib import Path
+    from njoy.hid_devices.hid_controls import InputAxis
     from njoy.hid_devices.hid_controls import InputButton, OutputButton
+    from njoy.hid_devices.output_backends import OutputBackend
+
+
+class ControlKind(enum.IntEnum):
+    AXIS = 0
+    BUTTON = 1
+    HAT = 2
+
+
+def control_key(instance_id: InstanceID, kind: ControlKind, control_id: int) -> int:
+    """Packs a control address into a single int, used as key of the dispatch table.
+    SDL control indexes are 8 bits wide, the kind takes the next 2 bits, and the instance id the rest."""
+    return (instance_id << 10) | (kind << 8) | control_id
 
 
 class HIDEventLoop(QObject):
-    def __init__(self):
+    # Emitted (from the SDL thread) when a registered device is unplugged, or plugged back in
+    device_detached = Signal(QObject)
+    device_attached = Signal(QObject)
+
+    # Event categories we never use : disabled once and for all
+    __UNUSED_EVENT_TYPES__ = (sdl2.SDL_JOYBALLMOTION,
+                              sdl2.SDL_JOYBATTERYUPDATED,
+                              sdl2.SDL_CONTROLLERAXISMOTION,
+                              sdl2.SDL_CONTROLLERBUTTONDOWN,
+                              sdl2.SDL_CONTROLLERBUTTONUP,
+                              sdl2.SDL_CONTROLLERDEVICEADDED,
+                              sdl2.SDL_CONTROLLERDEVICEREMOVED,
+                              sdl2.SDL_CONTROLLERDEVICEREMAPPED,
+                              sdl2.SDL_CONTROLLERTOUCHPADDOWN,
+                              sdl2.SDL_CONTROLLERTOUCHPADMOTION,
+                              sdl2.SDL_CONTROLLERTOUCHPADUP,
+                              sdl2.SDL_CONTROLLERSENSORUPDATE,
+                              sdl2.SDL_SENSORUPDATE)
+    __CONTROL_EVENT_TYPES__ = (sdl2.SDL_JOYAXISMOTION,
+                               sdl2.SDL_JOYHATMOTION,
+                               sdl2.SDL_JOYBUTTONDOWN,
+                               sdl2.SDL_JOYBUTTONUP)
+
+    @profiled
+    def __init__(self,
+                 *,
+                 batch_size: int | None = None,
+                 filter_events: bool = True,
+                 poll_rate: float | None = None,
+                 batched_output: bool = False,
+                 output_flush_interval: float = None,
+                 output_backend: type[OutputBackend] = None,
+                 publish_states: bool = False,
+                 device_cache_file: Path = None):
+        """batch_size enables the batched mode : after waking up on the first event, up to batch_size events
+        are drained from the SDL queue at once, and only the latest value of each axis is dispatched.
+        Leave it to None to dispatch every single event, one at a time.
+
+        filter_events drops the events of the controls nobody listens to before they are even queued by SDL,
+        and disables the event categories no control needs.
+
+        poll_rate replaces the event driven dispatch with a fixed rate one (in ticks per second) : on each tick,
+        all the registered controls are read from SDL at once, and only those which changed since the previous tick
+        are dispatched. Each tick costs the same, however noisy the devices are. Requires numpy.
+        batch_size and filter_events are meaningless in this mode, and ignored.
+
+        batched_output and output_flush_interval are the defaults applied to the virtual devices,
+        see VirtualDevice.set_batched_output().
+
+        output_backend is where the writes to the virtual devices end up, vJoy by default. The headless backends
+        (see output_backends) don't need any driver, nor any virtual device seen through SDL.
+
+        publish_states publishes the output state of the virtual devices in shared memory, for other processes
+        to read (see state_publication.StateReader).
+
+        device_cache_file persists the list of the joysticks present between runs, so that the devices don't have
+        to be enumerated again at startup as long as the same ones are plugged in.
+
+        output_backend, publish_states and device_cache_file are process-wide : like the devices themselves, they are
+        shared by all the loops (class attributes of VirtualDevice and _SDL). They are restored by stop()."""
         super().__init__(parent=None)
-        self._controls = collections.defaultdict(lambda: {'axis': dict(),
-                                                          'buttons': dict(),
-                                                          'hats': dict()})
+        _SDL.init()
+        self._previous_settings = (VirtualDevice.output_backend, VirtualDevice.state_publisher, _SDL.device_cache_file)
+        _SDL.device_cache_file = device_cache_file
+        if output_backend is not None:
+            VirtualDevice.output_backend = output_backend
+        if publish_states and VirtualDevice.state_publisher is None:
+            VirtualDevice.state_publisher = StatePublisher()
+        self._batch_size = batch_size
+        if poll_rate is not None:
+            if poll_rate <= 0:
+                raise ValueError(f"Invalid poll rate: {poll_rate}")
+            check_polling_available()
+            filter_events = False
+        self._poll_rate = poll_rate
+        self._batched_output = batched_output
+        self._output_flush_interval = output_flush_interval
+        self._poll_ticks = 0
+        self._poll_ticks_late = 0
+        self._events_filtered = 0
+        self._events_received = 0
+        self._events_coalesced = 0
+        self._events_dispatched = 0
+        self._recorder: EventRecorder | None = None
+        self._running = True
+        self._registry = DeviceRegistry()
+
+        # Read by the SDL thread, only ever replaced as a whole (never mutated in place) by the main thread
+        self._dispatch_table: dict[int, InputAxis | OutputAxis | InputButton | OutputButton] = dict()
+        self._device_states: dict[InstanceID, DeviceState] = dict()
+        self._batched_output_devices: tuple[VirtualDevice, ...] = ()
+        self._poll_plan: PollPlan | None = PollPlan([]) if poll_rate is not None else None
+
+        # Keep a reference on the ctypes callback, for as long as SDL may call it
+        self._event_filter: sdl2.SDL_EventFilter | None = None
+        if filter_events:
+            for event_type in self.__UNUSED_EVENT_TYPES__:
+                sdl2.SDL_EventState(event_type, sdl2.SDL_IGNORE)
+            self._event_filter = sdl2.SDL_EventFilter(self._filter_event)
+            sdl2.SDL_SetEventFilter(self._event_filter, None)
+            self._update_event_states()
+        elif poll_rate is not None:
+            # The controls are read directly : only the hot-plug events are still needed
+            for event_type in (*self.__UNUSED_EVENT_TYPES__, *self.__CONTROL_EVENT_TYPES__):
+                sdl2.SDL_EventState(event_type, sdl2.SDL_IGNORE)
 
         self._sdl_thread = QThread()
         self.moveToThread(self._sdl_thread)
         self._sdl_thread.started.connect(self.run)
         self._sdl_thread.start()
 
+    @property
+    def batch_size(self) -> int | None:
+        return self._batch_size
+
+    @property
+    def poll_rate(self) -> float | None:
+        return self._poll_rate
+
+    @property
+    def poll_ticks(self) -> int:
+        """Number of ticks run so far, in the polling mode."""
+        return self._poll_ticks
+
+    @property
+    def poll_ticks_late(self) -> int:
+        """Number of ticks which took longer than the poll period, in the polling mode."""
+        return self._poll_ticks_late
+
+    @property
+    def events_filtered(self) -> int:
+        """Number of joystick events dropped by the event filter, before reaching the SDL queue."""
+        return self._events_filtered
+
+    @property
+    def events_received(self) -> int:
+        """Number of joystick events read from the SDL queue so far."""
+        return self._events_received
+
+    @property
+    def events_coalesced(self) -> int:
+        """Number of axis events dropped because a more recent value for the same axis was in the same batch."""
+        return self._events_coalesced
+
+    @property
+    def events_dispatched(self) -> int:
+        """Number of events actually handed over to a registered control."""
+        return self._events_dispatched
+
+    def attach_recorder(self, recorder: EventRecorder | None):
+        """Every joystick event received from now on is also sent to the recorder (None to detach it).
+        Events are recorded before being coalesced, if the batched mode is enabled, and are not filtered."""
+        self._recorder = recorder
+        self._update_event_states()
+
     def physical_axis(self, ident: str, axis_id: int) -> InputAxis:
         device: HIDDevice = HIDDevice(ident, parent=self)
-        axis = device.register_axis(axis_id)
-        self._controls[device.instance_id]['axis'][axis_id] = axis
-        return axis
+        self._register_device(device)
+        return device.register_axis(axis_id)
 
     def physical_button(self, ident: str, button_id: int) -> InputButton:
         """Find and return a ReadOnlyButton instance for button 'BUTTON' of device 'IDENT'.
         Physical buttons are read-only, they have no 'switch' or 'pulse' slot, they only emit signals."""
         device: HIDDevice = HIDDevice(ident, parent=self)
-        button = device.register_button(button_id)
-        self._controls[device.instance_id]['buttons'][button_id] = button
-        return button
+        self._register_device(device)
+        return device.register_button(button_id)
 
-    def virtual_axis(self, ident: vJoyId, axis_id: int, *, enable_output: bool = False) -> InputAxis | OutputAxis:
+    def virtual_axis(self,
+                     ident: vJoyId,
+                     axis_id: int,
+                     *,
+                     enable_output: bool = False,
+                     max_rate: float = None) -> InputAxis | OutputAxis:
+        """If 'max_rate' is set, the axis output is throttled to that many writes per second (latest value wins)."""
         device: VirtualDevice = VirtualDevice(ident, parent=self)
+        self._register_device(device)
         axis = device.register_axis(axis_id, enable_output=enable_output)
-        self._controls[device.instance_id]['axis'][axis_id] = axis
+        if max_rate is not None:
+            if not isinstance(axis, OutputAxis):
+                raise ValueError(f"Cannot limit the output rate of {axis}: output is not enabled")
+            axis.max_rate = max_rate
         return axis
 
     def virtual_button(self, ident: vJoyId, button_id: int, *, enable_output: bool = False) -> InputButton | OutputButton:
@@ -55,55 +230,309 @@ class HIDEventLoop(QObject):
         a signal to its 'switch' or 'pulse' slots, depending on how you want to control it.
         """
         device: VirtualDevice = VirtualDevice(ident, parent=self)
-        button = device.register_button(button_id, enable_output=enable_output)
-        self._controls[device.instance_id]['buttons'][button_id] = button
-        return button
+        self._register_device(device)
+        return device.register_button(button_id, enable_output=enable_output)
 
     def next_virtual_input_axis(self, *, device_ignore_list: set[vJoyId] = None) -> InputAxis:
-        return VirtualDevice.next_available_virtual_axis(device_parent=self,
+        axis = VirtualDevice.next_available_virtual_axis(device_parent=self,
                                                          enable_output=False,
                                                          device_ignore_list=device_ignore_list)
+        self._register_device(axis.device)
+        return axis
 
     def next_virtual_input_button(self,
                                   *,
                                   device_ignore_list: set[vJoyId] = None,
                                   button_range: range = None) -> InputButton:
-        return VirtualDevice.next_available_virtual_button(device_parent=self,
-                                                           enable_output=False,
-                                                           device_ignore_list=device_ignore_list,
-                                                           button_range=button_range)
+        button = VirtualDevice.next_available_virtual_button(device_parent=self,
+                                                             enable_output=False,
+                                                             device_ignore_list=device_ignore_list,
+                                                             button_range=button_range)
+        self._register_device(button.device)
+        return button
 
     def next_virtual_output_axis(self, *, device_ignore_list: set[vJoyId] = None) -> OutputAxis:
-        return VirtualDevice.next_available_virtual_axis(device_parent=self,
+        axis = VirtualDevice.next_available_virtual_axis(device_parent=self,
                                                          enable_output=True,
                                                          device_ignore_list=device_ignore_list)
+        self._register_device(axis.device)
+        return axis
 
     def next_virtual_output_button(self,
                                    *,
                                    device_ignore_list: set[vJoyId] = None,
                                    button_range: range = None) -> OutputButton:
-        return VirtualDevice.next_available_virtual_button(device_parent=self,
-                                                           enable_output=True,
-                                                           device_ignore_list=device_ignore_list,
-                                                           button_range=button_range)
+        button = VirtualDevice.next_available_virtual_button(device_parent=self,
+                                                             enable_output=True,
+                                                             device_ignore_list=device_ignore_list,
+                                                             button_range=button_range)
+        self._register_device(button.device)
+        return button
+
+    @property
+    def registry(self) -> DeviceRegistry:
+        return self._registry
+
+    def _register_device(self, device: HIDDevice):
+        if not self._registry.register(device):
+            return
+        # Direct connections : this object lives in the SDL thread, which never returns to its Qt event loop
+        if isinstance(device, VirtualDevice):
+            if self._batched_output:
+                device.set_batched_output(flush_interval=self._output_flush_interval)
+            device.axis_released.connect(functools.partial(self._drop_control, device, ControlKind.AXIS),
+                                         Qt.DirectConnection)
+            device.button_released.connect(functools.partial(self._drop_control, device, ControlKind.BUTTON),
+                                           Qt.DirectConnection)
+        device.controls_changed.connect(self._rebuild_dispatch_table, Qt.DirectConnection)
+        self._rebuild_dispatch_table()
+
+    def _drop_control(self, device: VirtualDevice, kind: ControlKind, control_id: int):
+        """A released control is dropped from the dispatch table at once, without compiling the whole table again :
+        that's left to controls_changed, emitted once for all the releases (see VirtualDevice.release_axis())"""
+        with self._registry.lock():
+            key = control_key(device.instance_id, kind, control_id)
+            if key in self._dispatch_table:
+                dispatch_table = dict(self._dispatch_table)
+                del dispatch_table[key]
+                self._dispatch_table = dispatch_table
+
+    @Slot()
+    def _rebuild_dispatch_table(self):
+        """Compiles a flat dispatch table out of the controls registered on each device, and swaps it in.
+        Controls nobody is listening to are left out, so that their events are dropped after a single lookup."""
+        # Rebuilt by the main thread on registration, and by the SDL thread on hot-plug
+        with self._registry.lock():
+            dispatch_table = dict()
+            device_states = dict()
+            for instance_id, device in self._registry.attached_devices():
+                device_states[instance_id] = device.state
+                for axis_id, axis in list(device.axis.items()):
+                    if axis.has_receivers():
+                        dispatch_table[control_key(instance_id, ControlKind.AXIS, axis_id)] = axis
+                for button_id, button in list(device.buttons.items()):
+                    if button.has_receivers():
+                        dispatch_table[control_key(instance_id, ControlKind.BUTTON, button_id)] = button
+            self._dispatch_table = dispatch_table
+            self._device_states = device_states
+            self._batched_output_devices = tuple(device
+                                                 for _, device in self._registry.attached_devices()
+                                                 if isinstance(device, VirtualDevice) and device.batched_output)
+            if self._poll_plan is not None:
+                self._poll_plan = PollPlan(self._registry.attached_devices())
+            self._update_event_states()
+
+    def _update_event_states(self):
+        """Only let SDL generate the kinds of joystick events some control is listening to,
+        or that are needed to keep the state of the registered controls up to date"""
+        if self._event_filter is None:
+            return
+        listened_kinds = {key >> 8 & 0x3 for key in self._dispatch_table}
+        for _, device in self._registry.attached_devices():
+            if device.axis:
+                listened_kinds.add(ControlKind.AXIS)
+            if device.buttons:
+                listened_kinds.add(ControlKind.BUTTON)
+        record_all = self._recorder is not None
+        for kind, event_types in ((ControlKind.AXIS, (sdl2.SDL_JOYAXISMOTION,)),
+                                  (ControlKind.BUTTON, (sdl2.SDL_JOYBUTTONDOWN, sdl2.SDL_JOYBUTTONUP)),
+                                  (ControlKind.HAT, (sdl2.SDL_JOYHATMOTION,))):
+            state = sdl2.SDL_ENABLE if record_all or kind in listened_kinds else sdl2.SDL_IGNORE
+            for event_type in event_types:
+                sdl2.SDL_EventState(event_type, state)
+
+    def _filter_event(self, _userdata: ctypes.c_void_p, event_ptr: ctypes.POINTER(sdl2.SDL_Event)) -> int:
+        """Called by SDL, in whichever thread pumps or pushes the event, before queueing it.
+        Returns 0 to drop the event, 1 to queue it.
+        It sees every joystick event : this is where the device states are updated when filtering."""
+        event = event_ptr.contents
+        if sdl2.SDL_JOYAXISMOTION <= event.type <= sdl2.SDL_JOYBUTTONUP:
+            # 'which' is at the same place in all joystick events
+            if (state := self._device_states.get(event.jaxis.which)) is not None:
+                state.update(event)
+        if event.type == sdl2.SDL_JOYAXISMOTION:
+            key = (event.jaxis.which << 10) | event.jaxis.axis
+        elif event.type == sdl2.SDL_JOYBUTTONDOWN or event.type == sdl2.SDL_JOYBUTTONUP:
+            key = (event.jbutton.which << 10) | 0x100 | event.jbutton.button
+        elif event.type == sdl2.SDL_JOYHATMOTION:
+            key = (event.jhat.which << 10) | 0x200 | event.jhat.hat
+        else:
+            return 1
+
+        if key in self._dispatch_table or self._recorder is not None:
+            return 1
+        self._events_filtered += 1
+        return 0
 
     @Slot()
     def run(self):
+        if self._poll_rate is not None:
+            self._run_polled()
+        elif self._batch_size:
+            self._run_batched()
+        else:
+            self._run_unbatched()
+        if self._running:
+            raise SDLError(sdl2.SDL_GetError())
+
+    def stop(self):
+        """Stops dispatching events, and waits for the SDL thread to finish.
+        The virtual devices of a headless output backend are deleted, the next loop starts with new ones."""
+        self._running = False
+        if self._event_filter is not None:
+            sdl2.SDL_SetEventFilter(sdl2.SDL_EventFilter(), None)
+        wake_up_event = sdl2.SDL_Event()
+        wake_up_event.type = sdl2.SDL_USEREVENT
+        sdl2.SDL_PushEvent(ctypes.byref(wake_up_event))
+        self._sdl_thread.quit()
+        self._sdl_thread.wait()
+        if VirtualDevice.output_backend.is_headless():
+            # Nothing outlives the process in a headless backend : its devices are forgotten with the loop
+            for _, device in self._registry.attached_devices():
+                if isinstance(device, VirtualDevice):
+                    VirtualDevice.forget(device.ident)
+        VirtualDevice.reset_allocation()
+        VirtualDevice.output_backend, VirtualDevice.state_publisher, _SDL.device_cache_file = self._previous_settings
+
+    def _run_unbatched(self):
+        event = sdl2.SDL_Event()
+        while self._running and sdl2.SDL_WaitEvent(ctypes.byref(event)):
+            if sdl2.SDL_JOYAXISMOTION <= event.type <= sdl2.SDL_JOYBUTTONUP:
+                self._events_received += 1
+                if self._recorder is not None:
+                    self._recorder.record(event)
+                if self._event_filter is None and (state := self._device_states.get(event.jaxis.which)) is not None:
+                    state.update(event)
+                self._dispatch(event)
+                if self._batched_output_devices:
+                    self._flush_outputs()
+            elif event.type == sdl2.SDL_JOYDEVICEADDED or event.type == sdl2.SDL_JOYDEVICEREMOVED:
+                self._on_hot_plug(event)
+
+    def _run_batched(self):
+        # Preallocated once : the first slot receives the event we wake up on,
+        # the remaining ones are filled by draining the queue without waiting
+        events = (sdl2.SDL_Event * self._batch_size)()
+        remaining_events = ctypes.cast(ctypes.addressof(events) + ctypes.sizeof(sdl2.SDL_Event),
+                                       ctypes.POINTER(sdl2.SDL_Event))
+        while self._running and sdl2.SDL_WaitEvent(ctypes.byref(events[0])):
+            nb_events = sdl2.SDL_PeepEvents(remaining_events,
+                                            self._batch_size - 1,
+                                            sdl2.SDL_GETEVENT,
+                                            sdl2.SDL_FIRSTEVENT,
+                                            sdl2.SDL_LASTEVENT)
+            if nb_events < 0:
+                break
+            self._dispatch_batch(events, 1 + nb_events)
+            if self._batched_output_devices:
+                self._flush_outputs()
+
+    def _run_polled(self):
+        period_ns = round(1e9 / self._poll_rate)
+        hot_plug_events = (sdl2.SDL_Event * 16)()
         event = sdl2.SDL_Event()
-        while sdl2.SDL_WaitEvent(ctypes.byref(event)):
+        next_tick_ns = time.perf_counter_ns()
+        while self._running:
+            sdl2.SDL_JoystickUpdate()
+            while (nb_events := sdl2.SDL_PeepEvents(hot_plug_events,
+                                                    len(hot_plug_events),
+                                                    sdl2.SDL_GETEVENT,
+                                                    sdl2.SDL_JOYDEVICEADDED,
+                                                    sdl2.SDL_JOYDEVICEREMOVED)) > 0:
+                for i in range(nb_events):
+                    self._on_hot_plug(hot_plug_events[i])
+            if nb_events < 0:
+                break
+
+            # Changes are handed over as regular SDL events, so that they follow the same path as in the other modes
+            changed_axes, changed_buttons = self._poll_plan.poll()
+            event.common.timestamp = sdl2.SDL_GetTicks()
+            for instance_id, axis_id, value in changed_axes:
+                event.type = sdl2.SDL_JOYAXISMOTION
+                event.jaxis.which, event.jaxis.axis, event.jaxis.value = instance_id, axis_id, value
+                self._on_polled_event(event)
+            for instance_id, button_id, state in changed_buttons:
+                event.type = sdl2.SDL_JOYBUTTONDOWN if state else sdl2.SDL_JOYBUTTONUP
+                event.jbutton.which, event.jbutton.button, event.jbutton.state = instance_id, button_id, state
+                self._on_polled_event(event)
+            if self._batched_output_devices:
+                self._flush_outputs()
+            self._poll_ticks += 1
+
+            next_tick_ns += period_ns
+            if (remaining_ns := next_tick_ns - time.perf_counter_ns()) > 0:
+                time.sleep(remaining_ns / 1e9)
+            else:
+                # Don't try to catch up on the missed ticks, just start over from now
+                self._poll_ticks_late += 1
+                next_tick_ns = time.perf_counter_ns()
+
+    def _flush_outputs(self):
+        """Sends the inline writes of this batch of events (or tick) to the batched output devices"""
+        for device in self._batched_output_devices:
+            device.flush_output()
+
+    def _on_polled_event(self, event: sdl2.SDL_Event):
+        self._events_received += 1
+        if self._recorder is not None:
+            self._recorder.record(event)
+        if (state := self._device_states.get(event.jaxis.which)) is not None:
+            state.update(event)
+        self._dispatch(event)
+
+    def _dispatch_batch(self, events: ctypes.Array[sdl2.SDL_Event], nb_events: int):
+        # First pass : find the position of the most recent event of each axis in this batch
+        latest_axis_events: dict[int, int] = dict()
+        for i in range(nb_events):
+            event = events[i]
             if event.type == sdl2.SDL_JOYAXISMOTION:
-                if device := self._controls.get(event.jaxis.which):
-                    if control := device['axis'].get(event.jaxis.axis):
-                        control.process_event(event)
+                latest_axis_events[(event.jaxis.which << 10) | event.jaxis.axis] = i
+
+        # Second pass : dispatch in order, skipping the stale axis values.
+        # Buttons and hats are edges, not levels, so all of them are kept.
+        for i in range(nb_events):
+            event = events[i]
+            if not sdl2.SDL_JOYAXISMOTION <= event.type <= sdl2.SDL_JOYBUTTONUP:
+                if event.type == sdl2.SDL_JOYDEVICEADDED or event.type == sdl2.SDL_JOYDEVICEREMOVED:
+                    self._on_hot_plug(event)
+                continue
+            self._events_received += 1
+            if self._recorder is not None:
+                self._recorder.record(event)
+            if self._event_filter is None and (state := self._device_states.get(event.jaxis.which)) is not None:
+                state.update(event)
+            if event.type == sdl2.SDL_JOYAXISMOTION \
+                    and latest_axis_events[(event.jaxis.which << 10) | event.jaxis.axis] != i:
+                self._events_coalesced += 1
+                continue
+            self._dispatch(event)
 
-            elif event.type in {sdl2.SDL_JOYBUTTONDOWN, sdl2.SDL_JOYBUTTONUP}:
-                if device := self._controls.get(event.jbutton.which):
-                    if control := device['buttons'].get(event.jbutton.button):
-                        control.process_event(event)
+    def _on_hot_plug(self, event: sdl2.SDL_Event):
+        # Beware : 'which' is a device index for added devices, but an instance id for removed ones
+        if event.type == sdl2.SDL_JOYDEVICEADDED:
+            _SDL.on_device_added(DeviceIndex(event.jdevice.which))
+            if (device := self._registry.on_device_added(DeviceIndex(event.jdevice.which))) is not None:
+                self._rebuild_dispatch_table()
+                self.device_attached.emit(device)
+        else:
+            _SDL.invalidate_devices()
+            if (device := self._registry.on_device_removed(InstanceID(event.jdevice.which))) is not None:
+                self._rebuild_dispatch_table()
+                self.device_detached.emit(device)
 
-            elif event.type == sdl2.SDL_JOYHATMOTION:
-                if device := self._controls.get(event.jhat.which):
-                    if control := device['hats'].get(event.jhat.hat):
-                        control.process_event(event)
+    def _dispatch(self, event: sdl2.SDL_Event):
+        # Inlined control_key(), this is the hot path
+        if event.type == sdl2.SDL_JOYAXISMOTION:
+            key = (event.jaxis.which << 10) | event.jaxis.axis
+        elif event.type == sdl2.SDL_JOYBUTTONDOWN or event.type == sdl2.SDL_JOYBUTTONUP:
+            key = (event.jbutton.which << 10) | 0x100 | event.jbutton.button
+        elif event.type == sdl2.SDL_JOYHATMOTION:
+            key = (event.jhat.which << 10) | 0x200 | event.jhat.hat
+        else:
+            return
 
-        raise SDLError(sdl2.SDL_GetError())
+        if control := self._dispatch_table.get(key):
+            self._events_dispatched += 1
+            if latency.recorder is not None:
+                latency.recorder.on_dispatch(control, event.common.timestamp)
+            control.process_event(event)
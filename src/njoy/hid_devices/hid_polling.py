@@ -0,0 +1,80 @@
+from __future__ import annotations  # PEP 563: Postponed evaluation of annotations
+
+import array
+import sdl2
+import typing
+
+from .device_state import DeviceState
+
+if typing.TYPE_CHECKING:
+    import numpy
+    from typing import Callable
+    from .hid_device import HIDDevice
+    from .sdl_interface import InstanceID
+
+
+def check_polling_available():
+    """Imports numpy, on first use only : it's an optional dependency, only needed by the polling mode"""
+    global numpy  # pylint: disable=global-statement
+    try:
+        import numpy  # pylint: disable=import-outside-toplevel,redefined-outer-name
+    except ImportError as error:
+        raise ImportError("The polling mode requires numpy: pip install n-joy[polling]") from error
+
+
+class PollPlan:
+    """What the polling mode reads from SDL on each tick : every control registered on the attached devices,
+    flattened into preallocated arrays, so that the changes since the previous tick come out of a single diff.
+
+    A new plan is compiled each time the registered controls change, and swapped in as a whole.
+    Each control is read by a (read, source, instance id, control id) entry : read(source, control id) is
+    SDL_JoystickGetAxis() / SDL_JoystickGetButton() on the SDL joystick, or a lookup in the state of the remote
+    devices, which are updated by their receiver (see remote_devices)."""
+
+    def __init__(self, devices: list[tuple[InstanceID, HIDDevice]]):
+        self.axes: list[tuple[Callable[[object, int], int], object, InstanceID, int]] = list()
+        self.buttons: list[tuple[Callable[[object, int], int], object, InstanceID, int]] = list()
+        initial_axes = list()
+        initial_buttons = list()
+        for instance_id, device in devices:
+            if device.sdl_joystick is not None:
+                read_axis, axis_source = sdl2.SDL_JoystickGetAxis, device.sdl_joystick
+                read_button, button_source = sdl2.SDL_JoystickGetButton, device.sdl_joystick
+            elif device.is_remote:
+                read_axis, axis_source = array.array.__getitem__, device.state.raw_axes
+                read_button, button_source = DeviceState.button_state, device.state
+            else:
+                continue  # Headless virtual device, nothing to read
+            for axis_id in sorted(device.axis):
+                self.axes.append((read_axis, axis_source, instance_id, axis_id))
+                initial_axes.append(device.state.raw_axes[axis_id])
+            for button_id in sorted(device.buttons):
+                self.buttons.append((read_button, button_source, instance_id, button_id))
+                initial_buttons.append(device.state.button_state(button_id))
+
+        # Start from the device states, so that swapping a plan in doesn't dispatch anything by itself
+        self._previous_axes = numpy.array(initial_axes, dtype=numpy.int16)
+        self._current_axes = self._previous_axes.copy()
+        self._previous_buttons = numpy.array(initial_buttons, dtype=numpy.uint8)
+        self._current_buttons = self._previous_buttons.copy()
+
+    def poll(self) -> tuple[list[tuple[InstanceID, int, int]], list[tuple[InstanceID, int, int]]]:
+        """Reads all the controls of the plan (SDL_JoystickUpdate() must have been called first),
+        and returns the (instance id, control id, new value) of the axes and buttons which changed since last time."""
+        self._current_axes[:] = [read(source, axis_id) for read, source, _, axis_id in self.axes]
+        self._current_buttons[:] = [read(source, button_id) for read, source, _, button_id in self.buttons]
+
+        changed_axes = [(*self.axes[i][2:], value)
+                        for i, value in self._changes(self._current_axes, self._previous_axes)]
+        changed_buttons = [(*self.buttons[i][2:], value)
+                           for i, value in self._changes(self._current_buttons, self._previous_buttons)]
+
+        # The current values become the previous ones, the buffers are reused on the next tick
+        self._previous_axes, self._current_axes = self._current_axes, self._previous_axes
+        self._previous_buttons, self._current_buttons = self._current_buttons, self._previous_buttons
+        return changed_axes, changed_buttons
+
+    @staticmethod
+    def _changes(current: numpy.ndarray, previous: numpy.ndarray) -> list[tuple[int, int]]:
+        changed = numpy.flatnonzero(current != previous)
+        return list(zip(changed.tolist(), current[changed].tolist()))
@@ -0,0 +1,294 @@
+from __future__ import annotations  # PEP 563: Postponed evaluation of annotations
+
+import abc
+import array
+import collections
+import math
+import struct
+import threading
+import time
+import typing
+import weakref
+
+from multiprocessing import shared_memory
+from njoy.core.latency import LatencyHistogram
+
+if typing.TYPE_CHECKING:
+    from .state_publication import StatePublisher
+    from .vjoy_interface import AxisID, vJoyId
+
+# Where the writes to the virtual devices end up.
+# vJoy (see vjoy_interface.VJoyDevice) is the one used with the game. The other backends are headless stand-ins,
+# which don't need any driver, nor any device seen through SDL : the whole output path can run on any platform,
+# e.g. in CI and load tests. Select one with HIDEventLoop(output_backend=...) or Core(output_backend=...).
+
+
+class OutputBackend(abc.ABC):
+    """Output of a single virtual device.
+
+    The position of the device (axes and buttons) is kept here, whatever the backend, so that the writes which
+    wouldn't change anything can be dropped, and so that the batched mode only has to send it once per flush.
+    Subclasses only implement the calls actually writing something : _write_axis(), _write_button(), _write_pov()
+    and _write_position(). The duration of each of these calls is recorded in 'write_latencies'."""
+
+    # Name of the devices of a headless backend, None if the devices are seen through SDL (vJoy)
+    device_name: str | None = None
+    # Size of the devices of a headless backend
+    nb_devices = 16
+    nb_axes = 8
+    nb_buttons = 128
+
+    # Axes X to WHEEL, see AxisID
+    __NB_POSITION_AXES__ = 9
+    __NB_BUTTON_BLOCKS__ = 4
+    __NB_POVS__ = 4
+
+    def __init__(self, vjoy_id: vJoyId):
+        self.vjoy_id = vjoy_id
+        # Batched mode : the writes only update the position, sent at once by flush().
+        # The position is kept up to date in both modes, so that the mode can be switched at any time.
+        # The axis never written are sent centered.
+        self._batched = False
+        self._dirty = False
+        self._lock = threading.Lock()  # writes may come from the SDL thread (inline mappings) and the main thread
+        self.axes = array.array('l', [0x4000] * self.__NB_POSITION_AXES__)
+        self.button_blocks = [0] * self.__NB_BUTTON_BLOCKS__  # 32 buttons each, unsigned
+        self.povs = array.array('l', [-1] * self.__NB_POVS__)
+        self.publisher: StatePublisher | None = None
+        self.nb_writes = 0
+        self.nb_driver_calls = 0
+        self.write_latencies = LatencyHistogram()
+
+        # Writes which wouldn't change anything are dropped : same button state, same axis value, or an axis move
+        # within the deadband (in vjoy units), unless it reaches the center or one end of the axis.
+        # Only the axis values actually written are known, the buttons all start released.
+        self._written_axis_values: dict[AxisID, int] = dict()
+        self.deadband = 0
+        self.nb_suppressed_axis_writes = 0
+        self.nb_suppressed_button_writes = 0
+
+    @classmethod
+    def is_headless(cls) -> bool:
+        return cls.device_name is not None
+
+    def __repr__(self):
+        return f'<{self.__class__.__name__} #{self.vjoy_id + 1}>'
+
+    @property
+    def batched(self) -> bool:
+        return self._batched
+
+    @batched.setter
+    def batched(self, batched: bool):
+        self._batched = batched
+        if not batched:
+            self.flush()
+
+    def attach_publisher(self, publisher: StatePublisher | None):
+        """Publishes the state of the device on each write from now on (see state_publication)"""
+        with self._lock:
+            self.publisher = publisher
+            if publisher is not None:
+                publisher.publish(self)
+
+    def button_state(self, button_id: int) -> bool:
+        block, bit = divmod(button_id, 32)
+        return bool(self.button_blocks[block] >> bit & 1)
+
+    def flush(self) -> bool:
+        """Sends all the pending writes in a single call. Returns False if there was nothing to send."""
+        with self._lock:
+            if not self._dirty:
+                return False
+            self._dirty = False
+            self.nb_driver_calls += 1
+            start = time.perf_counter_ns()
+            self._write_position()
+            self.write_latencies.record(time.perf_counter_ns() - start)
+            return True
+
+    def close(self):
+        """Releases whatever the backend holds, it can't be written to anymore"""
+
+    def _store_button(self, button_id: int, state: bool) -> bool | None:
+        """Updates the position, returns True if the write is left to flush(), None if it is dropped.
+        The counters are updated here, with the lock held : the driver call itself is made without it."""
+        block, bit = divmod(button_id, 32)
+        with self._lock:
+            bits = self.button_blocks[block] | (1 << bit) if state else self.button_blocks[block] & ~(1 << bit)
+            if bits == self.button_blocks[block]:
+                self.nb_suppressed_button_writes += 1
+                return None
+            self.nb_writes += 1
+            self.button_blocks[block] = bits
+            if self.publisher is not None:
+                self.publisher.publish(self)
+            return self._count_write()
+
+    def _store_axis(self, axis_id: AxisID, value: int) -> bool | None:
+        """Updates the position, returns True if the write is left to flush(), None if it is dropped"""
+        with self._lock:
+            if axis_id >= self.__NB_POSITION_AXES__:
+                self.nb_writes += 1
+                self.nb_driver_calls += 1
+                return False
+            if (written_value := self._written_axis_values.get(axis_id)) is not None \
+                    and abs(value - written_value) <= self.deadband \
+                    and (value == written_value or value not in (0x0000, 0x4000, 0x8000)):
+                self.nb_suppressed_axis_writes += 1
+                return None
+            self.nb_writes += 1
+            self._written_axis_values[axis_id] = value
+            self.axes[axis_id] = value
+            if self.publisher is not None:
+                self.publisher.publish(self)
+            return self._count_write()
+
+    def _count_write(self) -> bool:
+        """Called with the lock held, once the position is updated : see _store_button() / _store_axis()"""
+        if self._batched:
+            self._dirty = True
+            return True
+        self.nb_driver_calls += 1
+        return False
+
+    def _record_write_latency(self, start_ns: int):
+        with self._lock:
+            self.write_latencies.record(time.perf_counter_ns() - start_ns)
+
+    def set_button(self, button_id: int, state: bool) -> bool:
+        """Set a given button to On (1 or True) or Off (0 or False), button_id is 0-based.
+        Returns True if the write was suppressed, as it wouldn't change anything."""
+        if (batched := self._store_button(button_id, state)) is None:
+            return True
+        if not batched:
+            start = time.perf_counter_ns()
+            self._write_button(button_id, state)
+            self._record_write_latency(start)
+        return False
+
+    def set_axis(self, axis_id: AxisID, value: float) -> bool:
+        """Set a given axis to the given value.
+        axis_id is an AxisID enum (actually an IntEnum, 0-based)
+        value is a float in range [-1.0 .. 1.0], internally converted to vjoy int range [0x0000..0x8000]
+        Returns True if the write was suppressed : no-op, or within the deadband."""
+        return self.set_axis_raw(axis_id, math.floor(0x8000 * (1 + value) / 2))
+
+    def set_axis_raw(self, axis_id: AxisID, value: int) -> bool:
+        """Same as set_axis(), but the value is already in the vjoy int range [0x0000..0x8000]"""
+        if (batched := self._store_axis(axis_id, value)) is None:
+            return True
+        if not batched:
+            start = time.perf_counter_ns()
+            self._write_axis(axis_id, value)
+            self._record_write_latency(start)
+        return False
+
+    def set_cont_pov(self, pov_id: int, value: int):
+        """Set a given POV to a continuous direction :
+        pov_id is 0-based
+        value is an int in range [0 .. 35900] (tenth of degrees) or -1 for None (not pressed)"""
+        with self._lock:
+            self.povs[pov_id] = value
+            if self.publisher is not None:
+                self.publisher.publish(self)
+            self.nb_writes += 1
+            self.nb_driver_calls += 1
+        start = time.perf_counter_ns()
+        result = self._write_pov(pov_id, value)
+        self._record_write_latency(start)
+        return result
+
+    @abc.abstractmethod
+    def _write_button(self, button_id: int, state: bool):
+        """Writes a single button, already stored in the position"""
+
+    @abc.abstractmethod
+    def _write_axis(self, axis_id: AxisID, value: int):
+        """Writes a single axis, already stored in the position (except POV)"""
+
+    @abc.abstractmethod
+    def _write_pov(self, pov_id: int, value: int):
+        """Writes a single POV, POVs are never batched"""
+
+    @abc.abstractmethod
+    def _write_position(self):
+        """Writes the whole position at once, called with the lock held"""
+
+
+class MemoryOutputBackend(OutputBackend):
+    """Headless stand-in for vJoy, which only keeps the writes in memory : the position of the device,
+    and the last calls made to it (see 'calls'), for tests and load tests."""
+    device_name = 'Memory Output'
+    __MAX_CALLS__ = 4096
+
+    def __init__(self, vjoy_id: vJoyId):
+        super().__init__(vjoy_id)
+        self.calls: collections.deque[tuple] = collections.deque(maxlen=self.__MAX_CALLS__)
+
+    def _write_button(self, button_id: int, state: bool):
+        self.calls.append(('button', button_id, state))
+        return True
+
+    def _write_axis(self, axis_id: AxisID, value: int):
+        self.calls.append(('axis', axis_id, value))
+        return True
+
+    def _write_pov(self, pov_id: int, value: int):
+        self.calls.append(('pov', pov_id, value))
+        return True
+
+    def _write_position(self):
+        self.calls.append(('position', tuple(self.axes), tuple(self.button_blocks)))
+
+
+class SharedMemoryOutputBackend(OutputBackend):
+    """Headless stand-in for vJoy, which publishes the position of the device in a named shared memory block,
+    'njoy-output-<vjoy id>', for another process to read : the 9 axes (X to WHEEL, in vJoy units) as int32,
+    followed by the 4 blocks of 32 buttons as uint32, all little-endian. The block is removed on close()."""
+    device_name = 'Shared Memory Output'
+    __LAYOUT__ = struct.Struct('<9i4I')
+    __BUTTONS_OFFSET__ = 9 * 4
+
+    def __init__(self, vjoy_id: vJoyId):
+        super().__init__(vjoy_id)
+        name = f'njoy-output-{vjoy_id}'
+        try:
+            self._memory = shared_memory.SharedMemory(name=name, create=True, size=self.__LAYOUT__.size)
+        except FileExistsError:  # Left behind by a previous run which didn't exit cleanly
+            self._memory = shared_memory.SharedMemory(name=name)
+        self._buffer = self._memory.buf
+        self._release = weakref.finalize(self, self._unlink, self._memory)
+        self._write_position()
+
+    @property
+    def name(self) -> str:
+        return self._memory.name
+
+    def close(self):
+        self._buffer = None
+        self._release()
+
+    @staticmethod
+    def _unlink(memory: shared_memory.SharedMemory):
+        memory.close()
+        try:
+            memory.unlink()
+        except FileNotFoundError:
+            pass
+
+    def _write_button(self, button_id: int, state: bool):
+        block = button_id // 32
+        struct.pack_into('<I', self._buffer, self.__BUTTONS_OFFSET__ + 4 * block, self.button_blocks[block])
+        return True
+
+    def _write_axis(self, axis_id: AxisID, value: int):
+        if axis_id < self.__NB_POSITION_AXES__:
+            struct.pack_into('<i', self._buffer, 4 * axis_id, value)
+        return True
+
+    def _write_pov(self, pov_id: int, value: int):
+        return True  # Not part of the layout, see state_publication for a layout including them
+
+    def _write_position(self):
+        self.__LAYOUT__.pack_into(self._buffer, 0, *self.axes, *self.button_blocks)
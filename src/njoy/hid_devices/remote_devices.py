@@ -0,0 +1,434 @@
+from __future__ import annotations  # PEP 563: Postponed evaluation of annotations
+
+import argparse
+import ctypes
+import os
+import sdl2
+import socket
+import struct
+import sys
+import threading
+import time
+import typing
+
+from .device_state import DeviceState
+from .hid_device import HIDDevice
+from .sdl_interface import InstanceID
+from njoy.core.latency import LatencyHistogram
+from PySide6.QtCore import QObject
+
+if typing.TYPE_CHECKING:
+    from typing import Iterable
+    from .hid_event_loop import HIDEventLoop
+    from .sdl_interface import DeviceIndex
+
+# Streaming of HID devices from one machine to another, over UDP.
+#
+# A RemoteSender captures some devices of the machine they are plugged in, and streams their state to a
+# RemoteReceiver, which exposes them as RemoteDevice objects : their InputAxis / InputButton are dispatched by the
+# HIDEventLoop, exactly like the ones of the local devices.
+#
+#   python -m njoy.hid_devices.remote_devices --to 192.168.1.10:7510 --device "LEFT VPC Stick MT-50CM3"
+#
+# Frames, little-endian :
+#   header : magic b'NJ', version (uint8), kind (uint8), session (uint32), sequence (uint32), send time (uint64, ns)
+#   describe : number of devices (uint8), then for each : slot (uint8), number of axes (uint8),
+#              number of buttons (uint8), name length (uint8), name (utf-8)
+#   state : number of devices (uint8), then for each : slot (uint8), number of axis changes (uint8),
+#           number of button bytes (uint8), axis changes (axis id uint8, SDL value int16), buttons bitmask
+#
+# Only the axes which changed since the previous frame are sent, and the buttons are always sent as a whole.
+# Every 'keyframe_interval', the devices are described again and sent in full : frames can be lost, reordered or
+# duplicated, the receiver keeps the latest state, and stale frames are dropped.
+#
+# The latency is measured from the send time of the frames : across machines, it is only meaningful if their
+# clocks are synchronized. Over loopback, it is exact.
+__MAGIC__ = b'NJ'
+__VERSION__ = 1
+__HEADER__ = struct.Struct('<2sBBIIQ')
+__DESCRIBE_ENTRY__ = struct.Struct('<BBBB')
+__STATE_ENTRY__ = struct.Struct('<BBB')
+__AXIS_CHANGE__ = struct.Struct('<Bh')
+__COUNT__ = struct.Struct('<B')
+__KIND_DESCRIBE__ = 0
+__KIND_STATE__ = 1
+DEFAULT_PORT = 7510
+
+
+class RemoteDevice(HIDDevice):
+    """Device of another machine, streamed by a RemoteSender to a RemoteReceiver (see above).
+
+    It isn't seen through SDL : it gets a negative instance id, which no SDL device ever has,
+    and its state is updated by the receiver. Its axes and buttons are the usual InputAxis and InputButton."""
+    is_remote = True
+    __MAX_AXES__ = 32
+    __MAX_BUTTONS__ = 128
+
+    _next_instance_id = -0x100
+
+    @classmethod
+    def find_device_index(cls, ident: str) -> DeviceIndex | None:
+        return None
+
+    def __init__(self,
+                 *,
+                 ident: str,
+                 parent: QObject = None,
+                 device_index: DeviceIndex | None = None):
+        super().__init__(ident=ident, parent=parent, device_index=device_index)
+        self._instance_id = InstanceID(RemoteDevice._next_instance_id)
+        RemoteDevice._next_instance_id -= 1
+        self._name = ident
+        self._nb_axes = self.__MAX_AXES__
+        self._nb_buttons = self.__MAX_BUTTONS__
+        self.state = DeviceState(nb_axes=self.__MAX_AXES__, nb_buttons=self.__MAX_BUTTONS__)
+
+    def __repr__(self):
+        return f'<RemoteDevice {self.name}>'
+
+    def matches(self, device_index: DeviceIndex) -> bool:
+        return False
+
+    def describe(self, nb_axes: int, nb_buttons: int):
+        """Called by the receiver with the description sent by the other side"""
+        self._nb_axes = min(nb_axes, self.__MAX_AXES__)
+        self._nb_buttons = min(nb_buttons, self.__MAX_BUTTONS__)
+
+    @property
+    def nb_axes(self) -> int:
+        return self._nb_axes
+
+    @property
+    def nb_balls(self) -> int:
+        return 0
+
+    @property
+    def nb_buttons(self) -> int:
+        return self._nb_buttons
+
+    @property
+    def nb_hats(self) -> int:
+        return 0
+
+
+class RemoteSender:
+    """Streams the state of some local devices to a RemoteReceiver, 'rate' times per second at most.
+    Nothing is sent while the devices don't move, except the keyframes."""
+
+    def __init__(self,
+                 hid_event_loop: HIDEventLoop,
+                 devices: Iterable[str],
+                 address: tuple[str, int],
+                 *,
+                 rate: float = 500.0,
+                 keyframe_interval: float = 0.25):
+        if rate <= 0 or keyframe_interval <= 0:
+            raise ValueError(f"Invalid rate ({rate}) / keyframe interval ({keyframe_interval})")
+        self._address = address
+        self._period = 1.0 / rate
+        self._keyframe_interval = keyframe_interval
+        self._devices: list[HIDDevice] = list()
+        for name in devices:
+            # Registering all the controls keeps the state of the device up to date (see HIDEventLoop)
+            device = HIDDevice(name, parent=hid_event_loop)
+            for axis_id in range(device.nb_axes):
+                hid_event_loop.physical_axis(name, axis_id)
+            for button_id in range(device.nb_buttons):
+                hid_event_loop.physical_button(name, button_id)
+            self._devices.append(device)
+        self._sent_axes: list[list[int] | None] = [None] * len(self._devices)
+        self._sent_buttons: list[int | None] = [None] * len(self._devices)
+        self._session = int.from_bytes(os.urandom(4), 'little')
+        self._sequence = 0
+        self.frames_sent = 0
+        self.bytes_sent = 0
+
+        self._socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name='njoy remote sender', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._running = False
+        self._thread.join()
+        self._socket.close()
+
+    def _run(self):
+        next_tick = time.perf_counter()
+        next_keyframe = next_tick
+        while self._running:
+            if keyframe := next_tick >= next_keyframe:
+                self._send(__KIND_DESCRIBE__, self._encode_description())
+                next_keyframe = next_tick + self._keyframe_interval
+            if (body := self._encode_state(keyframe)) is not None:
+                self._send(__KIND_STATE__, body)
+
+            next_tick += self._period
+            if (remaining := next_tick - time.perf_counter()) > 0:
+                time.sleep(remaining)
+            else:
+                next_tick = time.perf_counter()
+
+    def _send(self, kind: int, body: bytes):
+        self._sequence = (self._sequence + 1) & 0xFFFFFFFF
+        frame = __HEADER__.pack(__MAGIC__, __VERSION__, kind, self._session, self._sequence, time.time_ns()) + body
+        try:
+            self._socket.sendto(frame, self._address)
+        except OSError:
+            return  # e.g. nobody listening yet (ICMP port unreachable) : UDP frames are expendable anyway
+        self.frames_sent += 1
+        self.bytes_sent += len(frame)
+
+    def _encode_description(self) -> bytes:
+        body = [__COUNT__.pack(len(self._devices))]
+        for slot, device in enumerate(self._devices):
+            name = device.name.encode()[:255]
+            body.append(__DESCRIBE_ENTRY__.pack(slot, device.nb_axes, device.nb_buttons, len(name)))
+            body.append(name)
+        return b''.join(body)
+
+    def _encode_state(self, keyframe: bool) -> bytes | None:
+        body = list()
+        nb_entries = 0
+        for slot, device in enumerate(self._devices):
+            axes = device.state.raw_axes.tolist()
+            buttons = device.state.buttons
+            sent_axes = self._sent_axes[slot]
+            if keyframe or sent_axes is None:
+                changes = list(enumerate(axes))
+            else:
+                changes = [(axis_id, value) for axis_id, value in enumerate(axes) if value != sent_axes[axis_id]]
+            if not changes and buttons == self._sent_buttons[slot]:
+                continue
+            self._sent_axes[slot] = axes
+            self._sent_buttons[slot] = buttons
+
+            nb_button_bytes = (device.nb_buttons + 7) // 8
+            body.append(__STATE_ENTRY__.pack(slot, len(changes), nb_button_bytes))
+            body.extend(__AXIS_CHANGE__.pack(axis_id, value) for axis_id, value in changes)
+            body.append(buttons.to_bytes(nb_button_bytes, 'little'))
+            nb_entries += 1
+        if not nb_entries:
+            return None
+        return __COUNT__.pack(nb_entries) + b''.join(body)
+
+
+class RemoteLink:
+    """Statistics of the frames received from one sender.
+    A frame skipped by the sequence is counted as lost until it arrives : it is then counted as late instead."""
+    # Sequence numbers of the latest frames missing which are still tracked, older ones stay counted as lost
+    __MAX_MISSING__ = 1024
+
+    def __init__(self, address: tuple[str, int]):
+        self.address = address
+        self.session: int | None = None
+        self.last_sequence = 0
+        self.frames_received = 0
+        self.frames_lost = 0
+        self.frames_late = 0
+        self._missing: dict[int, None] = dict()  # ordered set, oldest first
+        self.latencies = LatencyHistogram()
+        self.last_frame_time = 0.0
+        # Slot of the sender -> device
+        self.devices: dict[int, RemoteDevice] = dict()
+
+    def __repr__(self):
+        return f'<RemoteLink {self.address[0]}:{self.address[1]}>'
+
+    def accept(self, session: int, sequence: int, send_ns: int) -> bool:
+        """Accounts for a frame, returns False if it is stale (older than the latest one received) or a duplicate"""
+        self.frames_received += 1
+        self.last_frame_time = time.perf_counter()
+        self.latencies.record(max(0, time.time_ns() - send_ns))
+        if session != self.session:
+            # New sender, or the sender was restarted : start over
+            self.session = session
+            self.last_sequence = sequence
+            self._missing.clear()
+            self.devices.clear()
+            return True
+        if (sequence - self.last_sequence) & 0xFFFFFFFF >= 0x80000000 or sequence == self.last_sequence:
+            if self._missing.pop(sequence, 0) is None:
+                self.frames_lost -= 1  # It was only out of order
+            self.frames_late += 1
+            return False
+        nb_missing = ((sequence - self.last_sequence) & 0xFFFFFFFF) - 1
+        self.frames_lost += nb_missing
+        for offset in range(max(0, nb_missing - self.__MAX_MISSING__), nb_missing):
+            self._missing[(self.last_sequence + 1 + offset) & 0xFFFFFFFF] = None
+        while len(self._missing) > self.__MAX_MISSING__:
+            del self._missing[next(iter(self._missing))]
+        self.last_sequence = sequence
+        return True
+
+    @property
+    def loss_rate(self) -> float:
+        return self.frames_lost / max(1, self.frames_lost + self.frames_received)
+
+    def summary(self) -> dict[str, float]:
+        return {'frames_received': self.frames_received,
+                'frames_lost': self.frames_lost,
+                'frames_late': self.frames_late,
+                'loss_rate': self.loss_rate,
+                'last_frame_age_s': time.perf_counter() - self.last_frame_time if self.frames_received else None,
+                **{f'latency_{key}': value for key, value in self.latencies.summary().items() if key != 'count'}}
+
+
+class RemoteReceiver:
+    """Receives the devices streamed by RemoteSenders on a UDP port, and hands their changes over to the HIDEventLoop.
+
+    The remote devices have to be declared up front, by their name on the sending side : they are created here,
+    in the main thread, as RemoteDevice objects named prefix + name. Their controls are then looked up as usual,
+    e.g. with HIDEventLoop.physical_axis(). The frames of the devices which weren't declared are ignored."""
+
+    def __init__(self,
+                 hid_event_loop: HIDEventLoop,
+                 devices: Iterable[str],
+                 *,
+                 port: int = DEFAULT_PORT,
+                 host: str = '0.0.0.0',
+                 prefix: str = ''):
+        self._hid_event_loop = hid_event_loop
+        self._prefix = prefix
+        self._devices: dict[str, RemoteDevice] = dict()
+        for name in devices:
+            device = RemoteDevice(prefix + name, parent=hid_event_loop)
+            if not isinstance(device, RemoteDevice):
+                raise ValueError(f"Can't receive remote device '{prefix + name}': a local device has the same name")
+            self._devices[name] = device
+        self._links: dict[tuple[str, int], RemoteLink] = dict()
+        self.frames_invalid = 0
+
+        self._socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self._socket.bind((host, port))
+        self._socket.settimeout(0.2)
+        self._event = sdl2.SDL_Event()
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name='njoy remote receiver', daemon=True)
+        self._thread.start()
+
+    @property
+    def address(self) -> tuple[str, int]:
+        return self._socket.getsockname()
+
+    def device(self, name: str) -> RemoteDevice:
+        """The device declared under this name (on the sending side)"""
+        return self._devices[name]
+
+    def links(self) -> list[RemoteLink]:
+        return list(self._links.values())
+
+    def report(self) -> dict[str, dict[str, float]]:
+        return {f'{link.address[0]}:{link.address[1]}': link.summary() for link in self.links()}
+
+    def stop(self):
+        self._running = False
+        self._thread.join()
+        self._socket.close()
+
+    def _run(self):
+        while self._running:
+            try:
+                frame, address = self._socket.recvfrom(0x10000)
+            except socket.timeout:
+                continue
+            except OSError:
+                break
+            try:
+                self._on_frame(frame, address)
+            except (struct.error, IndexError, UnicodeDecodeError):
+                self.frames_invalid += 1
+
+    def _on_frame(self, frame: bytes, address: tuple[str, int]):
+        magic, version, kind, session, sequence, send_ns = __HEADER__.unpack_from(frame, 0)
+        if magic != __MAGIC__ or version != __VERSION__:
+            self.frames_invalid += 1
+            return
+        if (link := self._links.get(address)) is None:
+            link = self._links[address] = RemoteLink(address)
+        if not link.accept(session, sequence, send_ns):
+            return
+        if kind == __KIND_DESCRIBE__:
+            self._on_description(link, frame, __HEADER__.size)
+        elif kind == __KIND_STATE__:
+            self._on_state(link, frame, __HEADER__.size)
+
+    def _on_description(self, link: RemoteLink, frame: bytes, offset: int):
+        nb_devices, = __COUNT__.unpack_from(frame, offset)
+        offset += __COUNT__.size
+        for _ in range(nb_devices):
+            slot, nb_axes, nb_buttons, name_length = __DESCRIBE_ENTRY__.unpack_from(frame, offset)
+            offset += __DESCRIBE_ENTRY__.size
+            name = frame[offset:offset + name_length].decode()
+            offset += name_length
+            if (device := self._devices.get(name)) is not None:
+                device.describe(nb_axes, nb_buttons)
+                link.devices[slot] = device
+
+    def _on_state(self, link: RemoteLink, frame: bytes, offset: int):
+        # With the polling mode, the HIDEventLoop reads the state of the remote devices by itself on each tick.
+        # Otherwise, the changes are pushed as SDL events, for the HIDEventLoop to dispatch as any other event.
+        push_events = self._hid_event_loop.poll_rate is None
+        event = self._event
+        nb_devices, = __COUNT__.unpack_from(frame, offset)
+        offset += __COUNT__.size
+        for _ in range(nb_devices):
+            slot, nb_changes, nb_button_bytes = __STATE_ENTRY__.unpack_from(frame, offset)
+            offset += __STATE_ENTRY__.size
+            changes = [__AXIS_CHANGE__.unpack_from(frame, offset + i * __AXIS_CHANGE__.size)
+                       for i in range(nb_changes)]
+            offset += nb_changes * __AXIS_CHANGE__.size
+            buttons = int.from_bytes(frame[offset:offset + nb_button_bytes], 'little')
+            offset += nb_button_bytes
+            if (device := link.devices.get(slot)) is None:
+                continue  # Not declared, or not described yet
+
+            state = device.state
+            for axis_id, value in changes:
+                if axis_id >= len(state.raw_axes) or state.raw_axes[axis_id] == value:
+                    continue
+                state.raw_axes[axis_id] = value
+                if push_events:
+                    event.type = sdl2.SDL_JOYAXISMOTION
+                    event.jaxis.which, event.jaxis.axis, event.jaxis.value = device.instance_id, axis_id, value
+                    sdl2.SDL_PushEvent(ctypes.byref(event))
+            changed_buttons = buttons ^ state.buttons
+            state.buttons = buttons
+            while changed_buttons and push_events:
+                button_id = (changed_buttons & -changed_buttons).bit_length() - 1
+                changed_buttons &= changed_buttons - 1
+                pressed = buttons >> button_id & 1
+                event.type = sdl2.SDL_JOYBUTTONDOWN if pressed else sdl2.SDL_JOYBUTTONUP
+                event.jbutton.which, event.jbutton.button, event.jbutton.state = device.instance_id, button_id, pressed
+                sdl2.SDL_PushEvent(ctypes.byref(event))
+
+
+def main(argv: list[str] = None) -> int:
+    parser = argparse.ArgumentParser(description="Streams local devices to a remote n-joy host")
+    parser.add_argument('--to', required=True, help="host:port of the n-joy host (RemoteReceiver)")
+    parser.add_argument('--device', action='append', required=True, help="name or GUID of a device to stream")
+    parser.add_argument('--rate', type=float, default=500, help="frames per second, at most")
+    parser.add_argument('--keyframe-interval', type=float, default=0.25, help="seconds")
+    args = parser.parse_args(argv)
+    host, _, port = args.to.rpartition(':')
+
+    # Imported here : the receiving side doesn't need them
+    from njoy.hid_devices.hid_event_loop import HIDEventLoop  # pylint: disable=import-outside-toplevel
+    from PySide6.QtCore import QCoreApplication  # pylint: disable=import-outside-toplevel
+    app = QCoreApplication(sys.argv[:1])
+    hid_event_loop = HIDEventLoop()
+    sender = RemoteSender(hid_event_loop, args.device, (host, int(port)),
+                          rate=args.rate,
+                          keyframe_interval=args.keyframe_interval)
+    try:
+        return app.exec()
+    except KeyboardInterrupt:
+        return 0
+    finally:
+        sender.stop()
+        hid_event_loop.stop()
+        print(f"{sender.frames_sent} frames, {sender.bytes_sent} bytes sent")
+
+
+if __name__ == '__main__':
+    sys.exit(main())
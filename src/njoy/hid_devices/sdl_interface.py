@@ -1,17 +1,20 @@
 from __future__ import annotations  # PEP 563: Postponed evaluation of annotations
 
+import ctypes
+import json
 import re
 import sdl2
-import sdl2.ext
 import typing
 
 from .vjoy_interface import vJoyId
+from njoy.startup_profile import profiled
 from typing import NewType
 
 DeviceIndex = NewType('DeviceIndex', int)  # aka device_index in SDL docs
 InstanceID = NewType('InstanceID', int)  # aka SDL_JoystickID, InstanceID, "instance id" in SDL docs
 
 if typing.TYPE_CHECKING:
+    from pathlib import Path
     from typing import Iterator
 
 
@@ -19,21 +22,114 @@ class SDLError(Exception):
     pass
 
 
+class DeviceInfo(typing.NamedTuple):
+    name: str
+    guid: str  # as printed by SDL_JoystickGetGUIDString()
+    vjoy_id: vJoyId | None
+
+
+class _DeviceSnapshot:
+    """The joysticks present at some point in time, indexed by name, GUID and vJoy ID.
+    It is taken in one enumeration, and stays valid until the joysticks change (see _SDL.on_device_added())."""
+
+    def __init__(self, devices: list[DeviceInfo]):
+        self.devices = devices
+        self.by_ident: dict[str, list[DeviceIndex]] = dict()
+        self.by_vjoy_id: dict[vJoyId, DeviceIndex] = dict()
+        for device_index, device in enumerate(devices):
+            self.by_ident.setdefault(device.name, list()).append(DeviceIndex(device_index))
+            if device.guid != device.name:
+                self.by_ident.setdefault(device.guid, list()).append(DeviceIndex(device_index))
+            if device.vjoy_id is not None:
+                self.by_vjoy_id.setdefault(device.vjoy_id, DeviceIndex(device_index))
+
+    @classmethod
+    @profiled
+    def enumerate(cls, cache_file: Path = None) -> _DeviceSnapshot:
+        guids = [_SDL.get_guid_string(DeviceIndex(i)) for i in range(_SDL.nb_joysticks())]
+        if cache_file is not None and (snapshot := cls._load(cache_file, guids)) is not None:
+            return snapshot
+
+        devices = list()
+        for device_index, guid in enumerate(guids):
+            name = _SDL.get_name(DeviceIndex(device_index))
+            devices.append(DeviceInfo(name, guid, _SDL.read_vjoy_id(DeviceIndex(device_index), name)))
+        snapshot = cls(devices)
+        if cache_file is not None:
+            snapshot._save(cache_file)
+        return snapshot
+
+    @classmethod
+    def _load(cls, cache_file: Path, guids: list[str]) -> _DeviceSnapshot | None:
+        """Returns None if there is no cache, or if it doesn't match the devices currently present"""
+        try:
+            devices = [DeviceInfo(*device) for device in json.loads(cache_file.read_text())]
+        except (OSError, ValueError, TypeError):
+            return None
+        if [device.guid for device in devices] != guids:
+            return None
+        # All the vJoy devices share the same GUID : check they didn't swap places
+        for device_index, device in enumerate(devices):
+            if device.vjoy_id is not None \
+                    and _SDL.read_vjoy_id(DeviceIndex(device_index), device.name) != device.vjoy_id:
+                return None
+        return cls(devices)
+
+    def _save(self, cache_file: Path):
+        try:
+            cache_file.write_text(json.dumps(self.devices))
+        except OSError:
+            pass  # The cache is only an optimization
+
+
 class _SDL:
     __RE_VJOY_PATH__ = re.compile(rb'HID#HIDCLASS&COL(\d+)#')
+    __SUBSYSTEMS__ = (sdl2.SDL_INIT_EVENTS, sdl2.SDL_INIT_VIDEO, sdl2.SDL_INIT_JOYSTICK)
+
+    # Where to persist the device snapshot between runs, if anywhere
+    device_cache_file: Path | None = None
+    _snapshot: _DeviceSnapshot | None = None
+    _initialized = False
+
+    @staticmethod
+    @profiled
+    def init():
+        """Initializes the SDL subsystems, once, on first use rather than on import : importing this module
+        (e.g. for its types) doesn't cost the SDL startup. Called by everything talking to SDL, and by HIDEventLoop."""
+        if _SDL._initialized:
+            return
+        # Same subsystems as sdl2.ext.init(joystick=True) : importing sdl2.ext alone costs more than SDL_Init()
+        for subsystem in _SDL.__SUBSYSTEMS__:
+            if sdl2.SDL_InitSubSystem(subsystem) != 0:
+                raise SDLError(sdl2.SDL_GetError())
+        _SDL._initialized = True
 
-    # Initialize the SDL subsystems once, when first importing this module
-    sdl2.ext.init(joystick=True, controller=False, haptic=False, sensor=False, events=True)
+    @staticmethod
+    def devices() -> _DeviceSnapshot:
+        """The current device snapshot, enumerating the joysticks only if they changed since the last call"""
+        if (snapshot := _SDL._snapshot) is None:
+            _SDL.init()
+            snapshot = _SDL._snapshot = _DeviceSnapshot.enumerate(_SDL.device_cache_file)
+        return snapshot
+
+    @staticmethod
+    def invalidate_devices():
+        """To be called on device removal : device indexes are not stable across them"""
+        _SDL._snapshot = None
+
+    @staticmethod
+    def on_device_added(device_index: DeviceIndex):
+        """To be called on device arrival. SDL also reports every joystick already present at startup this way :
+        those are already in the current snapshot, which is only invalidated if the joysticks actually changed."""
+        if (snapshot := _SDL._snapshot) is None:
+            return
+        if device_index >= len(snapshot.devices) or _SDL.nb_joysticks() != len(snapshot.devices):
+            _SDL._snapshot = None
 
     @staticmethod
     def find_hid_device_index(ident: str) -> DeviceIndex:
         """ident can be either an HID name (str) or an HID GUID (str)"""
-        candidates = list()
-        for device_index in [DeviceIndex(i) for i in range(_SDL.nb_joysticks())]:
-            if ident == _SDL.get_name(device_index):
-                candidates.append(device_index)
-            elif ident.encode() == _SDL.get_guid(device_index):
-                candidates.append(device_index)
+        candidates = _SDL.devices().by_ident.get(ident, [])
 
         if len(candidates) == 0:
             raise LookupError(f"No device found for HID name or GUID = {ident}, try another method")
@@ -43,28 +139,43 @@ class _SDL:
 
     @staticmethod
     def find_vjoy_device_index(ident: vJoyId) -> DeviceIndex:
-        for device_index in [DeviceIndex(i) for i in range(_SDL.nb_joysticks())]:
-            if _SDL.get_name(device_index) != 'vJoy Device':
-                continue
-            if match := _SDL.__RE_VJOY_PATH__.search(_SDL.get_path(device_index)):
-                # vJoy device IDs are internally 1-based, but our vJoyID type is 0-based (like the rest of the world)
-                if ident == vJoyId(int(match.group(1)) - 1):
-                    return device_index
-        raise LookupError(f"No device found for vJoy ID = {ident}, try another method")
+        if (device_index := _SDL.devices().by_vjoy_id.get(ident)) is None:
+            raise LookupError(f"No device found for vJoy ID = {ident}, try another method")
+        return device_index
+
+    @staticmethod
+    def is_hid_device(device_index: DeviceIndex, ident: str) -> bool:
+        """ident can be either an HID name (str) or an HID GUID (str)"""
+        return device_index in _SDL.devices().by_ident.get(ident, [])
+
+    @staticmethod
+    def get_vjoy_id(device_index: DeviceIndex) -> vJoyId | None:
+        """Returns the vJoy ID of the device, or None if it is not a vJoy device"""
+        devices = _SDL.devices().devices
+        return devices[device_index].vjoy_id if 0 <= device_index < len(devices) else None
+
+    @staticmethod
+    def read_vjoy_id(device_index: DeviceIndex, name: str) -> vJoyId | None:
+        """Same as get_vjoy_id(), but straight from SDL instead of the device snapshot"""
+        if name != 'vJoy Device':
+            return None
+        if match := _SDL.__RE_VJOY_PATH__.search(_SDL.get_path(device_index)):
+            # vJoy device IDs are internally 1-based, but our vJoyID type is 0-based (like the rest of the world)
+            return vJoyId(int(match.group(1)) - 1)
+        return None
 
     @staticmethod
     def vjoy_device_index_iterator() -> Iterator[tuple[vJoyId, DeviceIndex]]:
         """Iterate through the vjoy device by vJoy ID (1-based), not necessarily in the SDL order"""
+        by_vjoy_id = _SDL.devices().by_vjoy_id
         vjoy_id = 0
-        while True:
-            try:
-                yield vJoyId(vjoy_id), _SDL.find_vjoy_device_index(vJoyId(vjoy_id))
-            except LookupError:
-                break
+        while vjoy_id in by_vjoy_id:
+            yield vJoyId(vjoy_id), by_vjoy_id[vJoyId(vjoy_id)]
             vjoy_id += 1
 
     @staticmethod
     def open(device_index: DeviceIndex) -> sdl2.SDL_Joystick:
+        _SDL.init()
         device = sdl2.SDL_JoystickOpen(device_index)
         if not device:
             raise SDLError(sdl2.SDL_GetError())
@@ -84,6 +195,12 @@ class _SDL:
             raise SDLError(sdl2.SDL_GetError())
         return guid.data
 
+    @staticmethod
+    def get_guid_string(device_index: DeviceIndex) -> str:
+        guid_string = ctypes.create_string_buffer(33)
+        sdl2.SDL_JoystickGetGUIDString(sdl2.SDL_JoystickGetDeviceGUID(device_index), guid_string, len(guid_string))
+        return guid_string.value.decode()
+
     @staticmethod
     def get_name(device_index: DeviceIndex) -> str:
         name = sdl2.SDL_JoystickNameForIndex(device_index)
@@ -100,6 +217,7 @@ class _SDL:
 
     @staticmethod
     def nb_joysticks() -> int:
+        _SDL.init()
         nb_joysticks = sdl2.SDL_NumJoysticks()
         if nb_joysticks < 0:
             raise SDLError(sdl2.SDL_GetError())
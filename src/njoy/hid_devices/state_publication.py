@@ -0,0 +1,170 @@
+from __future__ import annotations  # PEP 563: Postponed evaluation of annotations
+
+import os
+import struct
+import threading
+import time
+import typing
+import weakref
+
+from multiprocessing import resource_tracker, shared_memory
+
+if typing.TYPE_CHECKING:
+    from .output_backends import OutputBackend
+    from .vjoy_interface import vJoyId
+
+# Publication of the output state of the virtual devices, for other processes (overlays, telemetry, scripts...)
+# to read without any IPC round trip nor SDL handle : a named shared memory block, updated in place on every write.
+#
+# Fixed layout, little-endian :
+#   header : magic b'NJOY', layout version (uint16), number of slots (uint16), sequence (uint64)
+#   then one slot per vJoy device (vjoy_id 0 to 15) :
+#     sequence (uint64), present (uint32), 9 axes X to WHEEL (int32, vJoy units 0x0000..0x8000),
+#     4 continuous POVs (int32, tenth of degrees, -1 if centered), 4 blocks of 32 buttons (uint32)
+#
+# The header sequence is incremented on each write, whatever the device : polling it is enough to know whether
+# anything changed. Each slot is a seqlock : its sequence is odd while the slot is being written, and a read
+# is consistent if the sequence was even and the same before and after it.
+DEFAULT_NAME = 'njoy-states'
+__MAGIC__ = b'NJOY'
+__VERSION__ = 1
+__NB_SLOTS__ = 16
+__HEADER__ = struct.Struct('<4sHHQ')
+__SEQUENCE__ = struct.Struct('<Q')
+__SLOT_DATA__ = struct.Struct('<I9i4i4I')
+__SLOT_SIZE__ = __SEQUENCE__.size + __SLOT_DATA__.size
+__HEADER_SEQUENCE_OFFSET__ = 8
+
+# Blocks published by this process, see StateReader
+_published_names: set[str] = set()
+
+
+class VirtualDeviceState(typing.NamedTuple):
+    """Output state of a virtual device, as read from the publication"""
+    sequence: int
+    axes: tuple[int, ...]  # vJoy units (0x0000 to 0x8000), by AxisID
+    povs: tuple[int, ...]  # tenth of degrees, -1 if centered
+    buttons: int  # bitset, bit i set if button i is pressed
+
+    def axis_value(self, axis_id: int) -> float:
+        return 2 * self.axes[axis_id] / 0x8000 - 1
+
+    def button_state(self, button_id: int) -> bool:
+        return bool(self.buttons >> button_id & 1)
+
+
+class StatePublisher:
+    """Writer side of the publication, shared by all the output backends (see OutputBackend.attach_publisher())"""
+
+    def __init__(self, name: str = DEFAULT_NAME):
+        size = __HEADER__.size + __NB_SLOTS__ * __SLOT_SIZE__
+        try:
+            self._memory = shared_memory.SharedMemory(name=name, create=True, size=size)
+        except FileExistsError:  # Left behind by a previous run which didn't exit cleanly
+            self._memory = shared_memory.SharedMemory(name=name)
+            if self._memory.size < size:
+                # From an older layout, or with fewer slots : it can't be reused as is
+                self._unlink(self._memory)
+                self._memory = shared_memory.SharedMemory(name=name, create=True, size=size)
+            self._memory.buf[:size] = bytes(size)
+        self._buffer = self._memory.buf
+        self._lock = threading.Lock()  # writes may come from the SDL thread (inline mappings) and the main thread
+        self._sequence = 0
+        self._slot_sequences = [0] * __NB_SLOTS__
+        __HEADER__.pack_into(self._buffer, 0, __MAGIC__, __VERSION__, __NB_SLOTS__, 0)
+        self._release = weakref.finalize(self, StatePublisher._unlink, self._memory)
+        _published_names.add(self._memory.name)
+
+    @property
+    def name(self) -> str:
+        return self._memory.name
+
+    def close(self):
+        self._buffer = None
+        self._release()
+
+    @staticmethod
+    def _unlink(memory: shared_memory.SharedMemory):
+        memory.close()
+        try:
+            memory.unlink()
+        except FileNotFoundError:
+            pass
+
+    def publish(self, output: OutputBackend):
+        """Writes the whole state of a device to its slot, called by the output backend on each write"""
+        if not 0 <= output.vjoy_id < __NB_SLOTS__ or self._buffer is None:
+            return
+        offset = __HEADER__.size + output.vjoy_id * __SLOT_SIZE__
+        with self._lock:
+            sequence = self._slot_sequences[output.vjoy_id]
+            __SEQUENCE__.pack_into(self._buffer, offset, sequence + 1)
+            __SLOT_DATA__.pack_into(self._buffer, offset + __SEQUENCE__.size,
+                                    1, *output.axes, *output.povs, *output.button_blocks)
+            __SEQUENCE__.pack_into(self._buffer, offset, sequence + 2)
+            self._slot_sequences[output.vjoy_id] = sequence + 2
+            self._sequence += 1
+            __SEQUENCE__.pack_into(self._buffer, __HEADER_SEQUENCE_OFFSET__, self._sequence)
+
+
+class StateReader:
+    """Reader side of the publication, for other processes :
+
+        with StateReader() as reader:
+            state = reader.read(vJoyId(0))
+            print(state.axis_value(AxisID.X), state.button_state(3))
+
+    Reading doesn't block the writer : a read overlapping a write is retried."""
+    __MAX_RETRIES__ = 1000
+
+    def __init__(self, name: str = DEFAULT_NAME):
+        self._memory = shared_memory.SharedMemory(name=name)
+        if os.name == 'posix' and self._memory.name not in _published_names:
+            # The block belongs to the publisher : don't let this process remove it on exit
+            resource_tracker.unregister(self._memory._name, 'shared_memory')  # pylint: disable=protected-access
+        magic, version, nb_slots, _ = __HEADER__.unpack_from(self._memory.buf, 0)
+        if magic != __MAGIC__ or version != __VERSION__:
+            self._memory.close()
+            raise ValueError(f"Unsupported state publication '{name}': {magic} version {version}")
+        self.nb_slots = nb_slots
+
+    def __enter__(self) -> StateReader:
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        self._memory.close()
+
+    @property
+    def sequence(self) -> int:
+        """Incremented on each write to any device, cheap to poll"""
+        return __SEQUENCE__.unpack_from(self._memory.buf, __HEADER_SEQUENCE_OFFSET__)[0]
+
+    def devices(self) -> list[vJoyId]:
+        """The virtual devices published so far"""
+        return [vjoy_id for vjoy_id in range(self.nb_slots) if self.read(vjoy_id) is not None]
+
+    def read(self, vjoy_id: vJoyId) -> VirtualDeviceState | None:
+        """Consistent copy of the state of a device, None if nothing was ever written to it"""
+        if not 0 <= vjoy_id < self.nb_slots:
+            raise IndexError(f"Invalid vJoy id: {vjoy_id}")
+        buffer = self._memory.buf
+        offset = __HEADER__.size + vjoy_id * __SLOT_SIZE__
+        for attempt in range(self.__MAX_RETRIES__):
+            if attempt:
+                time.sleep(0)  # Let the writer run, rather than keep overlapping with it
+            before = __SEQUENCE__.unpack_from(buffer, offset)[0]
+            if before & 1:
+                continue
+            present, *values = __SLOT_DATA__.unpack_from(buffer, offset + __SEQUENCE__.size)
+            if __SEQUENCE__.unpack_from(buffer, offset)[0] != before:
+                continue
+            if not present:
+                return None
+            buttons = 0
+            for block, bits in enumerate(values[13:]):
+                buttons |= bits << (32 * block)
+            return VirtualDeviceState(before, tuple(values[:9]), tuple(values[9:13]), buttons)
+        raise TimeoutError(f"State of vJoy device #{vjoy_id + 1} kept changing while being read")
@@ -1,10 +1,9 @@
 from __future__ import annotations  # PEP 563: Postponed evaluation of annotations
 
 import enum
-import math
-import pyvjoy
 import typing
 
+from .output_backends import OutputBackend
 from typing import NewType
 
 if typing.TYPE_CHECKING:
@@ -27,57 +26,55 @@ class AxisID(enum.IntEnum):
     POV = 9
 
 
-class VJoyDevice(pyvjoy.VJoyDevice):
-    """Wrapper class around pyvjoy.VJoyDevice.
+class VJoyDevice(OutputBackend):
+    """Wrapper class around pyvjoy.VJoyDevice, the vJoy output backend.
         It serves three purposes :
         - fixing some quirks of the pyvjoy interface I don't like, such 1-based indexes.
         - augment the pyvjoy interface with some useful utility functions.
         - most importantly, provide a layer of abstraction, should I want to switch to something else later."""
 
+    # Fields of the position structure (pyvjoy 'data') holding each axis, each block of 32 buttons, and each POV
+    __VJOY_AXIS_FIELDS__ = ('wAxisX', 'wAxisY', 'wAxisZ', 'wAxisXRot', 'wAxisYRot', 'wAxisZRot',
+                            'wSlider', 'wDial', 'wWheel')
+    __VJOY_BUTTON_FIELDS__ = ('lButtons', 'lButtonsEx1', 'lButtonsEx2', 'lButtonsEx3')
+    __VJOY_POV_FIELDS__ = ('bHats', 'bHatsEx1', 'bHatsEx2', 'bHatsEx3')
+
+    # HID usages of the axis (pyvjoy.HID_USAGE_*), indexed by AxisID
+    __VJOY_AXIS_IDS__ = (0x30, 0x31, 0x32, 0x33, 0x34, 0x35, 0x36, 0x37, 0x38, 0x39)
+
     def __init__(self, vjoy_id: vJoyId):
         """vjoy_id is 0-based, internally converted to vjoy 1-based index."""
-        super().__init__(1 + vjoy_id)
-        self.reset()
-        self.reset_buttons()
-        self.reset_data()
-        self.reset_povs()
-
-    @staticmethod
-    def _to_vjoy_axis_id(axis: AxisID) -> int:
-        mapping = {AxisID.X: pyvjoy.HID_USAGE_X,
-                   AxisID.Y: pyvjoy.HID_USAGE_Y,
-                   AxisID.Z: pyvjoy.HID_USAGE_Z,
-                   AxisID.RX: pyvjoy.HID_USAGE_RX,
-                   AxisID.RY: pyvjoy.HID_USAGE_RY,
-                   AxisID.RZ: pyvjoy.HID_USAGE_RZ,
-                   AxisID.SL0: pyvjoy.HID_USAGE_SL0,
-                   AxisID.SL1: pyvjoy.HID_USAGE_SL1,
-                   AxisID.WHEEL: pyvjoy.HID_USAGE_WHL,
-                   AxisID.POV: pyvjoy.HID_USAGE_POV}
-        return mapping[axis]
-
-    def set_button(self, button_id: int, state: bool):
-        """Set a given button to On (1 or True) or Off (0 or False)
-        button_id is 0-based, internally converted to vjoy 1-based button ID"""
-        super().set_button(buttonID=1 + button_id,
-                           state=state)
-
-    def set_axis(self, axis_id: AxisID, value: float):
-        """Set a given axis to the given value.
-        axis_id is an AxisID enum (actually an IntEnum, 0-based), internally converted to vjoy axis ID
-        value is a float in range [-1.0 .. 1.0], internally converted to vjoy int range [0X0001..0x8000]"""
-        def _0x0001_to_0x8000(_value: float) -> int:
-            return math.floor(1 + (0x7FFF * (1 + _value)) / 2)
-
-        def _0x0000_to_0x8000(_value: float) -> int:
-            return math.floor(0x8000 * (1 + _value) / 2)
-
-        return super().set_axis(AxisID=self._to_vjoy_axis_id(axis_id),
-                                AxisValue=_0x0000_to_0x8000(value))
-
-    def set_cont_pov(self, pov_id: int, value: int):  # pylint: disable=arguments-differ
-        """Set a given POV to a continuous direction :
-        pov_id is 0-based, internally converted to vjoy 1-based pov ID
-        value is an int in range [0 .. 35900] (tenth of degrees) or -1 for None (not pressed)"""
-        return super().set_cont_pov(PovID=1 + pov_id,
-                                    PovValue=value)
+        super().__init__(vjoy_id)
+        # Imported on first use only : pyvjoy exits the process on import if the vJoy driver can't be loaded
+        import pyvjoy  # pylint: disable=import-outside-toplevel
+        self._device = pyvjoy.VJoyDevice(1 + vjoy_id)
+        self._device.reset()
+        self._device.reset_buttons()
+        self._device.reset_data()
+        self._device.reset_povs()
+        for field in self.__VJOY_AXIS_FIELDS__:
+            setattr(self._device.data, field, 0x4000)
+
+    def _write_button(self, button_id: int, state: bool):
+        return self._device.set_button(buttonID=1 + button_id,
+                                       state=state)
+
+    def _write_axis(self, axis_id: AxisID, value: int):
+        return self._device.set_axis(AxisID=self.__VJOY_AXIS_IDS__[axis_id],
+                                     AxisValue=value)
+
+    def _write_position(self):
+        data = self._device.data
+        for field, value in zip(self.__VJOY_AXIS_FIELDS__, self.axes):
+            setattr(data, field, value)
+        for field, bits in zip(self.__VJOY_BUTTON_FIELDS__, self.button_blocks):
+            # The fields are signed 32 bits ints
+            setattr(data, field, bits - (1 << 32) if bits & 0x80000000 else bits)
+        for field, value in zip(self.__VJOY_POV_FIELDS__, self.povs):
+            setattr(data, field, value & 0xFFFFFFFF)
+        self._device.update()
+
+    def _write_pov(self, pov_id: int, value: int):
+        # pov_id is 0-based, internally converted to vjoy 1-based pov ID
+        return self._device.set_cont_pov(PovID=1 + pov_id,
+                                         PovValue=value)
@@ -0,0 +1,164 @@
+from __future__ import annotations  # PEP 563: Postponed evaluation of annotations
+
+import argparse
+import atexit
+import functools
+import importlib.abc
+import runpy
+import sys
+import threading
+import time
+import typing
+
+if typing.TYPE_CHECKING:
+    from importlib.machinery import ModuleSpec
+    from types import ModuleType
+    from typing import Callable, Sequence
+
+# Startup profiling : where the time goes between launching a script and the event loop running.
+# Records the duration of each module import (cumulative, and self : without the modules it imports itself),
+# and of the constructors and lazy initializations marked with @profiled (SDL, event loop, game model...).
+# Enabled by setting the NJOY_PROFILE_STARTUP environment variable, or by running a script through this module :
+#   python -m njoy.startup_profile examples/elite_dangerous.py
+# The report is printed on exit. When disabled (the default), @profiled costs a single test per call.
+#
+# Most of the startup is lazy : importing njoy doesn't import Qt nor SDL, SDL is initialized on first use
+# (see _SDL.init()), and the game model is built when first used (see Core.game_model).
+enabled = False
+
+__REPORT_SIZE__ = 25
+
+_lock = threading.Lock()
+# module name -> (cumulative ns, self ns)
+_imports: dict[str, tuple[int, int]] = dict()
+# stack of the time spent in the nested imports, one entry per import in progress
+_import_stack: list[int] = []
+# label -> durations in ns
+_spans: dict[str, list[int]] = dict()
+_start_ns = 0
+
+
+class _TimedLoader:
+    """Wraps the loader found by the other finders, to time the module creation and execution"""
+
+    def __init__(self, loader: importlib.abc.Loader):
+        self._loader = loader
+
+    def __getattr__(self, item):
+        return getattr(self._loader, item)
+
+    def create_module(self, spec: ModuleSpec) -> ModuleType | None:
+        return _timed_import(spec.name, self._loader.create_module, spec)
+
+    def exec_module(self, module: ModuleType):
+        _timed_import(module.__name__, self._loader.exec_module, module)
+
+
+def _timed_import(name: str, function: Callable, *args):
+    if threading.current_thread() is not threading.main_thread():
+        return function(*args)
+    _import_stack.append(0)
+    start = time.perf_counter_ns()
+    try:
+        return function(*args)
+    finally:
+        duration = time.perf_counter_ns() - start
+        nested = _import_stack.pop()
+        if _import_stack:
+            _import_stack[-1] += duration
+        with _lock:
+            cumulative, self_time = _imports.get(name, (0, 0))
+            _imports[name] = (cumulative + duration, self_time + duration - nested)
+
+
+class _TimingFinder(importlib.abc.MetaPathFinder):
+    """First finder on sys.meta_path, delegating to the others and wrapping the loader they return"""
+
+    def find_spec(self, fullname: str, path: Sequence[str] | None, target: ModuleType = None) -> ModuleSpec | None:
+        for finder in sys.meta_path:
+            if finder is self or not hasattr(finder, 'find_spec'):
+                continue
+            spec = finder.find_spec(fullname, path, target)
+            if spec is not None:
+                if spec.loader is not None and hasattr(spec.loader, 'exec_module'):
+                    spec.loader = _TimedLoader(spec.loader)
+                return spec
+        return None
+
+
+def enable():
+    """Starts recording the imports and the @profiled calls, and prints the report on exit. Idempotent."""
+    global enabled, _start_ns
+    if enabled:
+        return
+    enabled = True
+    _start_ns = time.perf_counter_ns()
+    sys.meta_path.insert(0, _TimingFinder())
+    atexit.register(lambda: print(format_report(), file=sys.stderr))
+
+
+def profiled(function: Callable) -> Callable:
+    """Records the duration of each call of the decorated function, when the profiling is enabled"""
+    label = function.__qualname__
+
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        if not enabled:
+            return function(*args, **kwargs)
+        start = time.perf_counter_ns()
+        try:
+            return function(*args, **kwargs)
+        finally:
+            duration = time.perf_counter_ns() - start
+            with _lock:
+                _spans.setdefault(label, []).append(duration)
+
+    return wrapper
+
+
+def report() -> dict[str, dict[str, dict[str, float]]]:
+    """Durations in ms : 'imports' by module, 'spans' by @profiled function (calls are summed)"""
+    with _lock:
+        imports = {name: {'cumulative': cumulative / 1e6, 'self': self_time / 1e6}
+                   for name, (cumulative, self_time) in _imports.items()}
+        spans = {label: {'calls': len(durations), 'total': sum(durations) / 1e6}
+                 for label, durations in _spans.items()}
+    return {'imports': imports, 'spans': spans}
+
+
+def format_report() -> str:
+    data = report()
+    imports, spans = data['imports'], data['spans']
+    elapsed = (time.perf_counter_ns() - _start_ns) / 1e6
+    lines = [f"Startup profile : {elapsed:.1f} ms since enabled, "
+             f"{sum(entry['self'] for entry in imports.values()):.1f} ms importing {len(imports)} modules"]
+    lines.append(f"{'module':<48} {'self ms':>9} {'cumul ms':>9}")
+    for name, entry in sorted(imports.items(), key=lambda item: item[1]['self'], reverse=True)[:__REPORT_SIZE__]:
+        lines.append(f"{name:<48} {entry['self']:>9.1f} {entry['cumulative']:>9.1f}")
+    if spans:
+        lines.append(f"{'initialization':<48} {'calls':>9} {'total ms':>9}")
+        for label, entry in sorted(spans.items(), key=lambda item: item[1]['total'], reverse=True):
+            lines.append(f"{label:<48} {entry['calls']:>9} {entry['total']:>9.1f}")
+    return '\n'.join(lines)
+
+
+def main(argv: list[str] = None) -> int:
+    parser = argparse.ArgumentParser(description="Run an n-joy script, and report where its startup time goes")
+    parser.add_argument('-m', dest='module', action='store_true', help="run a module instead of a script")
+    parser.add_argument('target', help="script path, or module name with -m")
+    parser.add_argument('arguments', nargs=argparse.REMAINDER)
+    args = parser.parse_args(argv)
+
+    enable()
+    sys.argv = [args.target, *args.arguments]
+    if args.module:
+        runpy.run_module(args.target, run_name='__main__', alter_sys=True)
+    else:
+        runpy.run_path(args.target, run_name='__main__')
+    return 0
+
+
+if __name__ == '__main__':
+    # Run by 'python -m' : this module is then '__main__', while the rest of njoy imports it as njoy.startup_profile
+    from njoy import startup_profile
+    sys.exit(startup_profile.main())
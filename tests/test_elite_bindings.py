@@ -0,0 +1,96 @@
+from __future__ import annotations  # PEP 563: Postponed evaluation of annotations
+
+import lxml.etree
+import shutil
+import types
+
+from njoy.game_models.elite_dangerous.elite_bindings import EliteBindings
+from njoy.hid_devices.vjoy_interface import vJoyId
+from pathlib import Path
+
+# The expected files were generated from elite_bindings.binds by the lxml.objectify implementation
+# of generate_bindings() (before the switch to plain lxml.etree) : the output must stay the same, byte for byte.
+# The fixture has CRLF and hand edited parts (spaces, blank lines, attributes over several lines, a comment),
+# bindings to other devices, nested vJoy modifiers, and a binding to an ignored vJoy device (DeviceIndex 5).
+__FIXTURES__ = Path(__file__).parent / 'fixtures'
+__IGNORED_OUTPUT_DEVICE_IDS__ = {vJoyId(3)}
+__ALLOCATED_PATHS__ = ('/ship/flight_rotation/yaw_axis_raw',
+                       '/ship/flight_rotation/pitch_axis_raw',
+                       '/general/camera_suite/photo_camera_toggle',
+                       '/general/galaxy_map/cam_translate_z_hold')
+
+
+class _FakeEventLoop:
+    """Hands out the axes of vJoy device #1, and the buttons of vJoy device #2, in order"""
+
+    def __init__(self):
+        self.nb_axes = 0
+        self.nb_buttons = 0
+
+    def next_virtual_output_axis(self, **kwargs):
+        self.nb_axes += 1
+        return types.SimpleNamespace(device=types.SimpleNamespace(vjoy_id=vJoyId(0)), axis_id=self.nb_axes - 1)
+
+    def next_virtual_output_button(self, **kwargs):
+        self.nb_buttons += 1
+        return types.SimpleNamespace(device=types.SimpleNamespace(vjoy_id=vJoyId(1)), button_id=self.nb_buttons - 1)
+
+
+def _elite_bindings(*paths: str) -> EliteBindings:
+    bindings = EliteBindings(elite_model=None,
+                             hid_event_loop=_FakeEventLoop(),
+                             metadata_cache=False,
+                             ignored_output_device_ids=__IGNORED_OUTPUT_DEVICE_IDS__)
+    for path in paths:
+        _ = bindings[path]
+    return bindings
+
+
+def _bindings_file(tmp_path: Path) -> Path:
+    bindings_file = tmp_path / 'njoy.4.0.binds'
+    shutil.copyfile(__FIXTURES__ / 'elite_bindings.binds', bindings_file)
+    return bindings_file
+
+
+def test_parse_and_cleanup_bindings():
+    root = _elite_bindings()._parse_and_cleanup_bindings((__FIXTURES__ / 'elite_bindings.binds').read_bytes())
+    content = lxml.etree.tostring(root.getroottree(), encoding='UTF-8', xml_declaration=True, pretty_print=True)
+    assert content == (__FIXTURES__ / 'elite_bindings.cleanup.binds').read_bytes()
+
+
+def test_generate_bindings_without_controls(tmp_path: Path):
+    bindings_file = _bindings_file(tmp_path)
+    assert _elite_bindings().generate_bindings(bindings_file)
+    assert bindings_file.read_bytes() == (__FIXTURES__ / 'elite_bindings.cleanup.binds').read_bytes()
+
+
+def test_generate_bindings(tmp_path: Path):
+    bindings_file = _bindings_file(tmp_path)
+    assert _elite_bindings(*__ALLOCATED_PATHS__).generate_bindings(bindings_file)
+    assert bindings_file.read_bytes() == (__FIXTURES__ / 'elite_bindings.generated.binds').read_bytes()
+
+
+def test_generate_bindings_unchanged(tmp_path: Path):
+    bindings_file = _bindings_file(tmp_path)
+    bindings = _elite_bindings(*__ALLOCATED_PATHS__)
+    assert bindings.generate_bindings(bindings_file)
+    modified = bindings_file.stat().st_mtime_ns
+
+    assert not bindings.generate_bindings(bindings_file)
+    assert bindings_file.stat().st_mtime_ns == modified
+    report = bindings.generation_report()
+    assert report['status'] == 'unchanged, skipped'
+    assert report['controls'] == len(__ALLOCATED_PATHS__)
+
+
+def test_glob_one_path_per_control():
+    bindings = _elite_bindings()
+    # flight_assist_off is an alternate name of toggle_flight_assist, silent_running of toggle_button_up_input
+    assert bindings.glob('/ship/flight_miscellaneous/*flight_assist*') == \
+           ['/ship/flight_miscellaneous/toggle_flight_assist']
+    assert bindings.glob('/ship/cooling/*') == ['/ship/cooling/deploy_heat_sink',
+                                                '/ship/cooling/toggle_button_up_input']
+    assert bindings.glob('/ship/cooling/silent_running') == ['/ship/cooling/toggle_button_up_input']
+    assert bindings.glob('/ship/flight_rotation/*_axis_raw') == ['/ship/flight_rotation/pitch_axis_raw',
+                                                                  '/ship/flight_rotation/roll_axis_raw',
+                                                                  '/ship/flight_rotation/yaw_axis_raw']
@@ -0,0 +1,85 @@
+from __future__ import annotations  # PEP 563: Postponed evaluation of annotations
+
+import fnmatch
+import pytest
+
+from njoy.core.path_trie import PathTrie
+
+__PATHS__ = ('/ship/flight_rotation/yaw_axis_raw',
+             '/ship/flight_rotation/pitch_axis_raw',
+             '/ship/flight_rotation/roll_axis_raw',
+             '/ship/flight_thrust/lateral_thrust_raw',
+             '/ship/flight_thrust/vertical_thrust_raw',
+             '/ship/cooling/deploy_heat_sink',
+             '/ship/cooling/silent_running',
+             '/ship/raw',
+             '/srv/driving/steering_axis',
+             '/general/camera_suite/photo_camera_toggle',
+             '/general/galaxy_map/cam_translate_z_hold',
+             '/on_foot/on_foot/humanoid_crouch_button')
+
+
+def _brute_force_glob(paths: tuple[str, ...], pattern: str) -> list[str]:
+    """Reference implementation : fnmatch on each segment, '**' tried against any number of segments"""
+
+    def match(segments: list[str], pattern_segments: list[str]) -> bool:
+        if not pattern_segments:
+            return not segments
+        if pattern_segments[0] == '**':
+            return any(match(segments[i:], pattern_segments[1:]) for i in range(len(segments) + 1))
+        return bool(segments) \
+            and fnmatch.fnmatchcase(segments[0], pattern_segments[0]) \
+            and match(segments[1:], pattern_segments[1:])
+
+    pattern_segments = [segment for segment in pattern.split('/') if segment]
+    return sorted(path for path in paths if match([segment for segment in path.split('/') if segment],
+                                                  pattern_segments))
+
+
+@pytest.mark.parametrize('pattern', ['/ship/flight_rotation/yaw_axis_raw',
+                                     '/ship/flight_rotation/nope',
+                                     '/ship/flight_*/*_raw',
+                                     '/*/*/*',
+                                     '**',
+                                     '**/*_raw',
+                                     '/**/raw',
+                                     '/ship/**/*_raw',
+                                     '/ship/**/flight_rotation/*',
+                                     '/ship/**',
+                                     '/**/cooling/**',
+                                     '/ship/flight_rotation/?aw_axis_raw',
+                                     '/ship/flight_rotation/[yp]*',
+                                     '/ship/flight_rotation/[!yp]*',
+                                     '/s??/*/*',
+                                     '/ship/flight_rotation/',
+                                     '/ship/flight_*//',
+                                     'ship/cooling/*'])
+def test_glob_matches_brute_force(pattern: str):
+    trie = PathTrie((path, index) for index, path in enumerate(__PATHS__))
+    assert trie.glob(pattern) == _brute_force_glob(__PATHS__, pattern)
+
+
+def test_glob_trailing_slash():
+    trie = PathTrie((path, None) for path in __PATHS__)
+    assert trie.glob('/ship/cooling/*/') == ['/ship/cooling/deploy_heat_sink', '/ship/cooling/silent_running']
+    assert trie.glob('/ship/cooling/') == []
+
+
+def test_setitem_after_glob():
+    trie = PathTrie((path, None) for path in __PATHS__)
+    assert trie.glob('/ship/cooling/*') == ['/ship/cooling/deploy_heat_sink', '/ship/cooling/silent_running']
+
+    trie['/ship/cooling/toggle_button_up_input'] = None
+    assert trie.glob('/ship/cooling/*') == ['/ship/cooling/deploy_heat_sink',
+                                            '/ship/cooling/silent_running',
+                                            '/ship/cooling/toggle_button_up_input']
+    assert '/ship/cooling/toggle_button_up_input' in trie
+    assert len(trie) == len(__PATHS__) + 1
+
+
+def test_mapping():
+    trie = PathTrie([('/a/b', 1), ('/a/c', 2)])
+    assert trie['/a/b'] == 1
+    assert trie.get('/a/d') is None
+    assert '/a' not in trie
+    assert dict(trie.items()) == {'/a/b': 1, '/a/c': 2}
@@ -0,0 +1,150 @@
+from __future__ import annotations  # PEP 563: Postponed evaluation of annotations
+
+import pytest
+
+from njoy.hid_devices.hid_device import _SlotBitmap, VirtualDevice
+from njoy.hid_devices.hid_event_loop import ControlKind, HIDEventLoop, control_key
+from njoy.hid_devices.output_backends import MemoryOutputBackend
+from PySide6.QtCore import QCoreApplication
+
+
+@pytest.fixture(scope='module')
+def application() -> QCoreApplication:
+    return QCoreApplication.instance() or QCoreApplication([])
+
+
+@pytest.fixture
+def hid_event_loop(application: QCoreApplication) -> HIDEventLoop:
+    """Headless virtual devices, forgotten by stop() : the next test starts with new ones"""
+    hid_event_loop = HIDEventLoop(output_backend=MemoryOutputBackend)
+    yield hid_event_loop
+    hid_event_loop.stop()
+    application.processEvents()
+
+
+def test_slot_bitmap_first_free():
+    slots = _SlotBitmap(8)
+    assert slots.first_free() == 0
+    for slot in (0, 1, 3):
+        slots.reserve(slot)
+    assert slots.first_free() == 2
+    assert slots.first_free(range(3, 8)) == 4
+    assert slots.first_free(range(0, 2)) is None
+    # Out of the device : ignored
+    assert slots.first_free(range(8, 16)) is None
+    assert slots.first_free(range(6, 100)) == 6
+
+
+def test_slot_bitmap_release():
+    slots = _SlotBitmap(4)
+    for slot in range(4):
+        slots.reserve(slot)
+    assert slots.first_free() is None
+    slots.release(2)
+    assert slots.first_free() == 2
+    assert slots.first_free(range(3, 4)) is None
+    slots.release(2)  # Releasing a free slot changes nothing
+    assert slots.first_free() == 2
+
+
+def test_slot_bitmap_is_full():
+    slots = _SlotBitmap(3)
+    assert not slots.is_full()
+    for slot in range(3):
+        assert not slots.is_full()
+        slots.reserve(slot)
+    assert slots.is_full()
+    slots.release(0)
+    assert not slots.is_full()
+
+
+def test_next_virtual_output_button_range(hid_event_loop: HIDEventLoop):
+    # The lowest free button of device #1 is out of the range, but some in the range are still free
+    hid_event_loop.virtual_button(0, 0, enable_output=True)
+    hid_event_loop.virtual_button(0, 2, enable_output=True)
+    button = hid_event_loop.next_virtual_output_button(button_range=range(2, 4))
+    assert (button.device.vjoy_id, button.button_id) == (0, 3)
+    button = hid_event_loop.next_virtual_output_button(button_range=range(2, 4))
+    assert (button.device.vjoy_id, button.button_id) == (1, 2)
+
+
+def test_axis_cursor_reset_on_release(hid_event_loop: HIDEventLoop):
+    axes = [hid_event_loop.next_virtual_output_axis() for _ in range(MemoryOutputBackend.nb_axes + 1)]
+    assert [axis.device.vjoy_id for axis in axes] == [0] * MemoryOutputBackend.nb_axes + [1]
+    assert VirtualDevice._first_free_axis_device == 1
+
+    device = axes[3].device
+    device.release_axis(3)
+    assert 3 not in device.axis
+    assert VirtualDevice._first_free_axis_device == 0
+    axis = hid_event_loop.next_virtual_output_axis()
+    assert (axis.device.vjoy_id, axis.axis_id) == (0, 3)
+    # Device #1 is only skipped again once a scan finds it full
+    axis = hid_event_loop.next_virtual_output_axis()
+    assert (axis.device.vjoy_id, axis.axis_id) == (1, 1)
+    assert VirtualDevice._first_free_axis_device == 1
+
+
+def test_button_cursor_reset_on_release(hid_event_loop: HIDEventLoop):
+    buttons = [hid_event_loop.next_virtual_output_button() for _ in range(MemoryOutputBackend.nb_buttons + 1)]
+    assert buttons[-1].device.vjoy_id == 1
+    assert VirtualDevice._first_free_button_device == 1
+
+    device = buttons[5].device
+    device.set_button(5, True)
+    device.release_button(5)
+    assert not device.output.button_state(5)
+    assert VirtualDevice._first_free_button_device == 0
+    button = hid_event_loop.next_virtual_output_button()
+    assert (button.device.vjoy_id, button.button_id) == (0, 5)
+
+
+def test_registrations_coalesced(hid_event_loop: HIDEventLoop, application: QCoreApplication):
+    first = hid_event_loop.next_virtual_output_button()
+    application.processEvents()
+    notifications = []
+    first.device.controls_changed.connect(lambda: notifications.append(None))
+
+    for _ in range(50):
+        hid_event_loop.next_virtual_output_button()
+    hid_event_loop.virtual_button(0, 1, enable_output=True)  # Already registered : nothing changes
+    assert notifications == []
+    application.processEvents()
+    assert len(notifications) == 1
+
+
+def test_release_drops_control_at_once(hid_event_loop: HIDEventLoop, application: QCoreApplication):
+    buttons = [hid_event_loop.next_virtual_output_button() for _ in range(4)]
+    for button in buttons:
+        button.switched_signal.connect(lambda _: None)
+    application.processEvents()
+    device = buttons[0].device
+    keys = [control_key(device.instance_id, ControlKind.BUTTON, button.button_id) for button in buttons]
+    assert all(key in hid_event_loop._dispatch_table for key in keys)
+    notifications = []
+    device.controls_changed.connect(lambda: notifications.append(None))
+
+    for button in buttons[:3]:
+        device.release_button(button.button_id)
+    assert not any(key in hid_event_loop._dispatch_table for key in keys[:3])
+    assert keys[3] in hid_event_loop._dispatch_table
+    assert notifications == []
+    application.processEvents()
+    assert len(notifications) == 1
+
+
+def test_stop_forgets_headless_devices(application: QCoreApplication):
+    hid_event_loop = HIDEventLoop(output_backend=MemoryOutputBackend)
+    device = hid_event_loop.next_virtual_output_axis().device
+    hid_event_loop.stop()
+    application.processEvents()
+    assert VirtualDevice._first_free_axis_device == 0
+
+    hid_event_loop = HIDEventLoop(output_backend=MemoryOutputBackend)
+    try:
+        axis = hid_event_loop.next_virtual_output_axis()
+        assert axis.device is not device
+        assert (axis.device.vjoy_id, axis.axis_id) == (0, 0)
+    finally:
+        hid_event_loop.stop()
+        application.processEvents()